@@ -16,6 +16,7 @@ class SystemConfig:
     VECTOR_DB_DIR: str = os.path.join(DATA_DIR, "vector_db")
     DOCUMENT_DIR: str = os.path.join(DATA_DIR, "documents")
     CACHE_DIR: str = os.path.join(DATA_DIR, "cache")
+    CATALOG_DIR: str = os.path.join(DATA_DIR, "catalog")
     
     # 智普AI配置
     ZHIPU_API_KEY: str = os.getenv("ZHIPU_API_KEY", "")
@@ -27,15 +28,113 @@ class SystemConfig:
         "E:/kuakkkk/ai/models--BAAI--bge-large-zh-v1.5/snapshots/0cc67d9f159c4037e86efde28c42dadf6e3de7aa"
     )
     EMBEDDING_MODEL_NAME: str = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-large-zh-v1.5")
+    EMBEDDING_MAX_TOKENS: int = int(os.getenv("EMBEDDING_MAX_TOKENS", "512"))  # 嵌入模型输入窗口（含特殊token）
+    # 嵌入推理后端：pytorch 使用SentenceTransformers/Transformers；onnx 使用ONNX Runtime（需先执行 onnx_embedder.py export）
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "pytorch")
+    ONNX_MODEL_DIR: str = os.getenv("ONNX_MODEL_DIR", os.path.join(DATA_DIR, "onnx"))
+    ONNX_QUANTIZE: bool = os.getenv("ONNX_QUANTIZE", "true").lower() == "true"  # 使用int8动态量化模型
+    ONNX_NUM_THREADS: int = int(os.getenv("ONNX_NUM_THREADS", "0"))  # 0 表示跟随 OMP_NUM_THREADS 或ONNX Runtime默认值
+    ONNX_POOLING: str = os.getenv("ONNX_POOLING", "auto")  # auto 跟随PyTorch后端（1_Pooling/config.json）；也可指定 mean / cls
+    ONNX_PARITY_THRESHOLD: float = float(os.getenv("ONNX_PARITY_THRESHOLD", "0.99"))  # 与PyTorch嵌入的最小余弦相似度
     LLM_MODEL: str = os.getenv("LLM_MODEL", "glm-4")
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))  # 未按次指定时的采样温度
     
     # 文档处理配置
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    # 分块长度单位：char 按字符；token 按嵌入模型分词器计数，块大小不超过模型窗口
+    CHUNK_LENGTH_UNIT: str = os.getenv("CHUNK_LENGTH_UNIT", "char")
+    # 分块策略：recursive 通用分隔符递归切分；sentence 按中英文句子边界；semantic 按相邻句子嵌入相似度
+    CHUNK_STRATEGY: str = os.getenv("CHUNK_STRATEGY", "recursive")
+    SEMANTIC_BREAKPOINT_PERCENTILE: float = float(os.getenv("SEMANTIC_BREAKPOINT_PERCENTILE", "20"))
+    TEXT_CACHE_ENABLED: bool = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"  # 缓存提取文本，重新分块无需重新解析
+    
+    # 入库去重：完全重复按归一化文本哈希，近似重复按MinHash+LSH（可选嵌入相似度复核）
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    # 近似重复去重默认关闭：只差一个数字的块（如不同版本的制度条款）也会被合并，只保留先入库的版本
+    DEDUP_NEAR_ENABLED: bool = os.getenv("DEDUP_NEAR_ENABLED", "false").lower() == "true"
+    DEDUP_JACCARD_THRESHOLD: float = float(os.getenv("DEDUP_JACCARD_THRESHOLD", "0.85"))  # 估计的Jaccard相似度下限
+    DEDUP_NUM_PERM: int = int(os.getenv("DEDUP_NUM_PERM", "64"))  # MinHash签名长度（修改后需重新入库）
+    DEDUP_BANDS: int = int(os.getenv("DEDUP_BANDS", "16"))  # LSH分段数，需整除 DEDUP_NUM_PERM
+    DEDUP_SHINGLE_SIZE: int = int(os.getenv("DEDUP_SHINGLE_SIZE", "5"))  # 字符n-gram长度
+    DEDUP_EMBEDDING_CHECK: bool = os.getenv("DEDUP_EMBEDDING_CHECK", "false").lower() == "true"  # 近似重复再用嵌入相似度复核
+    DEDUP_EMBEDDING_THRESHOLD: float = float(os.getenv("DEDUP_EMBEDDING_THRESHOLD", "0.95"))
+    
+    # PDF解析配置
+    PDF_BACKEND: str = os.getenv("PDF_BACKEND", "auto")  # auto / pypdfium2 / pypdf2
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "50"))  # 达到该页数才启用多进程解析
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "0"))  # 0 表示使用CPU核心数
+    
+    # 命名空间配置（每个租户/知识库对应一个独立集合）
+    DEFAULT_NAMESPACE: str = os.getenv("DEFAULT_NAMESPACE", "documents")
+    MAX_OPEN_COLLECTIONS: int = int(os.getenv("MAX_OPEN_COLLECTIONS", "8"))  # 同时保持打开的集合句柄数
+    
+    # 向量索引（HNSW）参数：只在新建集合时生效，修改后执行 rebuild-index 重建已有集合
+    HNSW_CONSTRUCTION_EF: int = int(os.getenv("HNSW_CONSTRUCTION_EF", "100"))
+    HNSW_SEARCH_EF: int = int(os.getenv("HNSW_SEARCH_EF", "10"))
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_NUM_THREADS: int = int(os.getenv("HNSW_NUM_THREADS", "0"))  # 0 表示使用CPU核心数
+    INDEX_WARMUP_ENABLED: bool = os.getenv("INDEX_WARMUP_ENABLED", "true").lower() == "true"  # 启动时预热索引
     
     # 检索配置
     TOP_K: int = int(os.getenv("TOP_K", "3"))
     SIMILARITY_THRESHOLD: float = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
+    # 检索截断：fixed 取 TOP_K 个结果并按 SIMILARITY_THRESHOLD 过滤；adaptive 按分数分布自适应决定保留数量
+    RETRIEVAL_CUTOFF: str = os.getenv("RETRIEVAL_CUTOFF", "adaptive")
+    CUTOFF_MIN_K: int = int(os.getenv("CUTOFF_MIN_K", "1"))  # 最高分不低于下限时至少保留的块数
+    # 候选数量上限，未设置时与 TOP_K 相同，切换截断模式不会让送入大模型的块数超出原有预期
+    CUTOFF_MAX_K: int = int(os.getenv("CUTOFF_MAX_K", os.getenv("TOP_K", "3")))
+    CUTOFF_SIMILARITY_FLOOR: float = float(os.getenv("CUTOFF_SIMILARITY_FLOOR", "0.3"))  # 相似度绝对下限
+    CUTOFF_RELATIVE: float = float(os.getenv("CUTOFF_RELATIVE", "0.8"))  # 相对最高分的保留比例
+    CUTOFF_MIN_GAP: float = float(os.getenv("CUTOFF_MIN_GAP", "0.05"))  # 相邻分数落差达到该值才视为拐点
+    # 查询改写：off 关闭；heuristic 本地规则；llm 调用大模型。多个查询批量嵌入后检索，按倒数排名融合
+    QUERY_REWRITE_MODE: str = os.getenv("QUERY_REWRITE_MODE", "off")
+    QUERY_REWRITE_COUNT: int = int(os.getenv("QUERY_REWRITE_COUNT", "3"))  # 原问题之外的改写数量
+    QUERY_TIME_BUDGET_MS: int = int(os.getenv("QUERY_TIME_BUDGET_MS", "10000"))  # 单次问答的目标总耗时
+    QUERY_REWRITE_BUDGET_SHARE: float = float(os.getenv("QUERY_REWRITE_BUDGET_SHARE", "0.2"))  # 改写最多占总耗时的比例
+    RRF_K: int = int(os.getenv("RRF_K", "60"))  # 倒数排名融合的平滑常数
+    # 嵌入进程池：查询和批量文档分走独立的进程通道，各自配置进程数和每进程推理线程数
+    EMBEDDING_POOL_ENABLED: bool = os.getenv("EMBEDDING_POOL_ENABLED", "false").lower() == "true"
+    EMBEDDING_QUERY_WORKERS: int = int(os.getenv("EMBEDDING_QUERY_WORKERS", "1"))
+    EMBEDDING_QUERY_THREADS: int = int(os.getenv("EMBEDDING_QUERY_THREADS", "2"))
+    EMBEDDING_BULK_WORKERS: int = int(os.getenv("EMBEDDING_BULK_WORKERS", "1"))
+    EMBEDDING_BULK_THREADS: int = int(os.getenv("EMBEDDING_BULK_THREADS", "0"))  # 0 表示使用查询通道之外的剩余核心
+    EMBEDDING_BULK_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BULK_BATCH_SIZE", "64"))  # 批量通道每个任务的文本数
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))  # 查询嵌入LRU缓存条数，0 关闭
+    
+    # 文档摘要：按顺序分组并发摘要后逐层合并（并发数不超过 MAX_CONCURRENT_REQUESTS）
+    SUMMARY_GROUP_CHARS: int = int(os.getenv("SUMMARY_GROUP_CHARS", "6000"))  # 每次摘要请求的最大输入字符数
+    SUMMARY_CACHE_ENABLED: bool = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true"  # 按文件内容缓存摘要
+    
+    # 多轮对话：较早的轮次压缩为滚动摘要，每轮发送给大模型的历史和上下文都有token上限
+    CONVERSATION_HISTORY_TOKENS: int = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "1000"))  # 摘要+最近轮次的token预算
+    CONVERSATION_RECENT_TURNS: int = int(os.getenv("CONVERSATION_RECENT_TURNS", "2"))  # 至少原文保留的最近轮数
+    CONVERSATION_CONTEXT_TOKENS: int = int(os.getenv("CONVERSATION_CONTEXT_TOKENS", "2000"))  # 每轮文档块上下文的token预算
+    CONVERSATION_REUSE_THRESHOLD: float = float(os.getenv("CONVERSATION_REUSE_THRESHOLD", "0.5"))  # 此前轮次的块与新问题的最低相似度
+    CONVERSATION_MAX_CARRIED: int = int(os.getenv("CONVERSATION_MAX_CARRIED", "8"))  # 跨轮保留的文档块数上限
+    
+    # 大模型响应缓存：off / read_write / record / replay（见 llm_cache.py）
+    LLM_CACHE_MODE: str = os.getenv("LLM_CACHE_MODE", "read_write")
+    LLM_CACHE_MAX_TEMPERATURE: float = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.1"))  # read_write 模式只缓存不高于此温度的请求
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+    LLM_CACHE_MAX_MB: float = float(os.getenv("LLM_CACHE_MAX_MB", "200"))
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", os.path.join(CACHE_DIR, "llm_responses.sqlite3"))
+    
+    # 索引快照导出/导入（见 index_snapshot.py）
+    SNAPSHOT_BATCH_SIZE: int = int(os.getenv("SNAPSHOT_BATCH_SIZE", "2000"))  # 每批读写的文档块数
+    
+    # 向量库模式：local 读写本地ChromaDB；replica 只读副本，从入库进程发布的快照检索（见 replica.py）；
+    # sharded 按来源把文档块分布到多个分片子进程，查询并行检索后归并（见 sharding.py）
+    VECTOR_DB_MODE: str = os.getenv("VECTOR_DB_MODE", "local").lower()
+    VECTOR_DB_SHARDS: int = int(os.getenv("VECTOR_DB_SHARDS", "4"))  # 分片数，已有数据后不能直接修改
+    REPLICA_SNAPSHOT_DIR: str = os.getenv("REPLICA_SNAPSHOT_DIR", os.path.join(DATA_DIR, "replica_snapshots"))
+    REPLICA_REFRESH_SECONDS: float = float(os.getenv("REPLICA_REFRESH_SECONDS", "10"))  # 副本检查新快照的间隔
+    REPLICA_KEEP_SNAPSHOTS: int = int(os.getenv("REPLICA_KEEP_SNAPSHOTS", "3"))  # 发布时保留的快照数（含当前）
+    
+    # 性能剖析：off 关闭；cprofile 确定性剖析；sample 采样剖析并输出折叠栈（见 profiler.py）
+    PROFILE_MODE: str = os.getenv("PROFILE_MODE", "off").lower()
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))  # 采样间隔
     
     # 性能配置
     MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", "5"))
@@ -53,6 +152,7 @@ class SystemConfig:
         os.makedirs(self.VECTOR_DB_DIR, exist_ok=True)
         os.makedirs(self.DOCUMENT_DIR, exist_ok=True)
         os.makedirs(self.CACHE_DIR, exist_ok=True)
+        os.makedirs(self.CATALOG_DIR, exist_ok=True)
     
     @classmethod
     def validate_config(cls) -> bool:
@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from config import system_config
+from token_counter import token_counter
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+_COMPRESS_PROMPT = """你是一个对话记录助手。请把新的对话轮次合并进已有的对话摘要，输出更新后的摘要。
+要求：保留用户关心的主题、已经确认的事实和结论，以及后续问题可能指代的对象；删除寒暄和重复内容；不超过{max_chars}字。"""
+
+class ConversationSession:
+    """多轮对话会话 - 最近几轮原文保留，较早的轮次压缩为滚动摘要
+
+    每轮发送给大模型的内容由三部分组成，各自有token上限：
+    对话摘要+最近轮次（CONVERSATION_HISTORY_TOKENS）、本轮文档块上下文（CONVERSATION_CONTEXT_TOKENS）和当前问题。
+    此前轮次用过的文档块会与新问题重新计算相似度，仍然相关时直接并入本轮上下文。
+    """
+    
+    def __init__(self, qa_engine, namespace: Optional[str] = None):
+        self.qa_engine = qa_engine
+        self.namespace = namespace
+        self.config = system_config
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.turn_count = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._carried: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    
+    def ask(self, question: str, top_k: int = None) -> Dict[str, Any]:
+        """在当前会话中提问，返回与单轮问答相同结构的结果，另含 reused_sources 和 history_tokens"""
+        try:
+            fresh = self.qa_engine.retrieve(question, top_k, self.namespace)
+            reused = self._reuse_carried(question, {result["id"] for result in fresh})
+            sources = self._fit_context(fresh + reused)
+            
+            if not sources and not self.turns:
+                return {
+                    "success": True,
+                    "answer": "抱歉，我没有找到相关的信息来回答这个问题。",
+                    "sources": [],
+                    "confidence": 0.0,
+                    "reused_sources": 0,
+                    "history_tokens": self.history_tokens()
+                }
+                
+            # 没有检索到新内容时仍可基于对话历史回答追问（如“再简短一些”）
+            context = self.qa_engine._build_context(sources) if sources else "（本轮没有检索到新的文档内容，请参考此前的对话）"
+            answer_data = self.qa_engine._generate_answer(question, context, self.history_messages())
+            answer_data["sources"] = sources
+            answer_data["confidence"] = max([source["similarity"] for source in sources], default=0.0)
+            answer_data["reused_sources"] = sum(1 for source in sources if source.get("reused"))
+            
+            if answer_data["success"]:
+                self._record(question, answer_data["answer"], sources)
+            answer_data["history_tokens"] = self.history_tokens()
+            self.last_result = answer_data
+            return answer_data
+            
+        except Exception as e:
+            error_msg = f"生成答案失败: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "success": False,
+                "answer": f"生成答案时出现错误: {error_msg}",
+                "sources": [],
+                "confidence": 0.0
+            }
+    
+    def history_messages(self) -> List[Dict[str, str]]:
+        """发送给大模型的对话历史：滚动摘要在前，最近轮次按原文排列"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"此前对话的摘要：\n{self.summary}"})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        return messages
+    
+    def history_tokens(self) -> int:
+        """对话历史的token数（使用嵌入模型分词器估算）"""
+        texts = [self.summary] + [text for turn in self.turns for text in (turn["question"], turn["answer"])]
+        return sum(token_counter.count_batch(texts))
+    
+    def reset(self) -> None:
+        """清空对话历史和跨轮保留的文档块"""
+        self.summary = ""
+        self.turns = []
+        self.turn_count = 0
+        self.last_result = None
+        self._carried.clear()
+    
+    def _reuse_carried(self, question: str, exclude: set) -> List[Dict[str, Any]]:
+        """此前轮次的文档块中与新问题仍然相关的部分（按存储的向量计算相似度，不重新嵌入）"""
+        candidates = [chunk_id for chunk_id in self._carried if chunk_id not in exclude]
+        if not candidates:
+            return []
+            
+        scores = self.qa_engine.vector_db.score_chunks(question, candidates, namespace=self.namespace)
+        reused = [
+            {**self._carried[chunk_id], "similarity": score, "reused": True}
+            for chunk_id, score in scores.items()
+            if score >= self.config.CONVERSATION_REUSE_THRESHOLD
+        ]
+        return sorted(reused, key=lambda chunk: chunk["similarity"], reverse=True)
+    
+    def _fit_context(self, sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按相似度从高到低装入上下文，总token数不超过预算（至少保留一个文档块）"""
+        ranked = sorted(sources, key=lambda source: source["similarity"], reverse=True)
+        counts = token_counter.count_batch([source["content"] for source in ranked])
+        budget = self.config.CONVERSATION_CONTEXT_TOKENS
+        
+        fitted, used = [], 0
+        for source, count in zip(ranked, counts):
+            if fitted and used + count > budget:
+                continue
+            fitted.append({**source, "rank": len(fitted) + 1})
+            used += count
+        return fitted
+    
+    def _record(self, question: str, answer: str, sources: List[Dict[str, Any]]) -> None:
+        """记录本轮对话和用到的文档块，超出预算时压缩较早的轮次"""
+        self.turns.append({"question": question, "answer": answer})
+        self.turn_count += 1
+        
+        for source in sources:
+            self._carried[source["id"]] = {key: source[key] for key in ("id", "content", "metadata")}
+            self._carried.move_to_end(source["id"])
+        while len(self._carried) > self.config.CONVERSATION_MAX_CARRIED:
+            self._carried.popitem(last=False)
+            
+        self._compress()
+    
+    def _compress(self) -> None:
+        """历史超出预算时，把较早的轮次并入摘要；最近的轮次本身过长时减少原文保留的轮数"""
+        budget = self.config.CONVERSATION_HISTORY_TOKENS
+        if self.history_tokens() <= budget:
+            return
+            
+        keep = min(len(self.turns), max(1, self.config.CONVERSATION_RECENT_TURNS))
+        turn_tokens = [sum(token_counter.count_batch([turn["question"], turn["answer"]])) for turn in self.turns]
+        # 摘要最多占一半预算，剩余一半留给原文保留的最近轮次
+        while keep > 1 and sum(turn_tokens[-keep:]) > budget // 2:
+            keep -= 1
+        if keep >= len(self.turns):
+            return
+            
+        folded, self.turns = self.turns[:-keep], self.turns[-keep:]
+        self.summary = self._summarize(folded, max_tokens=budget // 2)
+        logger.debug(f"对话压缩: {len(folded)} 轮并入摘要，保留 {keep} 轮原文，历史 {self.history_tokens()} tokens")
+    
+    def _summarize(self, turns: List[Dict[str, str]], max_tokens: int) -> str:
+        """调用大模型更新滚动摘要；失败时退化为只保留问题列表"""
+        from zhipu_service import zhipu_service
+        
+        dialogue = "\n".join(f"用户：{turn['question']}\n助手：{turn['answer']}" for turn in turns)
+        messages = [
+            {"role": "system", "content": _COMPRESS_PROMPT.format(max_chars=max_tokens)},
+            {"role": "user", "content": f"已有摘要：\n{self.summary or '（无）'}\n\n新的对话轮次：\n{dialogue}"}
+        ]
+        response = zhipu_service.chat_completion(messages)
+        if response["success"]:
+            summary = response["content"].strip()
+        else:
+            logger.warning(f"压缩对话历史失败，仅保留问题列表: {response.get('error', '')}")
+            summary = "\n".join(filter(None, [self.summary] + [f"用户曾问：{turn['question']}" for turn in turns]))
+        return self._truncate(summary, max_tokens)
+    
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        """超出token上限时按比例截去开头（保留较新的内容）"""
+        count = token_counter.count(text)
+        if count <= max_tokens:
+            return text
+        return text[len(text) - int(len(text) * max_tokens / count):]
@@ -0,0 +1,192 @@
+import re
+import zlib
+import hashlib
+import unicodedata
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# MinHash 使用的梅森素数，哈希值和系数都小于它，乘积不会溢出uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+_NON_WORD = re.compile(r'[\W_]+')
+
+def normalize_text(text: str) -> str:
+    """归一化文本：全半角统一、小写，连续空白合并为一个空格；保留标点、数字和分隔符（1.5 与 15 不同）"""
+    return ' '.join(unicodedata.normalize('NFKC', text).lower().split())
+
+def content_hash(text: str) -> str:
+    """归一化文本的SHA-1，用于判断完全重复"""
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+def _permutations(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    """固定种子的哈希置换系数，持久化的签名在不同进程之间可比"""
+    rng = np.random.default_rng(1)
+    a = rng.integers(1, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.uint64)
+    return a, b
+
+def minhash_signature(text: str, num_perm: int = None, shingle_size: int = None) -> np.ndarray:
+    """按字符n-gram计算MinHash签名，返回长度为 num_perm 的uint32数组"""
+    num_perm = num_perm or system_config.DEDUP_NUM_PERM
+    shingle_size = shingle_size or system_config.DEDUP_SHINGLE_SIZE
+    # 近似重复只比较文字本身，去掉空白和标点
+    normalized = _NON_WORD.sub('', normalize_text(text))
+    shingles = {normalized[i:i + shingle_size] for i in range(max(1, len(normalized) - shingle_size + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles)) % _MERSENNE_PRIME
+    a, b = _permutations(num_perm)
+    return ((a * hashes + b) % _MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+def band_keys(signature: np.ndarray, bands: int = None) -> List[str]:
+    """LSH分段键：任一段完全相同的两个签名成为候选对"""
+    bands = bands or system_config.DEDUP_BANDS
+    rows = len(signature) // bands
+    return [
+        f"{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(bands)
+    ]
+
+def estimate_jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    """由两个MinHash签名估计Jaccard相似度"""
+    return float(np.count_nonzero(first == second)) / len(first)
+
+class ChunkDeduplicator:
+    """入库去重 - 在分块与写入向量库之间识别完全重复和近似重复的文档块
+
+    完全重复按归一化文本哈希判断；启用近似重复去重（DEDUP_NEAR_ENABLED）时，先用MinHash+LSH从文档目录中找候选，
+    再按签名估计的Jaccard相似度（DEDUP_JACCARD_THRESHOLD）确认，可选再用嵌入相似度复核。
+    无论是否启用，新块的MinHash指纹都会写入目录，之后开启近似重复去重时无需补算。
+    重复块不再写入向量库，只在文档目录中记录该文档对已有块的引用。
+    """
+    
+    def __init__(self, vector_db_manager):
+        self.vector_db = vector_db_manager
+        self.config = system_config
+        self._backfilled = set()
+    
+    def deduplicate(self, chunks: List[Dict[str, Any]], source: str, catalog,
+                    namespace: Optional[str] = None) -> Dict[str, Any]:
+        """返回 {"unique": 需要写入的块, "refs": {重复块ID: 已有块ID}, "fingerprints": 新块的指纹行}
+
+        只与其他文档的块以及本批次中更早的块比较；同一文档重新入库时不会与自己的旧版本去重。
+        """
+        self._ensure_fingerprints(catalog, namespace)
+        hashes = [content_hash(chunk["content"]) for chunk in chunks]
+        signatures = [minhash_signature(chunk["content"]) for chunk in chunks]
+        keys = [band_keys(signature) for signature in signatures]
+        
+        existing_hashes = catalog.find_content_hashes(set(hashes), exclude_source=source)
+        band_matches = {}
+        if self.config.DEDUP_NEAR_ENABLED:
+            band_matches = catalog.find_band_matches({key for chunk_keys in keys for key in chunk_keys}, exclude_source=source)
+        candidate_ids = {chunk_id for ids in band_matches.values() for chunk_id in ids}
+        existing_signatures = {
+            chunk_id: np.frombuffer(blob, dtype=np.uint32)
+            for chunk_id, blob in catalog.get_signatures(list(candidate_ids)).items()
+        }
+        
+        unique, refs, near = [], {}, []
+        batch_hashes: Dict[str, str] = {}
+        batch_bands: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            canonical = existing_hashes.get(hashes[i]) or batch_hashes.get(hashes[i])
+            if canonical is not None:
+                refs[chunk["id"]] = canonical
+                continue
+        
+            match = None
+            if self.config.DEDUP_NEAR_ENABLED:
+                match = self._best_match(signatures[i], keys[i], band_matches, existing_signatures, batch_bands, signatures)
+            if match is not None:
+                near.append((i, match))
+                continue
+        
+            batch_hashes[hashes[i]] = chunk["id"]
+            for key in keys[i]:
+                batch_bands.setdefault(key, []).append(i)
+            unique.append(i)
+            
+        if near and self.config.DEDUP_EMBEDDING_CHECK:
+            rejected = self._embedding_rejects(chunks, near, namespace)
+            unique = sorted(unique + [i for i, _ in near if i in rejected])
+            near = [(i, match) for i, match in near if i not in rejected]
+        for i, match in near:
+            # 本批次内的候选以块下标表示
+            refs[chunks[i]["id"]] = chunks[match]["id"] if isinstance(match, int) else match
+            
+        if refs:
+            logger.info(f"入库去重: {source} 的 {len(chunks)} 个文档块中 {len(refs)} 个与已有内容重复"
+                        f"（近似重复 {len(near)} 个）")
+        return {
+            "unique": [chunks[i] for i in unique],
+            "refs": refs,
+            "fingerprints": [(chunks[i]["id"], hashes[i], signatures[i], keys[i]) for i in unique]
+        }
+    
+    def _best_match(self, signature: np.ndarray, keys: List[str], band_matches: Dict[str, List[str]],
+                    existing_signatures: Dict[str, np.ndarray], batch_bands: Dict[str, List[int]],
+                    batch_signatures: List[np.ndarray]) -> Optional[Union[str, int]]:
+        """在LSH候选中找Jaccard相似度最高且不低于阈值的块：已有块返回块ID，本批次更早的块返回下标"""
+        threshold = self.config.DEDUP_JACCARD_THRESHOLD
+        best_id, best_score = None, threshold
+        for key in keys:
+            for chunk_id in band_matches.get(key, ()):
+                candidate = existing_signatures.get(chunk_id)
+                if candidate is not None and len(candidate) == len(signature):
+                    score = estimate_jaccard(signature, candidate)
+                    if score >= best_score:
+                        best_id, best_score = chunk_id, score
+            for index in batch_bands.get(key, ()):
+                score = estimate_jaccard(signature, batch_signatures[index])
+                if score >= best_score:
+                    best_id, best_score = index, score
+        return best_id
+    
+    def _embedding_rejects(self, chunks: List[Dict[str, Any]], near: List[Tuple[int, Any]],
+                           namespace: Optional[str]) -> set:
+        """用嵌入相似度复核近似重复，返回未通过复核（应当保留）的块下标"""
+        from zhipu_service import zhipu_service
+        
+        batch_targets = sorted({match for _, match in near if isinstance(match, int)})
+        texts = [chunks[i]["content"] for i, _ in near] + [chunks[i]["content"] for i in batch_targets]
+        vectors = np.asarray(zhipu_service.embed(texts, lane="bulk"), dtype=np.float32)
+        new_vectors = dict(zip([i for i, _ in near], vectors[:len(near)]))
+        targets = dict(zip(batch_targets, vectors[len(near):]))
+        targets.update(self.vector_db.get_embeddings([match for _, match in near if isinstance(match, str)],
+                                                     namespace=namespace))
+        
+        rejected = set()
+        for i, match in near:
+            target = targets.get(match)
+            if target is None:
+                rejected.add(i)
+                continue
+            cosine = float(new_vectors[i] @ target) / max(float(np.linalg.norm(new_vectors[i]) * np.linalg.norm(target)), 1e-12)
+            if cosine < self.config.DEDUP_EMBEDDING_THRESHOLD:
+                rejected.add(i)
+        return rejected
+    
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """命名空间的文档目录被整体替换后调用，下次去重时重新检查缺失的指纹"""
+        self._backfilled.discard(namespace or self.config.DEFAULT_NAMESPACE)
+    
+    def _ensure_fingerprints(self, catalog, namespace: Optional[str]) -> None:
+        """为启用去重之前入库的块补算指纹（每个命名空间每个进程只检查一次）"""
+        name = namespace or self.config.DEFAULT_NAMESPACE
+        if name in self._backfilled:
+            return
+            
+        missing = catalog.chunks_without_fingerprints()
+        for start in range(0, len(missing), 1000):
+            rows = [
+                (chunk["id"], content_hash(chunk["content"]), signature, band_keys(signature))
+                for chunk in self.vector_db.get_chunks_by_ids(missing[start:start + 1000], namespace=namespace)
+                for signature in [minhash_signature(chunk["content"])]
+            ]
+            catalog.add_fingerprints(rows)
+        if missing:
+            logger.info(f"已为命名空间 {name} 的 {len(missing)} 个已有文档块补算去重指纹")
+        self._backfilled.add(name)
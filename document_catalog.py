@@ -0,0 +1,427 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 去重指纹的格式版本（记录在 PRAGMA user_version 中）；归一化规则变化后旧指纹作废，由去重模块按需补算
+# 版本2：完全重复哈希保留标点和数字（旧版本去掉了标点，1.5 与 15 会被误判为重复）
+FINGERPRINT_VERSION = 2
+
+def _batches(values: List[Any], size: int = 500) -> Iterable[List[Any]]:
+    """把IN查询的参数分批，避免超出SQLite的参数个数上限"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+class DocumentCatalog:
+    """文档目录 - 以SQLite持久化每个文档的块数、大小、哈希和入库时间"""
+    
+    def __init__(self, db_path: str = None, namespace: str = None, read_only: bool = False):
+        self.config = system_config
+        # 每个命名空间一个目录库文件
+        self.namespace = namespace or self.config.DEFAULT_NAMESPACE
+        self.db_path = db_path or os.path.join(self.config.CATALOG_DIR, f"{self.namespace}.sqlite3")
+        # 只读目录用于已发布的快照：文件不再变化，以 immutable 方式打开，不加锁
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._conn = None
+    
+    def _connection(self) -> sqlite3.Connection:
+        """获取数据库连接（首次使用时建表）"""
+        if self._conn is None and self.read_only:
+            self._conn = sqlite3.connect(f"file:{self.db_path}?immutable=1", uri=True, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            # 手动管理事务；Streamlit会在不同线程中调用，统一由锁串行化
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    source TEXT PRIMARY KEY,
+                    file_path TEXT,
+                    file_type TEXT,
+                    file_hash TEXT,
+                    size_bytes INTEGER DEFAULT 0,
+                    chunk_count INTEGER DEFAULT 0,
+                    ingested_at REAL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+            # 入库去重：文档对其他文档（或自身更早的块）中重复内容的引用，以及每个已存储块的指纹
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_refs (
+                    source TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (source, chunk_id)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_refs_chunk ON chunk_refs(chunk_id)")
+            # 文档每个位置的块实际存储在哪个块ID下（自身的块或引用的重复块），按原文顺序读取整篇文档时使用
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_order (
+                    source TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (source, position)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_order_chunk ON chunk_order(chunk_id)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+                    chunk_id TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    signature BLOB NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON chunk_fingerprints(content_hash)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_bands (
+                    band_key TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_key ON chunk_bands(band_key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_chunk ON chunk_bands(chunk_id)")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < FINGERPRINT_VERSION:
+                self._conn.execute("DELETE FROM chunk_fingerprints")
+                self._conn.execute("DELETE FROM chunk_bands")
+                self._conn.execute(f"PRAGMA user_version = {FINGERPRINT_VERSION}")
+        return self._conn
+    
+    @contextmanager
+    def transaction(self):
+        """事务上下文：块内抛出异常时回滚"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def upsert_document(self, record: Dict[str, Any], chunk_ids: List[str] = None) -> None:
+        """新增或替换文档记录及其块ID映射"""
+        with self._lock:
+            self._connection().execute("""
+                INSERT INTO documents (source, file_path, file_type, file_hash, size_bytes, chunk_count, ingested_at)
+                VALUES (:source, :file_path, :file_type, :file_hash, :size_bytes, :chunk_count, :ingested_at)
+                ON CONFLICT(source) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    file_type = excluded.file_type,
+                    file_hash = excluded.file_hash,
+                    size_bytes = excluded.size_bytes,
+                    chunk_count = excluded.chunk_count,
+                    ingested_at = excluded.ingested_at
+            """, {
+                "source": record["source"],
+                "file_path": record.get("file_path", ""),
+                "file_type": record.get("file_type", ""),
+                "file_hash": record.get("file_hash", ""),
+                "size_bytes": record.get("size_bytes", 0),
+                "chunk_count": record.get("chunk_count", 0),
+                "ingested_at": record.get("ingested_at", time.time())
+            })
+            if chunk_ids is not None:
+                self._connection().execute("DELETE FROM chunks WHERE source = ?", (record["source"],))
+                self._connection().executemany(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, source) VALUES (?, ?)",
+                    [(chunk_id, record["source"]) for chunk_id in chunk_ids]
+                )
+    
+    def get_chunk_ids(self, source: str) -> List[str]:
+        """获取文档的所有块ID"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT chunk_id FROM chunks WHERE source = ?", (source,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def remove_document(self, source: str) -> None:
+        """删除文档记录及其块ID映射和引用（块指纹由调用方随向量一起删除）"""
+        with self._lock:
+            self._connection().execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._connection().execute("DELETE FROM chunk_refs WHERE source = ?", (source,))
+            self._connection().execute("DELETE FROM chunk_order WHERE source = ?", (source,))
+            self._connection().execute("DELETE FROM documents WHERE source = ?", (source,))
+    
+    def get_ref_ids(self, source: str) -> List[str]:
+        """文档引用的重复块ID（这些块由其他文档或自身更早的块存储）"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT chunk_id FROM chunk_refs WHERE source = ?", (source,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def set_refs(self, source: str, chunk_ids: List[str]) -> None:
+        """替换文档的重复块引用"""
+        with self._lock:
+            self._connection().execute("DELETE FROM chunk_refs WHERE source = ?", (source,))
+            self._connection().executemany(
+                "INSERT OR IGNORE INTO chunk_refs (source, chunk_id) VALUES (?, ?)",
+                [(source, chunk_id) for chunk_id in chunk_ids]
+            )
+    
+    def get_chunk_order(self, source: str) -> List[str]:
+        """按原文顺序排列的文档块ID（重复块为其引用的块ID）；旧版本入库的文档没有记录时返回空列表"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT chunk_id FROM chunk_order WHERE source = ? ORDER BY position", (source,)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def set_chunk_order(self, source: str, chunk_ids: List[str]) -> None:
+        """替换文档各位置对应的块ID"""
+        with self._lock:
+            self._connection().execute("DELETE FROM chunk_order WHERE source = ?", (source,))
+            self._connection().executemany(
+                "INSERT INTO chunk_order (source, position, chunk_id) VALUES (?, ?, ?)",
+                [(source, position, chunk_id) for position, chunk_id in enumerate(chunk_ids)]
+            )
+    
+    def redirect_refs(self, id_map: Dict[str, str], exclude_source: str = None) -> None:
+        """把其他文档对旧块的引用改指向内容相同的新块 {旧块ID: 新块ID}"""
+        with self._lock:
+            conn = self._connection()
+            for old_id, new_id in id_map.items():
+                conn.execute("UPDATE OR IGNORE chunk_refs SET chunk_id = ? WHERE chunk_id = ?", (new_id, old_id))
+                conn.execute("DELETE FROM chunk_refs WHERE chunk_id = ?", (old_id,))
+                conn.execute("UPDATE chunk_order SET chunk_id = ? WHERE chunk_id = ? AND source != ?",
+                             (new_id, old_id, exclude_source or ""))
+    
+    def sources_for_chunks(self, chunk_ids: List[str]) -> Dict[str, List[str]]:
+        """每个块的全部来源：存储它的文档在前，其后是引用它的其他文档"""
+        sources = {}
+        with self._lock:
+            for batch in _batches(chunk_ids):
+                marks = ",".join("?" * len(batch))
+                for row in self._connection().execute(f"""
+                    SELECT chunk_id, source, 0 AS ord FROM chunks WHERE chunk_id IN ({marks})
+                    UNION ALL
+                    SELECT chunk_id, source, 1 AS ord FROM chunk_refs WHERE chunk_id IN ({marks})
+                    ORDER BY ord, source
+                """, batch + batch):
+                    if row["source"] not in sources.setdefault(row["chunk_id"], []):
+                        sources[row["chunk_id"]].append(row["source"])
+        return sources
+    
+    def hand_over_chunks(self, source: str, chunk_ids: List[str]) -> Dict[str, Tuple[str, str]]:
+        """文档的块即将被删除或覆盖时，把仍被其他文档引用的块转交给其中一个文档
+
+        转交的块使用新ID（原ID加新所有者的哈希后缀），其余引用改指向新ID。
+        返回 {原块ID: (新块ID, 新所有者)}，调用方据此在向量库中复制对应的向量。
+        """
+        moves = {}
+        with self._lock:
+            conn = self._connection()
+            for chunk_id in chunk_ids:
+                referrers = [row[0] for row in conn.execute(
+                    "SELECT source FROM chunk_refs WHERE chunk_id = ? AND source != ? ORDER BY source",
+                    (chunk_id, source)
+                ).fetchall()]
+                if not referrers:
+                    continue
+                    
+                owner = referrers[0]
+                new_id = f"{chunk_id}-{hashlib.sha1(owner.encode('utf-8')).hexdigest()[:8]}"
+                conn.execute("INSERT OR REPLACE INTO chunks (chunk_id, source) VALUES (?, ?)", (new_id, owner))
+                conn.execute("DELETE FROM chunk_refs WHERE chunk_id = ? AND source IN (?, ?)", (chunk_id, owner, source))
+                conn.execute("UPDATE OR IGNORE chunk_refs SET chunk_id = ? WHERE chunk_id = ?", (new_id, chunk_id))
+                conn.execute("UPDATE chunk_order SET chunk_id = ? WHERE chunk_id = ? AND source != ?", (new_id, chunk_id, source))
+                conn.execute("""
+                    INSERT OR REPLACE INTO chunk_fingerprints (chunk_id, content_hash, signature)
+                    SELECT ?, content_hash, signature FROM chunk_fingerprints WHERE chunk_id = ?
+                """, (new_id, chunk_id))
+                conn.execute("""
+                    INSERT INTO chunk_bands (band_key, chunk_id)
+                    SELECT band_key, ? FROM chunk_bands WHERE chunk_id = ?
+                """, (new_id, chunk_id))
+                moves[chunk_id] = (new_id, owner)
+        return moves
+    
+    def add_fingerprints(self, rows: Iterable[Tuple[str, str, Any, List[str]]]) -> None:
+        """写入块指纹：(块ID, 内容哈希, MinHash签名数组, LSH分段键列表)"""
+        rows = list(rows)
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_fingerprints (chunk_id, content_hash, signature) VALUES (?, ?, ?)",
+                [(chunk_id, content_hash, signature.astype('<u4').tobytes()) for chunk_id, content_hash, signature, _ in rows]
+            )
+            conn.executemany("DELETE FROM chunk_bands WHERE chunk_id = ?", [(row[0],) for row in rows])
+            conn.executemany(
+                "INSERT INTO chunk_bands (band_key, chunk_id) VALUES (?, ?)",
+                [(key, chunk_id) for chunk_id, _, _, keys in rows for key in keys]
+            )
+    
+    def remove_fingerprints(self, chunk_ids: List[str]) -> None:
+        """删除块指纹"""
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("DELETE FROM chunk_fingerprints WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+            conn.executemany("DELETE FROM chunk_bands WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+    
+    def get_content_hashes(self, chunk_ids: List[str]) -> Dict[str, str]:
+        """块ID到内容哈希"""
+        hashes = {}
+        with self._lock:
+            for batch in _batches(chunk_ids):
+                rows = self._connection().execute(
+                    f"SELECT chunk_id, content_hash FROM chunk_fingerprints WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                hashes.update((row[0], row[1]) for row in rows)
+        return hashes
+    
+    def find_content_hashes(self, content_hashes: Iterable[str], exclude_source: str = None) -> Dict[str, str]:
+        """按内容哈希查找其他文档已存储的块，返回 {内容哈希: 块ID}"""
+        found = {}
+        with self._lock:
+            for batch in _batches(list(content_hashes)):
+                rows = self._connection().execute(f"""
+                    SELECT f.content_hash, f.chunk_id FROM chunk_fingerprints f
+                    JOIN chunks c ON c.chunk_id = f.chunk_id
+                    WHERE c.source != ? AND f.content_hash IN ({','.join('?' * len(batch))})
+                """, [exclude_source or ""] + batch).fetchall()
+                for row in rows:
+                    found.setdefault(row[0], row[1])
+        return found
+    
+    def find_band_matches(self, keys: Iterable[str], exclude_source: str = None) -> Dict[str, List[str]]:
+        """按LSH分段键查找其他文档已存储的候选块，返回 {分段键: [块ID]}"""
+        matches = {}
+        with self._lock:
+            for batch in _batches(list(keys)):
+                rows = self._connection().execute(f"""
+                    SELECT b.band_key, b.chunk_id FROM chunk_bands b
+                    JOIN chunks c ON c.chunk_id = b.chunk_id
+                    WHERE c.source != ? AND b.band_key IN ({','.join('?' * len(batch))})
+                """, [exclude_source or ""] + batch).fetchall()
+                for row in rows:
+                    matches.setdefault(row[0], []).append(row[1])
+        return matches
+    
+    def get_signatures(self, chunk_ids: List[str]) -> Dict[str, bytes]:
+        """块ID到MinHash签名（原始字节）"""
+        signatures = {}
+        with self._lock:
+            for batch in _batches(chunk_ids):
+                rows = self._connection().execute(
+                    f"SELECT chunk_id, signature FROM chunk_fingerprints WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                signatures.update((row[0], row[1]) for row in rows)
+        return signatures
+    
+    def chunks_without_fingerprints(self) -> List[str]:
+        """尚未计算指纹的已存储块（启用去重之前入库的文档）"""
+        with self._lock:
+            rows = self._connection().execute("""
+                SELECT c.chunk_id FROM chunks c
+                LEFT JOIN chunk_fingerprints f ON f.chunk_id = c.chunk_id
+                WHERE f.chunk_id IS NULL
+            """).fetchall()
+        return [row[0] for row in rows]
+    
+    def get_document(self, source: str) -> Optional[Dict[str, Any]]:
+        """获取单个文档记录"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT * FROM documents WHERE source = ?", (source,)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """按入库时间倒序列出所有文档"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT * FROM documents ORDER BY ingested_at DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def count(self) -> int:
+        """文档数量"""
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def total_chunks(self) -> int:
+        """文档块总数"""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COALESCE(SUM(chunk_count), 0) FROM documents"
+            ).fetchone()[0]
+    
+    def clear(self) -> None:
+        """清空目录"""
+        with self._lock:
+            for table in ("chunks", "chunk_refs", "chunk_order", "chunk_fingerprints", "chunk_bands", "documents"):
+                self._connection().execute(f"DELETE FROM {table}")
+    
+    def backup_to(self, path: str) -> None:
+        """把目录库完整复制到 path（SQLite在线备份，期间可继续读取）"""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._connection().backup(target)
+            finally:
+                target.close()
+    
+    def restore_from(self, path: str) -> None:
+        """用 path 处的目录库整体替换当前目录"""
+        with self._lock:
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                source.backup(self._connection())
+            finally:
+                source.close()
+            # 旧版本导出的目录库可能缺少新表，重新连接时补建
+            self._conn.close()
+            self._conn = None
+            self._connection()
+    
+    def rebuild(self, chunks: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """根据向量库中的块ID和元数据重建目录（用于已有索引的一次性迁移）"""
+        documents = {}
+        chunk_ids = {}
+        for chunk_id, metadata in chunks:
+            source = (metadata or {}).get("source")
+            if not source:
+                continue
+            chunk_ids.setdefault(source, []).append(chunk_id)
+            record = documents.setdefault(source, {
+                "source": source,
+                "file_path": metadata.get("file_path", ""),
+                "file_type": metadata.get("file_type", ""),
+                "file_hash": metadata.get("file_hash", ""),
+                "size_bytes": metadata.get("size_bytes", 0),
+                "chunk_count": 0,
+                "ingested_at": time.time()
+            })
+            record["chunk_count"] += 1
+            
+        with self.transaction():
+            self.clear()
+            for source, record in documents.items():
+                self.upsert_document(record, chunk_ids[source])
+                
+        logger.info(f"文档目录已重建: {len(documents)} 个文档")
+        return len(documents)
@@ -1,44 +1,265 @@
 import os
+import re
 import time
-import PyPDF2
-from docx import Document
-import markdown
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import hashlib
+import importlib.util
+from typing import List, Dict, Any, Iterator, Optional, TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
 from config import system_config
+from text_cache import ExtractedTextCache
+from token_counter import token_counter
+from sentence_splitter import SentenceTextSplitter, SemanticTextSplitter
 from logger import get_logger
 
+if TYPE_CHECKING:
+    from docx.table import Table
+
+# PDF、Word解析库和langchain分块器在首次使用时导入；pypdfium2为可选依赖，这里只检查是否已安装
+_PYPDFIUM2_AVAILABLE = importlib.util.find_spec("pypdfium2") is not None
+
 logger = get_logger(__name__)
 
+# 加载器版本，修改文本提取逻辑后需递增以使文本缓存失效
+LOADER_VERSION = 2
+
+# Markdown解析用正则（模块级预编译）
+_MD_FENCE = re.compile(r'^\s*(```|~~~)')
+_MD_ATX_HEADING = re.compile(r'^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$')
+_MD_SETEXT_UNDERLINE = re.compile(r'^\s{0,3}(=+|-+)\s*$')
+_MD_HORIZONTAL_RULE = re.compile(r'^\s{0,3}([-*_])(\s*\1){2,}\s*$')
+_MD_TABLE_DIVIDER = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+_MD_BLOCKQUOTE = re.compile(r'^\s*>\s?')
+_MD_BULLET = re.compile(r'^(\s*)[-*+]\s+')
+_MD_IMAGE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_MD_LINK = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+_MD_INLINE_CODE = re.compile(r'`([^`]*)`')
+_MD_EMPHASIS = re.compile(r'(\*\*|__|~~)(.+?)\1')
+_MD_ITALIC = re.compile(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\w)|(?<![\w_])_(?!\s)(.+?)(?<!\s)_(?!\w)')
+_MD_HTML_TAG = re.compile(r'<[^>]+>')
+_DOCX_HEADING_STYLE = re.compile(r'^(?:Heading|标题)\s*(\d)')
+_SPLITTER_SEPARATORS = {"\n\n": re.compile(r'(\n\n)'), "\n": re.compile(r'(\n)')}
+
+def _strip_markdown_inline(line: str) -> str:
+    """去除行内Markdown标记，保留文字内容"""
+    line = _MD_IMAGE.sub(r'\1', line)
+    line = _MD_LINK.sub(r'\1', line)
+    line = _MD_INLINE_CODE.sub(r'\1', line)
+    line = _MD_EMPHASIS.sub(r'\2', line)
+    line = _MD_ITALIC.sub(lambda m: m.group(1) or m.group(2), line)
+    return _MD_HTML_TAG.sub('', line)
+
+class _SectionBuilder:
+    """按标题层级累积章节，章节标题为完整的标题路径"""
+    
+    def __init__(self):
+        self.sections = []
+        self._headings = []
+        self._lines = []
+    
+    def heading(self, level: int, title: str) -> None:
+        self._flush()
+        self._headings = [(lvl, text) for lvl, text in self._headings if lvl < level]
+        self._headings.append((level, title))
+        self._lines.append(title)
+    
+    def line(self, text: str) -> None:
+        self._lines.append(text)
+    
+    def build(self) -> List[Dict[str, str]]:
+        self._flush()
+        return self.sections
+    
+    def _flush(self) -> None:
+        text = "\n".join(self._lines).strip()
+        if text:
+            self.sections.append({
+                "section": " > ".join(title for _, title in self._headings),
+                "text": text + "\n"
+            })
+        self._lines = []
+
+def markdown_to_sections(content: str) -> List[Dict[str, str]]:
+    """将Markdown直接转换为按标题划分的纯文本章节"""
+    builder = _SectionBuilder()
+    lines = content.splitlines()
+    in_code = False
+    
+    for i, raw in enumerate(lines):
+        if _MD_FENCE.match(raw):
+            in_code = not in_code
+            continue
+        if in_code:
+            builder.line(raw)
+            continue
+        
+        heading = _MD_ATX_HEADING.match(raw)
+        if heading:
+            builder.heading(len(heading.group(1)), _strip_markdown_inline(heading.group(2)))
+            continue
+        
+        # Setext标题：下一行为 === 或 --- 下划线
+        if raw.strip() and i + 1 < len(lines) and _MD_SETEXT_UNDERLINE.match(lines[i + 1]) \
+                and not _MD_BULLET.match(raw) and '|' not in raw:
+            level = 1 if lines[i + 1].strip().startswith('=') else 2
+            builder.heading(level, _strip_markdown_inline(raw.strip()))
+            continue
+        if _MD_SETEXT_UNDERLINE.match(raw) and i > 0 and lines[i - 1].strip() \
+                and not _MD_BULLET.match(lines[i - 1]) and '|' not in lines[i - 1]:
+            continue
+        
+        if _MD_HORIZONTAL_RULE.match(raw) or _MD_TABLE_DIVIDER.match(raw) and '-' in raw:
+            continue
+        
+        line = _MD_BLOCKQUOTE.sub('', raw)
+        line = _MD_BULLET.sub(r'\1', line)
+        if line.strip().startswith('|'):
+            line = " | ".join(cell.strip() for cell in line.strip().strip('|').split('|'))
+        builder.line(_strip_markdown_inline(line))
+    
+    return builder.build()
+
+def _count_pdf_pages(file_path: str, backend: str) -> int:
+    """获取PDF页数"""
+    if backend == "pypdfium2":
+        import pypdfium2
+        
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def _extract_pdf_pages(file_path: str, backend: str, start: int, end: int) -> List[str]:
+    """提取PDF指定页码范围[start, end)的文本（模块级函数，可在子进程中执行）"""
+    pages = []
+    if backend == "pypdfium2":
+        import pypdfium2
+        
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            for index in range(start, end):
+                page = pdf[index]
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range().replace("\r\n", "\n"))
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+        return pages
+    
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for index in range(start, end):
+            pages.append(pdf_reader.pages[index].extract_text() or "")
+    return pages
+
 class DocumentProcessor:
     """文档处理器 - 负责文档加载和分块"""
     
     def __init__(self):
         self.config = system_config
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.config.CHUNK_SIZE,
-            chunk_overlap=self.config.CHUNK_OVERLAP,
-            length_function=len,
-        )
+        self.token_mode = self.config.CHUNK_LENGTH_UNIT.lower() == "token"
+        
+        if self.token_mode:
+            # 按token计数，块大小不超过嵌入模型窗口（扣除[CLS]和[SEP]）
+            chunk_size = min(self.config.CHUNK_SIZE, self.config.EMBEDDING_MAX_TOKENS - 2)
+            chunk_overlap = min(self.config.CHUNK_OVERLAP, chunk_size // 2)
+            length_function = token_counter.count
+        else:
+            chunk_size = self.config.CHUNK_SIZE
+            chunk_overlap = self.config.CHUNK_OVERLAP
+            length_function = len
+        
+        # 分块参数在构造时确定，分块器在首次分块时创建
+        self._chunk_size = chunk_size
+        self._chunk_overlap = chunk_overlap
+        self._length_function = length_function
+        self._strategy = self.config.CHUNK_STRATEGY.lower()
+        self._breakpoint_percentile = self.config.SEMANTIC_BREAKPOINT_PERCENTILE
+        self._text_splitter = None
+        self._chunker = None
+        
+        self.text_cache = ExtractedTextCache()
+    
+    @property
+    def text_splitter(self):
+        """递归字符分块器（首次使用时导入langchain）"""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self._chunk_size,
+                chunk_overlap=self._chunk_overlap,
+                length_function=self._length_function,
+            )
+        return self._text_splitter
+    
+    @property
+    def chunker(self):
+        """按 CHUNK_STRATEGY 选择的分块器"""
+        if self._chunker is None:
+            splitter_kwargs = {
+                "length_function": self._length_function,
+                "batch_length_function": token_counter.count_batch if self.token_mode else None,
+                "fallback_splitter": self.text_splitter,
+            }
+            if self._strategy == "sentence":
+                self._chunker = SentenceTextSplitter(self._chunk_size, self._chunk_overlap, **splitter_kwargs)
+            elif self._strategy == "semantic":
+                self._chunker = SemanticTextSplitter(
+                    self._chunk_size, self._chunk_overlap,
+                    breakpoint_percentile=self._breakpoint_percentile,
+                    **splitter_kwargs
+                )
+            else:
+                self._chunker = self.text_splitter
+        return self._chunker
     
     def process_document(self, file_path: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
         """处理文档并返回分块数据"""
         try:
-            # 加载文档
-            text = self.load_document(file_path)
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"文件不存在: {file_path}")
+            
+            # 加载文档（优先读取提取文本缓存）
+            file_hash = self.text_cache.file_hash(file_path)
+            sections = self.load_document_cached(file_path, file_hash)
+            
+            file_info = {"file_hash": file_hash, "size_bytes": os.path.getsize(file_path)}
+            if metadata:
+                file_info.update(metadata)
+            return self.process_sections(sections, file_path, file_info)
             
-            if not text.strip():
+        except Exception as e:
+            error_msg = f"文档处理失败: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "success": False,
+                "error": error_msg
+            }
+    
+    def process_sections(self, sections: List[Dict[str, str]], file_path: str,
+                         metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """对已提取的章节文本分块并附加元数据"""
+        try:
+            if not any(section["text"].strip() for section in sections):
                 return {
                     "success": False,
                     "error": "文档内容为空"
                 }
             
-            # 分块处理
-            chunks = self.chunk_document(text)
+            # 分块处理（不跨章节分块），块ID由来源派生，重新入库时可原位覆盖
+            source = os.path.basename(file_path)
+            chunks = self.chunk_sections(sections, id_prefix=hashlib.sha1(source.encode('utf-8')).hexdigest()[:16])
             
             # 添加元数据
             file_metadata = {
-                "source": os.path.basename(file_path),
+                "source": source,
                 "file_path": file_path,
                 "file_type": os.path.splitext(file_path)[1].lower(),
                 "total_chunks": len(chunks)
@@ -53,7 +274,8 @@ class DocumentProcessor:
                 chunk["metadata"] = {
                     **file_metadata,
                     "chunk_index": i,
-                    "chunk_size": len(chunk["content"])
+                    "chunk_size": len(chunk["content"]),
+                    "section": chunk.pop("section")
                 }
             
             return {
@@ -71,15 +293,49 @@ class DocumentProcessor:
                 "error": error_msg
             }
     
+    def load_document_cached(self, file_path: str, file_hash: str = None) -> List[Dict[str, str]]:
+        """加载文档章节，按文件内容哈希和加载器版本读写缓存"""
+        if not self.config.TEXT_CACHE_ENABLED:
+            return self.load_sections(file_path)
+        
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        
+        file_hash = file_hash or self.text_cache.file_hash(file_path)
+        loader_key = self._loader_key(file_path)
+        entry = self.text_cache.get(file_hash, loader_key)
+        if entry is not None:
+            logger.debug(f"命中文本缓存: {os.path.basename(file_path)}")
+            return entry["sections"]
+        
+        sections = self.load_sections(file_path)
+        self.text_cache.put(file_hash, loader_key, file_path, sections)
+        return sections
+    
+    def _loader_key(self, file_path: str) -> str:
+        """缓存键中的加载器标识，PDF额外区分解析后端"""
+        if os.path.splitext(file_path)[1].lower() == '.pdf':
+            return f"v{LOADER_VERSION}-{self._resolve_pdf_backend()}"
+        return f"v{LOADER_VERSION}"
+    
+    def cached_sections(self, file_path: str, file_hash: str) -> Optional[List[Dict[str, str]]]:
+        """按文件哈希读取当前加载器版本的缓存章节，未命中时返回None（不读取原文件）"""
+        entry = self.text_cache.get(file_hash, self._loader_key(file_path))
+        return entry["sections"] if entry is not None else None
+    
     def load_document(self, file_path: str) -> str:
         """加载文档并提取文本"""
+        return "".join(section["text"] for section in self.load_sections(file_path))
+    
+    def load_sections(self, file_path: str) -> List[Dict[str, str]]:
+        """加载文档并按章节提取文本，每个章节为 {"section": 标题路径, "text": 文本}"""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"文件不存在: {file_path}")
         
         file_extension = os.path.splitext(file_path)[1].lower()
         
         if file_extension == '.pdf':
-            return self._load_pdf(file_path)
+            return [{"section": "", "text": self._load_pdf(file_path)}]
         elif file_extension == '.docx':
             return self._load_docx(file_path)
         elif file_extension in ['.txt', '.md']:
@@ -88,44 +344,107 @@ class DocumentProcessor:
             raise ValueError(f"不支持的文件格式: {file_extension}")
     
     def _load_pdf(self, file_path: str) -> str:
-        """加载PDF文件"""
-        text = ""
+        """加载PDF文件（大文件按页并行解析）"""
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+            backend = self._resolve_pdf_backend()
+            page_count = _count_pdf_pages(file_path, backend)
+            workers = self.config.PDF_WORKERS or os.cpu_count() or 1
+            
+            if workers > 1 and page_count >= self.config.PDF_PARALLEL_MIN_PAGES:
+                pages = self._extract_pdf_parallel(file_path, backend, page_count, workers)
+            else:
+                pages = _extract_pdf_pages(file_path, backend, 0, page_count)
         except Exception as e:
             logger.error(f"PDF加载失败: {e}")
             raise
-        return text
+        return "".join(page + "\n" for page in pages)
+    
+    def _resolve_pdf_backend(self) -> str:
+        """确定PDF解析后端，pypdfium2不可用时回退到PyPDF2"""
+        backend = self.config.PDF_BACKEND.lower()
+        if backend in ("auto", "pypdfium2"):
+            if _PYPDFIUM2_AVAILABLE:
+                return "pypdfium2"
+            if backend == "pypdfium2":
+                logger.warning("pypdfium2未安装，回退到PyPDF2解析PDF")
+        return "pypdf2"
+    
+    def _extract_pdf_parallel(self, file_path: str, backend: str, page_count: int, workers: int) -> List[str]:
+        """使用进程池按页码区间并行提取PDF文本"""
+        workers = min(workers, page_count)
+        step = -(-page_count // (workers * 2))  # 每个进程约处理两段，平衡负载
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_extract_pdf_pages, file_path, backend, start, end)
+                    for start, end in ranges
+                ]
+                pages = []
+                for future in futures:
+                    pages.extend(future.result())
+            logger.info(f"PDF并行解析完成: {page_count} 页, {workers} 个进程")
+            return pages
+        except Exception as e:
+            logger.warning(f"PDF并行解析失败，改为顺序解析: {e}")
+            return _extract_pdf_pages(file_path, backend, 0, page_count)
     
-    def _load_docx(self, file_path: str) -> str:
-        """加载Word文档"""
-        text = ""
+    def _load_docx(self, file_path: str) -> List[Dict[str, str]]:
+        """加载Word文档，按文档顺序流式读取段落和表格"""
+        from docx import Document
+        from docx.table import Table
+        
         try:
-            doc = Document(file_path)
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
+            builder = _SectionBuilder()
+            for block in Document(file_path).iter_inner_content():
+                if isinstance(block, Table):
+                    for row in self._iter_table_rows(block):
+                        builder.line(row)
+                    continue
+                
+                text = block.text.strip()
+                if not text:
+                    continue
+                
+                style_name = block.style.name if block.style is not None else ""
+                heading = _DOCX_HEADING_STYLE.match(style_name)
+                if heading:
+                    builder.heading(int(heading.group(1)), text)
+                elif style_name == "Title":
+                    builder.heading(0, text)
+                else:
+                    builder.line(text)
+            return builder.build()
         except Exception as e:
             logger.error(f"Word文档加载失败: {e}")
             raise
-        return text
     
-    def _load_text(self, file_path: str) -> str:
+    @staticmethod
+    def _iter_table_rows(table: "Table") -> Iterator[str]:
+        """逐行输出表格文本，合并单元格只输出一次"""
+        for row in table.rows:
+            cells = []
+            seen = set()
+            for cell in row.cells:
+                if id(cell._tc) in seen:
+                    continue
+                seen.add(id(cell._tc))
+                cells.append(cell.text.strip())
+            if any(cells):
+                yield " | ".join(cells)
+    
+    def _load_text(self, file_path: str) -> List[Dict[str, str]]:
         """加载文本文件"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
                 content = file.read()
-                
-            # 如果是Markdown文件，转换为纯文本
+            
+            # Markdown文件直接转换为纯文本章节，保留标题结构
             if file_path.endswith('.md'):
-                content = markdown.markdown(content)
-                # 简单去除HTML标签
-                import re
-                content = re.sub(r'<[^>]+>', '', content)
-                
-            return content
+                return markdown_to_sections(content)
+            
+            return [{"section": "", "text": content}]
         except Exception as e:
             logger.error(f"文本文件加载失败: {e}")
             raise
@@ -143,6 +462,32 @@ class DocumentProcessor:
         
         return chunk_data
     
+    def chunk_sections(self, sections: List[Dict[str, str]], id_prefix: str = None) -> List[Dict[str, Any]]:
+        """按章节分块，分块不跨越章节边界"""
+        id_prefix = id_prefix or f"chunk_{int(time.time())}"
+        chunk_data = []
+        for section in sections:
+            if self.token_mode and self.chunker is self.text_splitter:
+                self._warm_token_counts(section["text"])
+            for chunk in self.chunker.split_text(section["text"]):
+                chunk_data.append({
+                    "id": f"{id_prefix}_{len(chunk_data)}",
+                    "content": chunk,
+                    "section": section["section"]
+                })
+        
+        return chunk_data
+    
+    @staticmethod
+    def _warm_token_counts(text: str) -> None:
+        """按分块器的段落/行切分方式批量预计算token数，避免分块时逐段调用分词器"""
+        pieces = []
+        for separator in ("\n\n", "\n"):
+            parts = _SPLITTER_SEPARATORS[separator].split(text)
+            pieces.append(parts[0])
+            pieces.extend(parts[i] + parts[i + 1] for i in range(1, len(parts) - 1, 2))
+        token_counter.count_batch([piece for piece in pieces if piece])
+    
     def batch_process_documents(self, file_paths: List[str]) -> List[Dict[str, Any]]:
         """批量处理文档"""
         results = []
@@ -0,0 +1,122 @@
+import os
+import atexit
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+QUERY_LANE = "query"
+BULK_LANE = "bulk"
+
+def _init_worker(num_threads: int) -> None:
+    """子进程初始化：限制推理线程数后加载本地嵌入模型"""
+    # 必须在导入torch之前设置，才能限制OpenMP/MKL线程池
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(num_threads)
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    
+    from zhipu_service import zhipu_service
+    zhipu_service._init_local_model()
+
+def _embed_in_worker(texts: List[str]) -> np.ndarray:
+    """在子进程中嵌入一批文本"""
+    from zhipu_service import zhipu_service
+    return zhipu_service.embed(texts)
+
+def _ping() -> int:
+    """空任务，用于提前启动子进程并加载模型"""
+    return os.getpid()
+
+class EmbeddingPool:
+    """嵌入进程池 - 查询和批量文档分走独立的进程通道，入库时查询延迟不受影响
+
+    query 通道处理单个查询的低延迟嵌入；bulk 通道按批次把大量文档块分发给多个进程。
+    每个通道的进程数和每进程推理线程数可分别配置。
+    """
+    
+    def __init__(self):
+        self.config = system_config
+        self._executors: Dict[str, ProcessPoolExecutor] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        """是否启用嵌入进程池（子进程内始终为False，直接在本进程推理）"""
+        return self.config.EMBEDDING_POOL_ENABLED and multiprocessing.parent_process() is None
+    
+    def lane_settings(self) -> Dict[str, Dict[str, int]]:
+        """各通道的进程数和每进程线程数；bulk线程数为0时使用query通道之外的剩余核心"""
+        cpu_count = os.cpu_count() or 1
+        query_workers = max(1, self.config.EMBEDDING_QUERY_WORKERS)
+        query_threads = max(1, self.config.EMBEDDING_QUERY_THREADS)
+        bulk_workers = max(1, self.config.EMBEDDING_BULK_WORKERS)
+        bulk_threads = self.config.EMBEDDING_BULK_THREADS or max(1, (cpu_count - query_workers * query_threads) // bulk_workers)
+        return {
+            QUERY_LANE: {"workers": query_workers, "threads": query_threads},
+            BULK_LANE: {"workers": bulk_workers, "threads": bulk_threads}
+        }
+    
+    def start(self) -> None:
+        """启动两个通道的进程并预先加载模型"""
+        for lane in (QUERY_LANE, BULK_LANE):
+            executor = self._get_executor(lane)
+            workers = self.lane_settings()[lane]["workers"]
+            for future in [executor.submit(_ping) for _ in range(workers)]:
+                future.result()
+    
+    def embed(self, texts: List[str], lane: str = BULK_LANE) -> np.ndarray:
+        """在指定通道中嵌入文本，返回 (文本数, 维度) 的float32数组"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+            
+        executor = self._get_executor(lane)
+        try:
+            if lane == QUERY_LANE:
+                return executor.submit(_embed_in_worker, texts).result()
+                
+            # 批量通道：按批次分发到各进程，结果按原顺序拼接
+            batch_size = max(1, self.config.EMBEDDING_BULK_BATCH_SIZE)
+            batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+            return np.concatenate(list(executor.map(_embed_in_worker, batches)))
+        except BrokenProcessPool:
+            logger.error(f"嵌入进程池({lane})异常退出，下次调用时重新创建")
+            with self._lock:
+                self._executors.pop(lane, None)
+            raise
+    
+    def shutdown(self) -> None:
+        """关闭所有通道的进程"""
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _get_executor(self, lane: str) -> ProcessPoolExecutor:
+        """按需创建通道的进程池（spawn方式，避免复制父进程中的模型和线程状态）"""
+        with self._lock:
+            executor = self._executors.get(lane)
+            if executor is None:
+                settings = self.lane_settings()[lane]
+                executor = ProcessPoolExecutor(
+                    max_workers=settings["workers"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(settings["threads"],)
+                )
+                self._executors[lane] = executor
+                logger.info(f"嵌入进程池通道 {lane}: {settings['workers']} 个进程 x {settings['threads']} 线程")
+            return executor
+
+# 全局嵌入进程池实例
+embedding_pool = EmbeddingPool()
+atexit.register(embedding_pool.shutdown)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+检索效果与速度离线评估 - 在参数网格上对比 recall@k、MRR 和检索延迟
+
+全程只使用本地嵌入模型和向量数据库，不调用大模型。
+
+标注文件格式（JSONL，每行一个问题；或CSV，期望来源用 | 分隔）:
+    {"question": "年假怎么计算？", "expected_sources": ["员工手册.pdf"]}
+
+用法:
+    python evaluate_retrieval.py --questions eval/questions.jsonl --documents ./documents \\
+        --chunk-sizes 500,1000 --top-k 3,5,10 --thresholds 0.5,0.7 --cutoffs fixed,adaptive
+
+评估索引写入独立的向量库目录（--db-dir，默认 DATA_DIR/eval_vector_db），不影响正式索引。
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+from contextlib import contextmanager
+from typing import List, Dict, Any
+import numpy as np
+from config import system_config
+from document_processor import DocumentProcessor
+from vector_db import VectorDBManager
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt', '.md')
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """读取标注的问题和期望来源文件"""
+    questions = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(file):
+                expected = [source.strip() for source in row["expected_sources"].split("|") if source.strip()]
+                questions.append({"question": row["question"].strip(), "expected_sources": expected})
+        else:
+            for line in file:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                expected = item.get("expected_sources") or [item["expected_source"]]
+                questions.append({"question": item["question"], "expected_sources": list(expected)})
+    return questions
+
+def recall_at_k(retrieved: List[str], expected: List[str], k: int) -> float:
+    """前k个结果覆盖的期望来源比例"""
+    if not expected:
+        return 0.0
+    return len(set(retrieved[:k]) & set(expected)) / len(set(expected))
+
+def reciprocal_rank(retrieved: List[str], expected: List[str]) -> float:
+    """第一个命中结果排名的倒数，未命中为0"""
+    for rank, source in enumerate(retrieved, start=1):
+        if source in expected:
+            return 1.0 / rank
+    return 0.0
+
+def latency_percentiles(latencies_ms: List[float]) -> Dict[str, float]:
+    """延迟分位数（毫秒）"""
+    if not latencies_ms:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+def pareto_front(rows: List[Dict[str, Any]], quality_key: str = "recall", cost_key: str = "p95_ms") -> List[Dict[str, Any]]:
+    """召回越高、延迟越低越好；返回不被其他配置同时在两方面超越的配置"""
+    front = []
+    for row in rows:
+        dominated = any(
+            other[quality_key] >= row[quality_key] and other[cost_key] <= row[cost_key]
+            and (other[quality_key] > row[quality_key] or other[cost_key] < row[cost_key])
+            for other in rows
+        )
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda row: row[cost_key])
+
+@contextmanager
+def override_config(**values):
+    """临时修改系统配置"""
+    original = {key: getattr(system_config, key) for key in values}
+    for key, value in values.items():
+        setattr(system_config, key, value)
+    try:
+        yield
+    finally:
+        for key, value in original.items():
+            setattr(system_config, key, value)
+
+def find_documents(path: str) -> List[str]:
+    """列出目录下支持的文档（也可直接传入单个文件）"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(path)
+        for name in files
+        if name.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
+
+def index_namespace(document_paths: List[str], chunk_size: int, chunk_overlap: int) -> str:
+    """评估索引的命名空间：分块策略、长度单位、块大小和重叠，加上嵌入模型与文档列表（路径、大小、修改时间）的哈希
+
+    文档或配置任一变化都会得到新的命名空间，不会复用过期的索引。
+    """
+    config = system_config
+    digest = hashlib.sha1(f"{config.EMBEDDING_MODEL_NAME}\0{config.SEMANTIC_BREAKPOINT_PERCENTILE}".encode('utf-8'))
+    for path in document_paths:
+        stat = os.stat(path)
+        digest.update(f"\0{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode('utf-8'))
+    strategy, unit = config.CHUNK_STRATEGY.lower(), config.CHUNK_LENGTH_UNIT.lower()
+    return f"eval-{strategy}-{unit}-c{chunk_size}-o{chunk_overlap}-{digest.hexdigest()[:10]}"
+
+def build_index(vector_db: VectorDBManager, document_paths: List[str], chunk_size: int,
+                chunk_overlap: int, reindex: bool = False) -> str:
+    """按分块配置把文档写入独立的评估命名空间，文档和配置都未变化时直接复用"""
+    namespace = index_namespace(document_paths, chunk_size, chunk_overlap)
+    if vector_db.get_document_count(namespace) > 0 and not reindex:
+        logger.info(f"复用评估索引: {namespace}")
+        return namespace
+    
+    vector_db.clear_collection(namespace)
+    with override_config(CHUNK_SIZE=chunk_size, CHUNK_OVERLAP=chunk_overlap):
+        processor = DocumentProcessor()
+    
+    for file_path in document_paths:
+        document_data = processor.process_document(file_path)
+        if not document_data["success"]:
+            logger.warning(f"跳过文档 {file_path}: {document_data['error']}")
+            continue
+        result = vector_db.add_documents(document_data["chunks"], upsert=True, namespace=namespace)
+        if not result["success"]:
+            logger.warning(f"写入文档失败 {file_path}: {result['error']}")
+    
+    logger.info(f"评估索引已建立: {namespace}，共 {vector_db.get_document_count(namespace)} 个文档块")
+    return namespace
+
+def evaluate(vector_db: VectorDBManager, questions: List[Dict[str, Any]], namespace: str,
+             top_k: int, threshold: float, repeat: int = 1, cutoff: str = "fixed") -> Dict[str, Any]:
+    """在一个配置下检索所有问题，返回平均召回、MRR、平均保留块数和延迟分位数
+
+    cutoff 为 adaptive 时 top_k 是候选上限，threshold 是相似度绝对下限。
+    评估期间关闭查询嵌入缓存，每次检索都包含嵌入耗时，各配置的延迟可以直接比较。
+    """
+    search_kwargs = {"namespace": namespace, "similarity_threshold": threshold, "cutoff": cutoff}
+    recalls, reciprocal_ranks, kept, latencies = [], [], [], []
+    with override_config(QUERY_EMBEDDING_CACHE_SIZE=0):
+        # 预热一次，避免首个查询的加载开销计入延迟
+        vector_db.search(questions[0]["question"], top_k, **search_kwargs)
+        
+        for item in questions:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = vector_db.search(item["question"], top_k, **search_kwargs)
+                latencies.append((time.perf_counter() - start) * 1000)
+                
+            retrieved = [result["metadata"].get("source", "") for result in results]
+            recalls.append(recall_at_k(retrieved, item["expected_sources"], top_k))
+            reciprocal_ranks.append(reciprocal_rank(retrieved, item["expected_sources"]))
+            kept.append(len(results))
+    
+    return {
+        "cutoff": cutoff,
+        "top_k": top_k,
+        "threshold": threshold,
+        "recall": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "avg_k": float(np.mean(kept)),
+        **latency_percentiles(latencies)
+    }
+
+def print_report(rows: List[Dict[str, Any]], front: List[Dict[str, Any]]) -> None:
+    """打印结果表和帕累托前沿"""
+    header = (f"{'chunk':>6} {'overlap':>7} {'cutoff':>8} {'top_k':>5} {'阈值':>4} {'recall@k':>9} {'MRR':>6} "
+              f"{'平均块数':>4} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7}")
+    
+    def line(row):
+        return (f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['cutoff']:>8} {row['top_k']:>5} {row['threshold']:>6.2f} "
+                f"{row['recall']:>9.3f} {row['mrr']:>6.3f} {row['avg_k']:>8.1f} "
+                f"{row['p50_ms']:>7.1f} {row['p95_ms']:>7.1f} {row['p99_ms']:>7.1f}")
+    
+    print("\n📊 评估结果:")
+    print(header)
+    for row in rows:
+        print(line(row))
+    
+    print("\n🏆 帕累托前沿 (recall@k 越高、p95延迟越低越好):")
+    print(header)
+    for row in front:
+        print(line(row))
+
+def parse_list(value: str, cast) -> list:
+    """解析逗号分隔的参数列表"""
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检索效果与速度离线评估（不调用大模型）")
+    parser.add_argument("--questions", required=True, help="标注文件 (.jsonl 或 .csv)")
+    parser.add_argument("--documents", required=True, help="文档目录或单个文件")
+    parser.add_argument("--chunk-sizes", default=str(system_config.CHUNK_SIZE), help="块大小列表，逗号分隔")
+    parser.add_argument("--chunk-overlap", type=int, default=system_config.CHUNK_OVERLAP, help="块重叠")
+    parser.add_argument("--top-k", default=str(system_config.TOP_K), help="top_k列表，逗号分隔")
+    parser.add_argument("--thresholds", default=str(system_config.SIMILARITY_THRESHOLD), help="相似度阈值列表，逗号分隔")
+    parser.add_argument("--cutoffs", default="fixed", help="截断模式列表 (fixed/adaptive)，逗号分隔；adaptive 下阈值为相似度下限")
+    parser.add_argument("--repeat", type=int, default=3, help="每个问题重复检索次数（用于稳定延迟统计）")
+    parser.add_argument("--reindex", action="store_true", help="重建已存在的评估索引")
+    parser.add_argument("--db-dir", default=os.path.join(system_config.DATA_DIR, "eval_vector_db"),
+                        help="评估索引所在的向量库目录（与正式索引分开）")
+    parser.add_argument("--output", help="结果输出文件 (.json 或 .csv)")
+    args = parser.parse_args()
+    
+    questions = load_questions(args.questions)
+    document_paths = find_documents(args.documents)
+    if not questions or not document_paths:
+        print("❌ 错误: 标注问题或文档为空")
+        sys.exit(1)
+    
+    from zhipu_service import zhipu_service
+    if not zhipu_service.has_local_model():
+        print("❌ 错误: 本地嵌入模型不可用，评估需完全在本地运行，请检查 EMBEDDING_MODEL_PATH")
+        sys.exit(1)
+    
+    vector_db = VectorDBManager()
+    with override_config(VECTOR_DB_DIR=args.db_dir):
+        initialized = vector_db.initialize()
+    if not initialized:
+        print("❌ 错误: 向量数据库初始化失败")
+        sys.exit(1)
+    
+    rows = []
+    for chunk_size in parse_list(args.chunk_sizes, int):
+        namespace = build_index(vector_db, document_paths, chunk_size, args.chunk_overlap, args.reindex)
+        for cutoff in parse_list(args.cutoffs, str.strip):
+            for top_k in parse_list(args.top_k, int):
+                for threshold in parse_list(args.thresholds, float):
+                    row = {"chunk_size": chunk_size, "chunk_overlap": args.chunk_overlap}
+                    row.update(evaluate(vector_db, questions, namespace, top_k, threshold, args.repeat, cutoff))
+                    rows.append(row)
+    
+    front = pareto_front(rows)
+    print_report(rows, front)
+    
+    if args.output:
+        for row in rows:
+            row["pareto"] = row in front
+        if args.output.lower().endswith(".csv"):
+            with open(args.output, 'w', encoding='utf-8', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(rows, file, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存到: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+向量索引快照 - 导出文档块、元数据和float32向量，在另一台机器上直接批量导入，不重新计算嵌入
+
+快照目录:
+    manifest.json     格式版本、命名空间、块数、向量维度、嵌入模型及各文件的SHA-256（最后写入，存在即表示导出完成）
+    embeddings.npy    float32向量矩阵（块数 × 维度），行顺序与 chunks.jsonl.gz 一致
+    chunks.jsonl.gz   每行一个文档块 {"id", "content", "metadata"}
+    catalog.sqlite3   文档目录（来源、块映射、去重引用和指纹）
+
+用法:
+    python index_snapshot.py export <快照目录> [--namespace 命名空间]
+    python index_snapshot.py import <快照目录> [--namespace 命名空间] [--force]
+    python index_snapshot.py info <快照目录>
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import argparse
+from itertools import islice
+from typing import Dict, Any, Optional, Iterable
+import numpy as np
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 快照文件布局变化时递增
+SNAPSHOT_FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl.gz"
+CATALOG_FILE = "catalog.sqlite3"
+
+def _file_sha256(path: str) -> str:
+    """分块计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    """读取快照清单，快照不完整或格式版本不支持时抛出 ValueError"""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise ValueError(f"{path} 不是完整的索引快照（缺少 {MANIFEST_FILE}）")
+    
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"不支持的快照格式版本: {manifest.get('format_version')}")
+    return manifest
+
+class IndexSnapshot:
+    """向量索引快照 - 导出和批量导入一个命名空间的向量集合及文档目录"""
+    
+    def __init__(self, vector_db_manager):
+        self.vector_db = vector_db_manager
+        self.config = system_config
+    
+    def export_snapshot(self, path: str, catalog, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """把命名空间导出到快照目录（导出期间不应写入该命名空间）"""
+        if not self.vector_db._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            name = namespace or self.config.DEFAULT_NAMESPACE
+            start = time.perf_counter()
+            count = self.vector_db.get_document_count(name)
+            if count == 0:
+                return {"success": False, "error": f"命名空间 {name} 中没有可导出的文档块"}
+                
+            os.makedirs(path, exist_ok=True)
+            # 先删除旧清单，中途失败时目录不会被当作完整快照
+            for file_name in (MANIFEST_FILE, CATALOG_FILE):
+                if os.path.exists(os.path.join(path, file_name)):
+                    os.remove(os.path.join(path, file_name))
+                    
+            embeddings = None
+            written = 0
+            with gzip.open(os.path.join(path, CHUNKS_FILE), 'wt', encoding='utf-8') as chunks_file:
+                for batch in self.vector_db.iter_records(self.config.SNAPSHOT_BATCH_SIZE, namespace=name):
+                    vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+                    if embeddings is None:
+                        # 直接写入内存映射的 .npy，导出大索引时不需要把全部向量放在内存中
+                        embeddings = np.lib.format.open_memmap(
+                            os.path.join(path, EMBEDDINGS_FILE), mode='w+', dtype=np.float32,
+                            shape=(count, vectors.shape[1])
+                        )
+                    if written + len(vectors) > count:
+                        raise RuntimeError("导出期间集合发生了变化，请在没有写入时重试")
+                    embeddings[written:written + len(vectors)] = vectors
+                    for chunk_id, content, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                        chunks_file.write(json.dumps({"id": chunk_id, "content": content, "metadata": metadata},
+                                                     ensure_ascii=False) + "\n")
+                    written += len(vectors)
+                    
+            if written != count:
+                raise RuntimeError("导出期间集合发生了变化，请在没有写入时重试")
+            dimension = embeddings.shape[1]
+            embeddings.flush()
+            del embeddings
+            catalog.backup_to(os.path.join(path, CATALOG_FILE))
+            
+            manifest = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "namespace": name,
+                "count": count,
+                "dimension": dimension,
+                "embedding_model": self.config.EMBEDDING_MODEL_NAME,
+                "document_count": catalog.count(),
+                "created_at": time.time(),
+                "files": {
+                    file_name: _file_sha256(os.path.join(path, file_name))
+                    for file_name in (EMBEDDINGS_FILE, CHUNKS_FILE, CATALOG_FILE)
+                }
+            }
+            tmp_path = os.path.join(path, f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(manifest, file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+            
+            elapsed = time.perf_counter() - start
+            message = f"已导出 {count} 个文档块（{manifest['document_count']} 个文档）到 {path}"
+            logger.info(f"{name}: {message}，耗时 {elapsed:.1f}s")
+            return {"success": True, "message": message, "count": count, "elapsed": elapsed}
+            
+        except Exception as e:
+            error_msg = f"导出索引快照失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def import_snapshot(self, path: str, catalog, namespace: Optional[str] = None,
+                        force: bool = False) -> Dict[str, Any]:
+        """把快照批量导入命名空间，替换其中已有的全部文档块和文档目录
+
+        向量直接写入按当前HNSW配置新建的集合，不调用嵌入模型。快照的嵌入模型与当前配置不同时，
+        查询向量与快照中的向量不可比，除非 force 为True，否则拒绝导入。
+        """
+        if not self.vector_db._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            name = namespace or self.config.DEFAULT_NAMESPACE
+            start = time.perf_counter()
+            manifest = read_manifest(path)
+            if manifest["embedding_model"] != self.config.EMBEDDING_MODEL_NAME and not force:
+                return {
+                    "success": False,
+                    "error": f"快照使用的嵌入模型 {manifest['embedding_model']} 与当前配置的 "
+                             f"{self.config.EMBEDDING_MODEL_NAME} 不同，导入后检索结果将不可用"
+                }
+            for file_name, checksum in manifest["files"].items():
+                if _file_sha256(os.path.join(path, file_name)) != checksum:
+                    return {"success": False, "error": f"快照文件 {file_name} 校验失败，文件可能已损坏"}
+                    
+            embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r')
+            if embeddings.shape != (manifest["count"], manifest["dimension"]):
+                return {"success": False, "error": f"快照向量的形状 {embeddings.shape} 与清单不一致"}
+                
+            result = self.vector_db.bulk_load(self._iter_batches(path, embeddings), namespace=name)
+            if not result["success"]:
+                return result
+                
+            catalog_path = os.path.join(path, CATALOG_FILE)
+            if os.path.exists(catalog_path):
+                catalog.restore_from(catalog_path)
+            else:
+                catalog.rebuild(self.vector_db.iter_chunks(namespace=name))
+                
+            elapsed = time.perf_counter() - start
+            message = f"已从快照导入 {result['count']} 个文档块（{catalog.count()} 个文档）"
+            logger.info(f"{name}: {message}，耗时 {elapsed:.1f}s")
+            return {"success": True, "message": message, "count": result["count"], "elapsed": elapsed}
+            
+        except Exception as e:
+            error_msg = f"导入索引快照失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def _iter_batches(self, path: str, embeddings: np.ndarray) -> Iterable[Dict[str, Any]]:
+        """按批读取快照，与向量矩阵的对应行组成写入批次"""
+        offset = 0
+        with gzip.open(os.path.join(path, CHUNKS_FILE), 'rt', encoding='utf-8') as chunks_file:
+            while True:
+                chunks = [json.loads(line) for line in islice(chunks_file, self.config.SNAPSHOT_BATCH_SIZE)]
+                if not chunks:
+                    break
+                if offset + len(chunks) > len(embeddings):
+                    raise ValueError("快照中的文档块多于向量行数")
+                yield {
+                    "ids": [chunk["id"] for chunk in chunks],
+                    "documents": [chunk["content"] for chunk in chunks],
+                    "metadatas": [chunk["metadata"] for chunk in chunks],
+                    "embeddings": embeddings[offset:offset + len(chunks)]
+                }
+                offset += len(chunks)
+                
+        if offset != len(embeddings):
+            raise ValueError("快照中的文档块少于向量行数")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="向量索引快照导出/导入")
+    parser.add_argument("command", choices=["export", "import", "info"], help="export 导出；import 导入；info 查看快照信息")
+    parser.add_argument("path", help="快照目录")
+    parser.add_argument("--namespace", help="命名空间（导出默认为默认命名空间，导入默认为快照中记录的命名空间）")
+    parser.add_argument("--force", action="store_true", help="嵌入模型与当前配置不同时仍然导入")
+    args = parser.parse_args()
+    
+    if args.command == "info":
+        manifest = read_manifest(args.path)
+        print(f"命名空间: {manifest['namespace']}")
+        print(f"文档: {manifest['document_count']}, 文档块: {manifest['count']}, 向量维度: {manifest['dimension']}")
+        print(f"嵌入模型: {manifest['embedding_model']}")
+        print(f"导出时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created_at']))}")
+        return
+    
+    from vector_db import VectorDBManager
+    from document_catalog import DocumentCatalog
+    
+    vector_db = VectorDBManager()
+    if not vector_db.initialize():
+        print("❌ 向量数据库初始化失败")
+        return
+    
+    snapshot = IndexSnapshot(vector_db)
+    if args.command == "export":
+        namespace = args.namespace or system_config.DEFAULT_NAMESPACE
+        result = snapshot.export_snapshot(args.path, DocumentCatalog(namespace=namespace), namespace)
+    else:
+        namespace = args.namespace or read_manifest(args.path)["namespace"]
+        result = snapshot.import_snapshot(args.path, DocumentCatalog(namespace=namespace), namespace, force=args.force)
+    
+    if result["success"]:
+        print(f"✅ {result['message']}（耗时 {result['elapsed']:.1f}s）")
+    else:
+        print(f"❌ {result['error']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+大模型响应缓存 - 以模型、完整消息和采样参数的哈希为键，SQLite持久化
+
+模式（LLM_CACHE_MODE）:
+    off         不使用缓存
+    read_write  温度不高于 LLM_CACHE_MAX_TEMPERATURE 的请求先查缓存，未命中时请求并写入
+    record      每次都请求API，并记录所有成功的响应（不限温度）
+    replay      只从缓存读取（不限温度），未命中时直接返回失败，不访问网络
+
+用法:
+    python llm_cache.py stats
+    python llm_cache.py clear
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from typing import Dict, Any, Optional
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+MODE_OFF = "off"
+MODE_READ_WRITE = "read_write"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+# 参与缓存键计算的请求参数
+_KEY_FIELDS = ("model", "messages", "temperature", "max_tokens", "top_p")
+
+class LLMResponseCache:
+    """大模型响应缓存 - 条目数和总大小超出上限时按最近使用时间淘汰"""
+    
+    def __init__(self, db_path: str = None):
+        self.config = system_config
+        self.db_path = db_path or self.config.LLM_CACHE_PATH
+        self._lock = threading.RLock()
+        self._conn = None
+    
+    @property
+    def mode(self) -> str:
+        """当前缓存模式"""
+        return self.config.LLM_CACHE_MODE.lower()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """获取数据库连接（首次使用时建表）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size_bytes INTEGER DEFAULT 0,
+                    hits INTEGER DEFAULT 0,
+                    created_at REAL,
+                    last_used_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used_at)")
+        return self._conn
+    
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """请求参数的SHA-256哈希（键顺序无关）"""
+        material = json.dumps({field: payload.get(field) for field in _KEY_FIELDS},
+                              ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def _deterministic(self, payload: Dict[str, Any]) -> bool:
+        """温度足够低，复用同一请求的响应不会改变结果分布"""
+        return payload.get("temperature", 0.0) <= self.config.LLM_CACHE_MAX_TEMPERATURE
+    
+    def should_read(self, payload: Dict[str, Any]) -> bool:
+        """该请求是否先查缓存"""
+        return self.mode == MODE_REPLAY or (self.mode == MODE_READ_WRITE and self._deterministic(payload))
+    
+    def should_write(self, payload: Dict[str, Any]) -> bool:
+        """该请求的成功响应是否写入缓存"""
+        return self.mode == MODE_RECORD or (self.mode == MODE_READ_WRITE and self._deterministic(payload))
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的响应，未命中时返回None"""
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE responses SET hits = hits + 1, last_used_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row["response"])
+        except Exception as e:
+            logger.warning(f"读取大模型响应缓存失败: {e}")
+            return None
+    
+    def put(self, key: str, payload: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """写入响应（同键覆盖），随后按上限淘汰最久未使用的条目"""
+        data = json.dumps({field: response.get(field) for field in ("content", "usage", "model")}, ensure_ascii=False)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("""
+                    INSERT INTO responses (key, model, response, size_bytes, hits, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, 0, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        response = excluded.response,
+                        size_bytes = excluded.size_bytes,
+                        created_at = excluded.created_at,
+                        last_used_at = excluded.last_used_at
+                """, (key, payload.get("model", ""), data, len(data.encode('utf-8')), now, now))
+                self._evict(conn)
+        except Exception as e:
+            logger.warning(f"写入大模型响应缓存失败: {e}")
+    
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """条目数或总大小超出上限时，按最近使用时间从旧到新删除"""
+        max_entries = self.config.LLM_CACHE_MAX_ENTRIES
+        max_bytes = int(self.config.LLM_CACHE_MAX_MB * 1024 * 1024)
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM responses").fetchone()
+        if count <= max_entries and total <= max_bytes:
+            return
+            
+        evicted = 0
+        for row in conn.execute("SELECT key, size_bytes FROM responses ORDER BY last_used_at").fetchall():
+            if count <= max_entries and total <= max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (row["key"],))
+            count -= 1
+            total -= row["size_bytes"]
+            evicted += 1
+        logger.debug(f"大模型响应缓存淘汰 {evicted} 条")
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存条目数、总大小和累计命中次数"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hits), 0) FROM responses"
+            ).fetchone()
+        return {"mode": self.mode, "entries": row[0], "size_bytes": row[1], "hits": row[2], "path": self.db_path}
+    
+    def clear(self) -> int:
+        """清空缓存，返回删除的条目数"""
+        with self._lock:
+            return self._connection().execute("DELETE FROM responses").rowcount
+    
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# 全局大模型响应缓存实例
+llm_cache = LLMResponseCache()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="大模型响应缓存管理")
+    parser.add_argument("command", choices=["stats", "clear"], help="stats 查看统计；clear 清空缓存")
+    args = parser.parse_args()
+    
+    if args.command == "clear":
+        print(f"✅ 已清空 {llm_cache.clear()} 条缓存")
+        return
+    
+    stats = llm_cache.stats()
+    print(f"模式: {stats['mode']}")
+    print(f"条目数: {stats['entries']}, 大小: {stats['size_bytes'] / 1024 / 1024:.2f} MB, 累计命中: {stats['hits']}")
+    print(f"位置: {stats['path']}")
+
+if __name__ == "__main__":
+    main()
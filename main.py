@@ -5,6 +5,7 @@
 
 import os
 import sys
+import time
 import argparse
 from rag_system import rag_system
 from config import system_config
@@ -12,6 +13,12 @@ from logger import get_logger
 
 logger = get_logger(__name__)
 
+# 当前命名空间，可通过 use 命令切换
+current_namespace = system_config.DEFAULT_NAMESPACE
+
+# 当前多轮对话会话，切换命名空间或 reset 时清空
+current_conversation = None
+
 def print_banner():
     """打印横幅"""
     banner = """
@@ -33,14 +40,28 @@ def print_help():
     help_text = """
     命令帮助:
     
-    add <文件路径>     - 添加文档到系统
+    add <文件路径>     - 添加文档到系统（同一文件会被更新，其他目录的同名文件需用 replace）
+    replace <文件路径> - 用新文件替换同名文档
+    delete <文档名>    - 删除指定文档
+    summary <文档名>   - 生成整篇文档的摘要（结果会缓存）
     query <问题>       - 提问
+    chat <问题>        - 多轮对话提问（可追问，较早的对话会被压缩为摘要）
+    reset              - 结束当前多轮对话
     status             - 查看系统状态
+    list               - 列出已添加的文档
     clear              - 清空所有文档
+    rechunk            - 使用缓存文本按当前分块配置重建当前命名空间的索引
+    rebuild-index      - 按当前HNSW参数重建当前命名空间的向量索引
+    export <目录>      - 把当前命名空间的索引导出为快照
+    import <目录>      - 从快照导入索引（替换当前命名空间的全部文档，不重新计算嵌入）
+    publish            - 发布当前命名空间的新快照，供只读副本切换
+    use <命名空间>     - 切换命名空间（不存在时自动创建）
+    namespaces         - 列出所有命名空间
     help               - 显示帮助信息
     quit/exit          - 退出程序
     
     示例:
+    > use hr-policies
     > add ./documents/sample.pdf
     > query 这个文档的主要内容是什么？
     > status
@@ -60,13 +81,63 @@ def handle_add_command(file_path):
         return
     
     print(f"📄 正在处理文档: {os.path.basename(file_path)}")
-    result = rag_system.add_document(file_path)
+    result = rag_system.add_document(file_path, namespace=current_namespace)
     
     if result["success"]:
         print(f"✅ {result['message']}")
+        if result.get("warning"):
+            print(f"⚠️ {result['warning']}")
     else:
         print(f"❌ 添加失败: {result['error']}")
 
+def handle_replace_command(file_path):
+    """处理替换文档命令"""
+    if not file_path:
+        print("❌ 错误: 请提供文件路径")
+        return
+    
+    if not os.path.exists(file_path):
+        print(f"❌ 错误: 文件不存在: {file_path}")
+        return
+    
+    print(f"📄 正在替换文档: {os.path.basename(file_path)}")
+    result = rag_system.replace_document(file_path, namespace=current_namespace)
+    
+    if result["success"]:
+        print(f"✅ {result['message']}")
+        if result.get("warning"):
+            print(f"⚠️ {result['warning']}")
+    else:
+        print(f"❌ 替换失败: {result['error']}")
+
+def handle_delete_command(source):
+    """处理删除文档命令"""
+    if not source:
+        print("❌ 错误: 请提供文档名 (可通过 list 查看)")
+        return
+    
+    result = rag_system.delete_document(source, namespace=current_namespace)
+    
+    if result["success"]:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ 删除失败: {result['error']}")
+
+def handle_summary_command(source):
+    """处理文档摘要命令"""
+    if not source:
+        print("❌ 错误: 请提供文档名 (可通过 list 查看)")
+        return
+    
+    print(f"📝 正在生成摘要: {source}")
+    result = rag_system.summarize_document(source, namespace=current_namespace)
+    
+    if result["success"]:
+        origin = "缓存" if result.get("cached") else f"{result['levels']} 层合并"
+        print(f"\n📄 摘要 ({result['chunks_count']} 个文档块, {origin}):\n{result['summary']}")
+    else:
+        print(f"❌ 生成摘要失败: {result['message']}")
+
 def handle_query_command(question):
     """处理查询命令"""
     if not question:
@@ -74,8 +145,34 @@ def handle_query_command(question):
         return
     
     print(f"🤔 正在思考: {question}")
-    answer_data = rag_system.query(question)
+    answer_data = rag_system.query(question, namespace=current_namespace)
+    print_answer(answer_data)
+
+def handle_chat_command(question):
+    """处理多轮对话命令"""
+    global current_conversation
+    if not question:
+        print("❌ 错误: 请提供问题")
+        return
+    
+    if current_conversation is None:
+        current_conversation = rag_system.create_conversation(current_namespace)
     
+    print(f"🤔 正在思考: {question}")
+    answer_data = rag_system.query(question, conversation=current_conversation)
+    print_answer(answer_data)
+    if answer_data.get("success", False):
+        print(f"🗨️ 第 {current_conversation.turn_count} 轮, 对话历史 {answer_data.get('history_tokens', 0)} tokens, "
+              f"复用此前来源 {answer_data.get('reused_sources', 0)} 个")
+
+def handle_reset_command():
+    """处理结束多轮对话命令"""
+    global current_conversation
+    current_conversation = None
+    print("✅ 已结束当前对话")
+
+def print_answer(answer_data):
+    """打印答案、置信度和来源"""
     if answer_data.get("success", False):
         print(f"\n💡 答案: {answer_data['answer']}")
         
@@ -86,20 +183,35 @@ def handle_query_command(question):
             print(f"\n📚 参考来源 ({len(answer_data['sources'])} 个):")
             for i, source in enumerate(answer_data["sources"]):
                 print(f"  来源 {i+1} (相似度: {source['similarity']:.2f}): {source['metadata'].get('source', '未知')}")
+                if source.get("also_in"):
+                    print(f"    另见: {', '.join(source['also_in'])}")
     else:
         print(f"❌ 查询失败: {answer_data.get('error', '未知错误')}")
 
 def handle_status_command():
     """处理状态命令"""
-    status = rag_system.get_system_status()
+    status = rag_system.get_system_status(current_namespace)
     
     print("\n📊 系统状态:")
     print(f"  初始化状态: {'✅ 已初始化' if status['initialized'] else '❌ 未初始化'}")
+    print(f"  当前命名空间: {status['namespace']}")
     print(f"  文档数量: {status['document_count']}")
+    print(f"  文档块数量: {status['chunk_count']}")
     
     if status.get("vector_db", {}).get("initialized"):
         print(f"  向量数据库: ✅ 已初始化")
         print(f"  集合名称: {status['vector_db']['collection_name']}")
+        if status['vector_db'].get('mode') == "replica":
+            print(f"  只读副本快照: {status['vector_db']['snapshot'] or '尚未发布'}（精确检索）")
+        else:
+            index_params = status['vector_db'].get('index_params', {})
+            print(f"  索引参数: M={index_params.get('hnsw:M', 16)}, "
+                  f"construction_ef={index_params.get('hnsw:construction_ef', 100)}, "
+                  f"search_ef={index_params.get('hnsw:search_ef', 10)}")
+            if status['vector_db'].get('mode') == "sharded":
+                print(f"  分片文档块数: {status['vector_db']['shard_counts']}")
+        if status['vector_db'].get('index_params_outdated'):
+            print("  ⚠️ 索引参数与当前配置不一致，可执行 rebuild-index 重建")
     else:
         print(f"  向量数据库: ❌ 未初始化")
     
@@ -107,15 +219,30 @@ def handle_status_command():
     print(f"  嵌入模型: {status['config']['embedding_model']}")
     print(f"  语言模型: {status['config']['llm_model']}")
     print(f"  文本块大小: {status['config']['chunk_size']} 字符")
-    print(f"  相似度阈值: {status['config']['similarity_threshold']}")
+    if status['config']['retrieval_cutoff'] == "adaptive":
+        print(f"  检索截断: 自适应 (最多 {system_config.CUTOFF_MAX_K} 块, 相似度下限 {system_config.CUTOFF_SIMILARITY_FLOOR})")
+    else:
+        print(f"  检索截断: 固定 (top_k={system_config.TOP_K}, 相似度阈值 {status['config']['similarity_threshold']})")
+
+def handle_list_command():
+    """处理文档列表命令"""
+    documents = rag_system.get_document_sources(current_namespace)
+    if not documents:
+        print("📭 系统中暂无文档")
+        return
+    
+    print(f"\n📚 已添加文档 ({len(documents)} 个):")
+    for doc in documents:
+        ingested_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(doc["ingested_at"]))
+        print(f"  {doc['source']}  ({doc['chunk_count']} 块, {doc['size_bytes'] / 1024:.1f} KB, {ingested_at})")
 
 def handle_clear_command():
     """处理清空命令"""
-    print("⚠️ 确认清空所有文档? (y/N): ", end="")
+    print(f"⚠️ 确认清空命名空间 {current_namespace} 中的所有文档? (y/N): ", end="")
     confirm = input().strip().lower()
     
     if confirm == 'y' or confirm == 'yes':
-        result = rag_system.clear_documents()
+        result = rag_system.clear_documents(current_namespace)
         if result["success"]:
             print("✅ 所有文档已清空")
         else:
@@ -123,12 +250,116 @@ def handle_clear_command():
     else:
         print("操作已取消")
 
+def handle_rechunk_command():
+    """处理重新分块命令"""
+    print(f"⚠️ 将按当前分块配置重建命名空间 {current_namespace} 的索引，确认继续? (y/N): ", end="")
+    confirm = input().strip().lower()
+    
+    if confirm == 'y' or confirm == 'yes':
+        print(f"🔄 正在重新分块 (块大小: {system_config.CHUNK_SIZE}, 重叠: {system_config.CHUNK_OVERLAP})...")
+        result = rag_system.rechunk_from_cache(current_namespace)
+        if result["success"]:
+            print(f"✅ {result['message']}")
+            if result["failed"]:
+                print(f"⚠️ 处理失败的文档: {', '.join(result['failed'])}")
+        else:
+            print(f"❌ 重新分块失败: {result['error']}")
+    else:
+        print("操作已取消")
+
+def handle_rebuild_index_command():
+    """处理重建索引命令"""
+    print(f"🔄 正在按当前HNSW参数重建命名空间 {current_namespace} 的索引 "
+          f"(M={system_config.HNSW_M}, construction_ef={system_config.HNSW_CONSTRUCTION_EF}, "
+          f"search_ef={system_config.HNSW_SEARCH_EF})...")
+    result = rag_system.rebuild_index(current_namespace)
+    if result["success"]:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ 重建索引失败: {result['error']}")
+
+def handle_export_command(path):
+    """处理导出快照命令"""
+    if not path:
+        print("❌ 请提供快照目录")
+        return
+    
+    print(f"📦 正在导出命名空间 {current_namespace} 的索引快照...")
+    result = rag_system.export_index(path, current_namespace)
+    if result["success"]:
+        print(f"✅ {result['message']}（耗时 {result['elapsed']:.1f}s）")
+    else:
+        print(f"❌ 导出失败: {result['error']}")
+
+def handle_import_command(path):
+    """处理导入快照命令"""
+    if not path:
+        print("❌ 请提供快照目录")
+        return
+    
+    print(f"⚠️ 导入将替换命名空间 {current_namespace} 中的所有文档，确认继续? (y/N): ", end="")
+    confirm = input().strip().lower()
+    
+    if confirm == 'y' or confirm == 'yes':
+        print("📦 正在导入索引快照...")
+        result = rag_system.import_index(path, current_namespace)
+        if result["success"]:
+            print(f"✅ {result['message']}（耗时 {result['elapsed']:.1f}s）")
+        else:
+            print(f"❌ 导入失败: {result['error']}")
+    else:
+        print("操作已取消")
+
+def handle_publish_command():
+    """处理发布快照命令"""
+    print(f"📦 正在发布命名空间 {current_namespace} 的快照...")
+    result = rag_system.publish_snapshot(current_namespace)
+    if result["success"]:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ 发布失败: {result['error']}")
+
+def handle_use_command(namespace):
+    """处理切换命名空间命令"""
+    global current_namespace, current_conversation
+    if not namespace:
+        print(f"当前命名空间: {current_namespace}")
+        return
+    
+    try:
+        rag_system.get_catalog(namespace)
+    except ValueError as e:
+        print(f"❌ 错误: {e}")
+        return
+    
+    current_namespace = namespace
+    current_conversation = None
+    if system_config.INDEX_WARMUP_ENABLED:
+        rag_system.vector_db.warm_up(namespace)
+    print(f"✅ 已切换到命名空间: {namespace}")
+
+def handle_namespaces_command():
+    """处理命名空间列表命令"""
+    namespaces = rag_system.list_namespaces()
+    print(f"\n🗂️ 命名空间 ({len(namespaces)} 个):")
+    for namespace in namespaces:
+        marker = "*" if namespace == current_namespace else " "
+        print(f"  {marker} {namespace}")
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="基于智普大模型的RAG智能文档问答助手")
-    parser.add_argument("--dev", action="store_true", help="开发模式")
+    parser.add_argument("--dev", action="store_true", help="开发模式（启用cProfile性能剖析，等同 --profile cprofile）")
+    parser.add_argument("--profile", choices=["off", "cprofile", "sample"],
+                        help="剖析每次入库和问答请求，结果写入 PROFILE_DIR（默认取 PROFILE_MODE）")
+    parser.add_argument("--namespace", default=system_config.DEFAULT_NAMESPACE, help="启动时使用的命名空间")
     args = parser.parse_args()
     
+    if args.profile:
+        system_config.PROFILE_MODE = args.profile
+    elif args.dev:
+        system_config.PROFILE_MODE = "cprofile"
+    
     # 打印横幅
     print_banner()
     
@@ -139,6 +370,10 @@ def main():
         sys.exit(1)
     
     print("✅ 系统初始化完成")
+    if system_config.PROFILE_MODE != "off":
+        print(f"🔬 性能剖析已启用（{system_config.PROFILE_MODE}），结果写入 {system_config.PROFILE_DIR}")
+    
+    handle_use_command(args.namespace)
     
     # 显示系统状态
     handle_status_command()
@@ -166,12 +401,38 @@ def main():
                 print_help()
             elif cmd == 'add':
                 handle_add_command(args_part)
+            elif cmd == 'replace':
+                handle_replace_command(args_part)
+            elif cmd == 'delete':
+                handle_delete_command(args_part)
+            elif cmd == 'summary':
+                handle_summary_command(args_part)
             elif cmd == 'query':
                 handle_query_command(args_part)
+            elif cmd == 'chat':
+                handle_chat_command(args_part)
+            elif cmd == 'reset':
+                handle_reset_command()
             elif cmd == 'status':
                 handle_status_command()
+            elif cmd == 'list':
+                handle_list_command()
             elif cmd == 'clear':
                 handle_clear_command()
+            elif cmd == 'rechunk':
+                handle_rechunk_command()
+            elif cmd == 'rebuild-index':
+                handle_rebuild_index_command()
+            elif cmd == 'export':
+                handle_export_command(args_part)
+            elif cmd == 'import':
+                handle_import_command(args_part)
+            elif cmd == 'publish':
+                handle_publish_command()
+            elif cmd == 'use':
+                handle_use_command(args_part)
+            elif cmd == 'namespaces':
+                handle_namespaces_command()
             else:
                 print(f"❌ 未知命令: {cmd} (输入 'help' 查看帮助)")
         
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+BGE嵌入模型的ONNX Runtime推理后端 - 导出、int8动态量化和与PyTorch嵌入的一致性校验
+
+用法:
+    python onnx_embedder.py export              # 导出ONNX并量化，随后自动做一致性校验
+    python onnx_embedder.py check               # 对已导出的模型重新做一致性校验
+    python onnx_embedder.py export --no-quantize
+
+导出和校验需要 torch 与 transformers；推理只需要 onnxruntime 和 tokenizers。
+设置 EMBEDDING_BACKEND=onnx 后，只有一致性校验通过的模型会被使用。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import List, Dict, Any, Callable, Optional
+import numpy as np
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+FP32_MODEL_NAME = "model.onnx"
+INT8_MODEL_NAME = "model_int8.onnx"
+EXPORT_INFO_NAME = "export_info.json"
+
+# 一致性校验用的样例文本（中英文、长短句混合）
+PARITY_SAMPLES = [
+    "员工每年享有带薪年假，天数按累计工作年限计算。",
+    "报销流程：提交申请、部门负责人审批、财务复核后打款。",
+    "什么是试用期？",
+    "The quarterly report summarizes revenue, costs and the outlook for next year.",
+    "RAG系统先检索相关文档块，再由大模型基于上下文生成答案。",
+    "会议纪要",
+    "如发现安全隐患，应立即停止作业并向安全管理部门报告，不得擅自处理。" * 4,
+    "Error code 502: upstream service unavailable, retry after 30 seconds."
+]
+
+def pool_embeddings(last_hidden_state: np.ndarray, attention_mask: np.ndarray, pooling: str = "mean") -> np.ndarray:
+    """池化并做L2归一化：mean 与Transformers后端一致；cls 与SentenceTransformers加载BGE时一致"""
+    if pooling == "cls":
+        pooled = last_hidden_state[:, 0]
+    else:
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        pooled = summed / np.maximum(mask.sum(axis=1), 1e-9)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return np.ascontiguousarray(pooled / np.maximum(norms, 1e-12), dtype=np.float32)
+
+def detect_pooling(model_path: str = None) -> str:
+    """PyTorch后端加载同一模型时使用的池化方式
+
+    安装了SentenceTransformers时按模型的 1_Pooling/config.json（缺失时SentenceTransformers默认平均池化），
+    否则与Transformers后端一致使用平均池化。
+    """
+    from importlib.util import find_spec
+    
+    model_path = model_path or system_config.EMBEDDING_MODEL_PATH
+    config_path = os.path.join(model_path, "1_Pooling", "config.json")
+    if find_spec("sentence_transformers") is None or not os.path.exists(config_path):
+        return "mean"
+    with open(config_path, 'r', encoding='utf-8') as file:
+        pooling = json.load(file)
+    return "cls" if pooling.get("pooling_mode_cls_token") else "mean"
+
+def _loaded_pooling(service) -> str:
+    """已加载的PyTorch嵌入模型实际使用的池化方式"""
+    if getattr(service, "sentence_model", None) is not None:
+        for module in service.sentence_model:
+            if hasattr(module, "get_pooling_mode_str"):
+                return "cls" if module.get_pooling_mode_str() == "cls" else "mean"
+    return "mean"
+
+def parity_check(reference: np.ndarray, candidate: np.ndarray, threshold: float = None) -> Dict[str, Any]:
+    """逐条比较两组嵌入的余弦相似度，最小值不低于阈值即视为通过"""
+    if threshold is None:
+        threshold = system_config.ONNX_PARITY_THRESHOLD
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosines = np.einsum('ij,ij->i', reference, candidate)
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "threshold": threshold,
+        "passed": bool(cosines.min() >= threshold),
+        "samples": len(cosines)
+    }
+
+def model_file(model_dir: str = None, quantized: bool = None) -> str:
+    """当前配置对应的ONNX模型文件路径"""
+    model_dir = model_dir or system_config.ONNX_MODEL_DIR
+    quantized = system_config.ONNX_QUANTIZE if quantized is None else quantized
+    return os.path.join(model_dir, INT8_MODEL_NAME if quantized else FP32_MODEL_NAME)
+
+def load_export_info(model_dir: str = None) -> Dict[str, Any]:
+    """读取导出记录（含一致性校验结果），不存在时返回空字典"""
+    path = os.path.join(model_dir or system_config.ONNX_MODEL_DIR, EXPORT_INFO_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def _save_export_info(model_dir: str, info: Dict[str, Any]) -> None:
+    """写入导出记录"""
+    with open(os.path.join(model_dir, EXPORT_INFO_NAME), 'w', encoding='utf-8') as file:
+        json.dump(info, file, ensure_ascii=False, indent=2)
+
+class OnnxEmbedder:
+    """ONNX Runtime嵌入器 - 使用tokenizers分词，输出归一化的float32嵌入"""
+    
+    def __init__(self, model_path: str = None, tokenizer_path: str = None,
+                 max_length: int = None, num_threads: int = None, pooling: str = None):
+        self.config = system_config
+        self.model_path = model_path or model_file()
+        self.tokenizer_path = tokenizer_path or os.path.join(self.config.EMBEDDING_MODEL_PATH, "tokenizer.json")
+        self.max_length = max_length or self.config.EMBEDDING_MAX_TOKENS
+        # auto 时与PyTorch后端加载同一模型的池化方式一致
+        self.pooling = (pooling or self.config.ONNX_POOLING).lower()
+        if self.pooling == "auto":
+            self.pooling = detect_pooling()
+        # 未单独配置时跟随嵌入进程池设置的 OMP_NUM_THREADS
+        self.num_threads = num_threads or self.config.ONNX_NUM_THREADS or int(os.environ.get("OMP_NUM_THREADS", "0"))
+        self._session = None
+        self._tokenizer = None
+        self._input_names = set()
+    
+    def load(self) -> None:
+        """加载推理会话和分词器"""
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+        self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self._session.get_inputs()}
+        
+        self._tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        self._tokenizer.enable_truncation(max_length=self.max_length)
+        self._tokenizer.enable_padding()
+        logger.info(f"成功加载ONNX嵌入模型: {self.model_path}")
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """嵌入一批文本，返回 (文本数, 维度) 的float32数组"""
+        if self._session is None:
+            self.load()
+            
+        encodings = self._tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        }
+        inputs = {name: value for name, value in inputs.items() if name in self._input_names}
+        last_hidden_state = self._session.run(None, inputs)[0]
+        return pool_embeddings(last_hidden_state, inputs["attention_mask"], self.pooling)
+
+def export_model(model_path: str = None, output_dir: str = None, quantize: bool = True, opset: int = 14) -> Dict[str, Any]:
+    """把PyTorch模型导出为ONNX（批大小和序列长度为动态维度），可选int8动态量化"""
+    model_path = model_path or system_config.EMBEDDING_MODEL_PATH
+    output_dir = output_dir or system_config.ONNX_MODEL_DIR
+    try:
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+        
+        os.makedirs(output_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModel.from_pretrained(model_path)
+        model.eval()
+        
+        sample = tokenizer(["示例文本", "example"], padding=True, return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        
+        fp32_path = model_file(output_dir, quantized=False)
+        start = time.perf_counter()
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[name] for name in input_names), fp32_path,
+                input_names=input_names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes, opset_version=opset
+            )
+        logger.info(f"ONNX模型已导出: {fp32_path} ({time.perf_counter() - start:.1f}s)")
+        
+        output_path = fp32_path
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            output_path = model_file(output_dir, quantized=True)
+            quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+            logger.info(f"int8动态量化完成: {output_path}")
+            
+        _save_export_info(output_dir, {
+            "source_model": model_path,
+            "model_file": os.path.basename(output_path),
+            "quantized": quantize,
+            "opset": opset,
+            "exported_at": time.time()
+        })
+        return {"success": True, "model_file": output_path}
+    
+    except Exception as e:
+        error_msg = f"导出ONNX模型失败: {e}"
+        logger.error(error_msg)
+        return {"success": False, "error": error_msg}
+
+def check_parity(onnx_embed: Callable[[List[str]], np.ndarray] = None,
+                 reference_embed: Callable[[List[str]], np.ndarray] = None,
+                 texts: Optional[List[str]] = None, model_dir: str = None) -> Dict[str, Any]:
+    """对比ONNX与PyTorch嵌入并记录结果；记录为未通过的模型不会被 EMBEDDING_BACKEND=onnx 使用"""
+    model_dir = model_dir or system_config.ONNX_MODEL_DIR
+    texts = texts or PARITY_SAMPLES
+    try:
+        pooling = None
+        if reference_embed is None:
+            from zhipu_service import ZhipuAIService
+            reference = ZhipuAIService()
+            reference._init_local_model(backend="pytorch")
+            if not reference.has_local_model():
+                return {"success": False, "error": "PyTorch嵌入模型不可用，无法做一致性校验"}
+            reference_embed = reference.embed
+            # 两侧使用同一种池化：未显式配置时跟随实际加载的PyTorch路径
+            if system_config.ONNX_POOLING.lower() == "auto":
+                pooling = _loaded_pooling(reference)
+        if onnx_embed is None:
+            embedder = OnnxEmbedder(model_path=model_file(model_dir), pooling=pooling)
+            embedder.load()
+            pooling = embedder.pooling
+            onnx_embed = embedder.embed
+            
+        # 计时前各预热一次，排除会话初始化和首次推理的开销
+        onnx_embed(texts[:1])
+        reference_embed(texts[:1])
+        
+        start = time.perf_counter()
+        candidate = onnx_embed(texts)
+        onnx_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = reference_embed(texts)
+        reference_seconds = time.perf_counter() - start
+        
+        parity = parity_check(np.asarray(expected, dtype=np.float32), candidate)
+        parity["speedup"] = reference_seconds / max(onnx_seconds, 1e-9)
+        if pooling is not None:
+            parity["pooling"] = pooling
+        
+        info = load_export_info(model_dir)
+        info.setdefault("parity", {})[os.path.basename(model_file(model_dir))] = parity
+        _save_export_info(model_dir, info)
+        return {"success": True, **parity}
+    
+    except Exception as e:
+        error_msg = f"一致性校验失败: {e}"
+        logger.error(error_msg)
+        return {"success": False, "error": error_msg}
+
+def parity_passed(model_dir: str = None) -> Optional[bool]:
+    """当前模型文件的一致性校验结果；尚未校验时返回None"""
+    parity = load_export_info(model_dir).get("parity", {}).get(os.path.basename(model_file(model_dir)))
+    return None if parity is None else parity["passed"]
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="BGE嵌入模型ONNX导出与一致性校验")
+    parser.add_argument("command", choices=["export", "check"], help="export 导出并校验；check 仅校验")
+    parser.add_argument("--model-path", default=system_config.EMBEDDING_MODEL_PATH, help="PyTorch模型目录")
+    parser.add_argument("--output-dir", default=system_config.ONNX_MODEL_DIR, help="ONNX模型输出目录")
+    parser.add_argument("--no-quantize", action="store_true", help="不做int8量化")
+    args = parser.parse_args()
+    
+    if args.command == "export":
+        result = export_model(args.model_path, args.output_dir, quantize=not args.no_quantize)
+        if not result["success"]:
+            print(f"❌ {result['error']}")
+            sys.exit(1)
+        print(f"✅ 已导出: {result['model_file']}")
+    
+    system_config.ONNX_QUANTIZE = not args.no_quantize
+    result = check_parity(model_dir=args.output_dir)
+    if not result["success"]:
+        print(f"❌ {result['error']}")
+        sys.exit(1)
+    
+    status = "✅ 通过" if result["passed"] else "❌ 未通过"
+    print(f"{status} 一致性校验: 最小余弦 {result['min_cosine']:.4f}, 平均 {result['mean_cosine']:.4f} "
+          f"(阈值 {result['threshold']}), 速度 {result['speedup']:.1f}x")
+    if not result["passed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+性能剖析 - 为文档入库和问答请求逐次记录性能剖析结果，便于附在性能问题报告中复现
+
+剖析模式（PROFILE_MODE，命令行 --profile）:
+    off       不剖析（默认），被包装的方法直接调用
+    cprofile  确定性剖析：<名称>.prof（pstats格式，可用 snakeviz 或 python -m pstats 查看）和 <名称>.txt（按累计耗时排序）
+    sample    采样剖析：每隔 PROFILE_SAMPLE_INTERVAL_MS 毫秒记录一次调用栈，写入 <名称>.collapsed
+              （折叠栈格式，可直接交给 flamegraph.pl 或 speedscope 生成火焰图），开销远小于 cprofile
+
+每次请求的结果写入 PROFILE_DIR，另有 <名称>.json 记录耗时、入库过程的内存峰值（tracemalloc）、
+Python和依赖版本以及当时的系统配置（不含API密钥）。只剖析发起请求的线程，嵌入进程池等子进程不在结果中。
+
+用法:
+    python profiler.py show <剖析文件> [--limit 行数]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import platform
+import argparse
+import functools
+import threading
+import tracemalloc
+from collections import Counter
+from dataclasses import asdict
+from typing import Dict, Any, Optional, Callable
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_MODES = ("off", "cprofile", "sample")
+
+# 记录在剖析元数据中的依赖版本
+_TRACKED_PACKAGES = ("chromadb", "numpy", "torch", "sentence-transformers", "onnxruntime", "zhipuai")
+
+# 每个线程同一时间只剖析最外层的请求（如批量入库中的单个文档不再单独剖析）
+_active = threading.local()
+
+# tracemalloc 为进程级，多个入库请求同时进行时共用，最后一个结束时停止
+_memory_lock = threading.Lock()
+_memory_users = 0
+_memory_started = False
+
+class StackSampler:
+    """采样剖析器 - 后台线程定期读取目标线程的调用栈，按折叠栈格式计数"""
+    
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+    
+    def start(self) -> None:
+        self._thread.start()
+    
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            # 停止时目标线程正在等待采样线程结束，这一帧不计入
+            if frame is not None and not self._stop.is_set():
+                self.samples[self._collapse(frame)] += 1
+    
+    @staticmethod
+    def _collapse(frame) -> str:
+        """调用栈按 根;...;叶 拼接，每帧为 函数 (文件:起始行)"""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            name = getattr(code, "co_qualname", code.co_name)
+            names.append(f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ","))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+    
+    def write(self, path: str) -> None:
+        """按样本数降序写入折叠栈文件（每行: 栈 样本数）"""
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+def _start_memory_tracking() -> None:
+    """开始记录内存峰值（已由 -X tracemalloc 等启用时只重置峰值）"""
+    global _memory_users, _memory_started
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memory_started = True
+        _memory_users += 1
+        tracemalloc.reset_peak()
+
+def _stop_memory_tracking() -> int:
+    """结束记录，返回本次请求期间的内存峰值（字节）；多个请求并发时峰值为进程内的合计"""
+    global _memory_users, _memory_started
+    with _memory_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _memory_users -= 1
+        if _memory_users == 0 and _memory_started:
+            tracemalloc.stop()
+            _memory_started = False
+        return peak
+
+def _environment() -> Dict[str, Any]:
+    """复现剖析结果所需的运行环境和系统配置"""
+    from importlib.metadata import version, PackageNotFoundError
+    
+    packages = {}
+    for package in _TRACKED_PACKAGES:
+        try:
+            packages[package] = version(package)
+        except PackageNotFoundError:
+            pass
+    config = {key: value for key, value in asdict(system_config).items() if "API_KEY" not in key}
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pid": os.getpid(),
+        "packages": packages,
+        "config": config
+    }
+
+def _profile_name(kind: str, label: str) -> str:
+    """剖析文件名：时间-类型-标签-随机后缀"""
+    slug = re.sub(r'[^\w.-]+', '_', label).strip('_')[:40] or "request"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{slug}-{uuid.uuid4().hex[:6]}"
+
+def run_profiled(kind: str, label: str, func: Callable, *args, track_memory: bool = False, **kwargs) -> Any:
+    """按 PROFILE_MODE 剖析一次调用并写入 PROFILE_DIR；未启用或已在剖析中时直接调用"""
+    mode = system_config.PROFILE_MODE
+    if mode == "off" or getattr(_active, "depth", 0):
+        return func(*args, **kwargs)
+    if mode not in PROFILE_MODES:
+        logger.warning(f"未知的剖析模式: {mode}（可选 {', '.join(PROFILE_MODES)}），本次不剖析")
+        return func(*args, **kwargs)
+    
+    profiler = sampler = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # 已有其他剖析工具在运行（Python 3.12起同一时间只允许一个）
+            logger.warning(f"无法启动cProfile，本次不剖析: {e}")
+            return func(*args, **kwargs)
+    else:
+        sampler = StackSampler(threading.get_ident(), system_config.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        sampler.start()
+    if track_memory:
+        _start_memory_tracking()
+    
+    _active.depth = 1
+    started_at = time.time()
+    start = time.perf_counter()
+    result = error = None
+    try:
+        result = func(*args, **kwargs)
+        return result
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _active.depth = 0
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        peak = _stop_memory_tracking() if track_memory else None
+        try:
+            _write_profile(kind, label, mode, started_at, duration, peak, profiler, sampler, result, error)
+        except Exception as e:
+            logger.error(f"写入剖析结果失败: {e}")
+
+def _write_profile(kind: str, label: str, mode: str, started_at: float, duration: float, peak: Optional[int],
+                   profiler: Optional[cProfile.Profile], sampler: Optional[StackSampler], result: Any,
+                   error: Optional[str]) -> str:
+    """写入剖析文件和元数据，返回元数据文件路径"""
+    os.makedirs(system_config.PROFILE_DIR, exist_ok=True)
+    base = os.path.join(system_config.PROFILE_DIR, _profile_name(kind, label))
+    
+    files = []
+    if profiler is not None:
+        profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.txt", 'w', encoding='utf-8') as file:
+            pstats.Stats(profiler, stream=file).sort_stats("cumulative").print_stats(60)
+        files += [f"{base}.prof", f"{base}.txt"]
+    if sampler is not None:
+        sampler.write(f"{base}.collapsed")
+        files.append(f"{base}.collapsed")
+    
+    meta = {
+        "kind": kind,
+        "label": label,
+        "mode": mode,
+        "started_at": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started_at)),
+        "duration_seconds": round(duration, 6),
+        "success": result.get("success") if isinstance(result, dict) else error is None,
+        "error": error,
+        "peak_memory_bytes": peak,
+        "samples": sum(sampler.samples.values()) if sampler is not None else None,
+        "sample_interval_ms": system_config.PROFILE_SAMPLE_INTERVAL_MS if sampler is not None else None,
+        "files": [os.path.basename(path) for path in files],
+        "environment": _environment()
+    }
+    with open(f"{base}.json", 'w', encoding='utf-8') as file:
+        json.dump(meta, file, ensure_ascii=False, indent=2, default=str)
+    
+    memory = f", 内存峰值 {peak / 1024 / 1024:.1f}MB" if peak is not None else ""
+    logger.info(f"性能剖析已写入: {base}.json（{kind} {duration * 1000:.0f}ms{memory}）")
+    return f"{base}.json"
+
+def profiled(kind: str, track_memory: bool = False, path_label: bool = False) -> Callable:
+    """方法装饰器：以第一个参数作为标签剖析每次调用（path_label 为True时取文件名，否则取前40个字符）"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if system_config.PROFILE_MODE == "off":
+                return func(self, *args, **kwargs)
+            label = str(args[0]) if args else kind
+            label = os.path.basename(label) if path_label else label[:40]
+            return run_profiled(kind, label, func, self, *args, track_memory=track_memory, **kwargs)
+        return wrapper
+    return decorator
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="查看性能剖析结果")
+    parser.add_argument("command", choices=["show"], help="show 按耗时显示剖析文件（.prof 或 .collapsed）")
+    parser.add_argument("path", help="剖析文件")
+    parser.add_argument("--limit", type=int, default=30, help="显示的行数")
+    args = parser.parse_args()
+    
+    if args.path.endswith(".collapsed"):
+        # 按叶子函数统计自身样本数
+        leaves = Counter()
+        with open(args.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                stack, count = line.rstrip("\n").rsplit(" ", 1)
+                leaves[stack.rsplit(";", 1)[-1]] += int(count)
+        total = sum(leaves.values()) or 1
+        for name, count in leaves.most_common(args.limit):
+            print(f"{count / total:7.1%} {count:8d}  {name}")
+    else:
+        pstats.Stats(args.path).sort_stats("cumulative").print_stats(args.limit)
+
+if __name__ == "__main__":
+    main()
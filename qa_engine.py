@@ -1,23 +1,47 @@
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Callable
 from config import system_config
 from zhipu_service import zhipu_service
 from vector_db import VectorDBManager
+from query_rewriter import QueryRewriter
+from summarizer import DocumentSummarizer
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = None) -> List[Dict[str, Any]]:
+    """倒数排名融合：按文档块ID去重，得分为各结果列表中 1/(k+排名) 之和"""
+    if k is None:
+        k = system_config.RRF_K
+    
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.get(result["id"])
+            if entry is None:
+                entry = fused[result["id"]] = {**result, "fusion_score": 0.0}
+            entry["fusion_score"] += 1.0 / (k + rank)
+            entry["similarity"] = max(entry["similarity"], result["similarity"])
+    
+    ranked = sorted(fused.values(), key=lambda item: item["fusion_score"], reverse=True)[:top_k]
+    for rank, result in enumerate(ranked, start=1):
+        result["rank"] = rank
+    return ranked
+
 class QAEngine:
     """问答引擎 - 负责生成答案"""
     
-    def __init__(self, vector_db_manager: VectorDBManager):
+    def __init__(self, vector_db_manager: VectorDBManager, get_catalog: Optional[Callable] = None):
         self.vector_db = vector_db_manager
         self.config = system_config
+        self.query_rewriter = QueryRewriter()
+        self.summarizer = DocumentSummarizer(vector_db_manager, get_catalog=get_catalog)
     
-    def answer_question(self, question: str, top_k: int = None) -> Dict[str, Any]:
-        """回答问题"""
+    def answer_question(self, question: str, top_k: int = None, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """回答问题（只检索指定命名空间）"""
         try:
             # 检索相关文档
-            search_results = self.vector_db.search(question, top_k)
+            search_results = self.retrieve(question, top_k, namespace)
             
             if not search_results:
                 return {
@@ -49,6 +73,26 @@ class QAEngine:
                 "confidence": 0.0
             }
     
+    def retrieve(self, question: str, top_k: int = None, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """检索相关文档块；启用查询改写时多个查询批量检索后融合排序
+
+        自适应截断模式下只保留与最相关结果同一档的文档块，减少送入大模型的上下文。
+        """
+        queries = self.query_rewriter.rewrite(question)
+        if len(queries) == 1:
+            return self.vector_db.search(question, top_k, namespace=namespace)
+            
+        start = time.perf_counter()
+        result_lists = self.vector_db.search_many(queries, top_k, namespace=namespace)
+        if top_k is None:
+            # 自适应模式下融合结果数不超过单个查询截断后保留的最多块数
+            adaptive = self.config.RETRIEVAL_CUTOFF.lower() == "adaptive"
+            top_k = max(map(len, result_lists)) if adaptive else self.config.TOP_K
+        search_results = reciprocal_rank_fusion(result_lists, top_k)
+        logger.debug(f"多查询检索: {len(queries)} 个查询, 融合后 {len(search_results)} 条结果, "
+                     f"耗时 {time.perf_counter() - start:.3f}s")
+        return search_results
+    
     def _build_context(self, search_results: List[Dict[str, Any]]) -> str:
         """构建上下文"""
         context_parts = []
@@ -59,8 +103,9 @@ class QAEngine:
         
         return "\n\n".join(context_parts)
     
-    def _generate_answer(self, question: str, context: str) -> Dict[str, Any]:
-        """生成答案"""
+    def _generate_answer(self, question: str, context: str,
+                         history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """生成答案；history 为多轮对话中此前的摘要和对话消息，插在系统提示和当前问题之间"""
         system_prompt = """你是一个专业的问答助手，请基于提供的上下文信息回答用户的问题。
 请遵循以下原则：
 1. 只基于提供的上下文信息回答问题
@@ -78,6 +123,7 @@ class QAEngine:
         
         messages = [
             {"role": "system", "content": system_prompt},
+            *(history or []),
             {"role": "user", "content": user_prompt}
         ]
         
@@ -98,11 +144,11 @@ class QAEngine:
                 "error": response.get("error", "")
             }
     
-    def batch_answer_questions(self, questions: List[str]) -> List[Dict[str, Any]]:
+    def batch_answer_questions(self, questions: List[str], namespace: Optional[str] = None) -> List[Dict[str, Any]]:
         """批量回答问题"""
         results = []
         for question in questions:
-            result = self.answer_question(question)
+            result = self.answer_question(question, namespace=namespace)
             results.append({
                 "question": question,
                 "success": result["success"],
@@ -112,42 +158,10 @@ class QAEngine:
             })
         return results
     
-    def get_source_summary(self, source_id: str) -> Dict[str, Any]:
-        """获取来源摘要"""
+    def get_source_summary(self, source_id: str, namespace: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+        """获取来源摘要：按顺序读取文档全部块，分组并发摘要后合并，结果按文件内容缓存"""
         try:
-            # 根据source_id检索相关文档块
-            filter_dict = {"source": source_id}
-            search_results = self.vector_db.search("", filter_dict=filter_dict)
-            
-            if not search_results:
-                return {
-                    "success": False,
-                    "message": f"未找到来源: {source_id}"
-                }
-            
-            # 构建摘要
-            summary_prompt = f"""请为以下文档内容生成一个简洁的摘要：
-
-{chr(10).join([result["content"] for result in search_results])}"""
-            
-            messages = [
-                {"role": "system", "content": "你是一个专业的文档摘要助手，请生成简洁、准确的文档摘要。"},
-                {"role": "user", "content": summary_prompt}
-            ]
-            
-            response = zhipu_service.chat_completion(messages)
-            
-            if response["success"]:
-                return {
-                    "success": True,
-                    "summary": response["content"],
-                    "chunks_count": len(search_results)
-                }
-            else:
-                return {
-                    "success": False,
-                    "message": "生成摘要失败"
-                }
+            return self.summarizer.summarize(source_id, namespace=namespace, refresh=refresh)
                 
         except Exception as e:
             error_msg = f"获取摘要失败: {str(e)}"
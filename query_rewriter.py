@@ -0,0 +1,146 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 疑问词、客套语和标点，去掉后得到关键词形式的查询
+_FILLER_PATTERN = re.compile(
+    r'请问|请|帮我|告诉我|一下|这个文档|该文档|文档中|文档里|'
+    r'是什么|什么是|什么|怎么样|怎么|怎样|如何|为什么|为何|哪些|哪个|哪里|多少|是否|有没有|能否|能不能|可以|'
+    r'吗|呢|吧|啊|呀|'
+    r'(?i:\b(?:what|how|why|which|where|when|who|is|are|was|were|do|does|did|can|could|the|a|an)\b)|'
+    r'[？?！!。，,；;：:“”"\'（）()\s]+'
+)
+# “什么是X” / “X是什么” 形式的定义类问题
+_DEFINITION_PATTERN = re.compile(r'^(?:请问)?(?:什么是(.+?)|(.+?)是什么(?:意思)?)[？?。]*$')
+# 并列的多个方面，拆成子查询分别检索
+_CLAUSE_PATTERN = re.compile(r'[，,；;、]|以及')
+
+_REWRITE_PROMPT = """请将用户的问题改写为{count}个不同表述的检索查询，用于在文档库中检索相关内容。
+要求：
+1. 保持原意，可补充同义词或拆分为更具体的子问题
+2. 每行一个查询，不要编号，不要解释
+3. 使用中文"""
+
+class QueryRewriter:
+    """查询改写器 - 为检索生成多个改写查询，带LRU缓存和时间预算"""
+    
+    def __init__(self, mode: str = None, max_rewrites: int = None, cache_size: int = 1000):
+        self.config = system_config
+        self.mode = (mode or self.config.QUERY_REWRITE_MODE).lower()
+        self.max_rewrites = self.config.QUERY_REWRITE_COUNT if max_rewrites is None else max_rewrites
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+    
+    @property
+    def enabled(self) -> bool:
+        """是否启用查询改写"""
+        return self.mode in ("heuristic", "llm") and self.max_rewrites > 0
+    
+    def rewrite(self, question: str, budget_seconds: Optional[float] = None) -> List[str]:
+        """返回原问题及其改写查询（原问题始终在第一位）
+
+        LLM改写超出时间预算时只返回原问题；后台完成的结果仍会写入缓存供下次使用。
+        """
+        question = question.strip()
+        if not self.enabled or not question:
+            return [question]
+            
+        cached = self._get_cached(question)
+        if cached is not None:
+            return [question] + cached
+            
+        if self.mode == "heuristic":
+            rewrites = self._store(question, self._heuristic_rewrites(question))
+            return [question] + rewrites
+            
+        if budget_seconds is None:
+            budget_seconds = self.config.QUERY_TIME_BUDGET_MS * self.config.QUERY_REWRITE_BUDGET_SHARE / 1000
+            
+        future = self._get_executor().submit(self._llm_rewrites, question)
+        future.add_done_callback(lambda done: self._store(question, done.result()) if not done.exception() else None)
+        try:
+            return [question] + self._normalize(question, future.result(timeout=budget_seconds))
+        except FutureTimeoutError:
+            logger.info(f"查询改写超出时间预算({budget_seconds:.2f}s)，仅使用原问题检索")
+            return [question]
+        except Exception as e:
+            logger.warning(f"查询改写失败，仅使用原问题检索: {e}")
+            return [question]
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """按需创建改写线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="query-rewrite")
+        return self._executor
+    
+    def _get_cached(self, question: str) -> Optional[List[str]]:
+        """读取缓存的改写结果"""
+        with self._lock:
+            cached = self._cache.get(question)
+            if cached is not None:
+                self._cache.move_to_end(question)
+            return cached
+    
+    def _store(self, question: str, rewrites: List[str]) -> List[str]:
+        """去重后写入缓存"""
+        rewrites = self._normalize(question, rewrites)
+        with self._lock:
+            self._cache[question] = rewrites
+            self._cache.move_to_end(question)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rewrites
+    
+    def _normalize(self, question: str, rewrites: List[str]) -> List[str]:
+        """去除空白、重复和与原问题相同的改写，并限制数量"""
+        seen = {question.lower()}
+        result = []
+        for rewrite in rewrites:
+            rewrite = rewrite.strip()
+            if rewrite and rewrite.lower() not in seen:
+                seen.add(rewrite.lower())
+                result.append(rewrite)
+        return result[:self.max_rewrites]
+    
+    @staticmethod
+    def _heuristic_rewrites(question: str) -> List[str]:
+        """本地规则改写：关键词形式、定义类问法和并列子问题"""
+        rewrites = []
+        
+        keywords = " ".join(part for part in _FILLER_PATTERN.split(question) if part)
+        if keywords:
+            rewrites.append(keywords)
+            
+        clauses = [clause for clause in _CLAUSE_PATTERN.split(question) if len(clause.strip()) >= 2]
+        if len(clauses) > 1:
+            rewrites.extend(" ".join(part for part in _FILLER_PATTERN.split(clause) if part) for clause in clauses)
+            return rewrites
+            
+        match = _DEFINITION_PATTERN.match(question)
+        if match:
+            subject = (match.group(1) or match.group(2)).strip()
+            rewrites.extend([f"{subject}的定义", f"{subject}是指"])
+            
+        return rewrites
+    
+    def _llm_rewrites(self, question: str) -> List[str]:
+        """调用大模型生成改写查询"""
+        from zhipu_service import zhipu_service
+        
+        messages = [
+            {"role": "system", "content": _REWRITE_PROMPT.format(count=self.max_rewrites)},
+            {"role": "user", "content": question}
+        ]
+        response = zhipu_service.chat_completion(messages, temperature=0.3, max_tokens=200)
+        if not response["success"]:
+            raise RuntimeError(response.get("error", "查询改写请求失败"))
+            
+        return [re.sub(r'^\s*(?:\d+[.、)]|[-*•])\s*', '', line) for line in response["content"].splitlines()]
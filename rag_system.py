@@ -1,26 +1,52 @@
 import os
 import time
+import uuid
 from typing import List, Dict, Any, Optional
 from document_processor import DocumentProcessor
 from vector_db import VectorDBManager
 from qa_engine import QAEngine
+from conversation import ConversationSession
+from document_catalog import DocumentCatalog
+from dedup import ChunkDeduplicator
+from index_snapshot import IndexSnapshot
+from replica import ReplicaVectorDB, READ_ONLY_ERROR, publish_snapshot
+from sharding import ShardedVectorDB
+from embedding_pool import embedding_pool
+from profiler import profiled
 from config import system_config
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+def _same_path(first: str, second: str) -> bool:
+    """两个文件路径是否指向同一位置"""
+    return bool(first) and os.path.normcase(os.path.abspath(first)) == os.path.normcase(os.path.abspath(second))
+
 class RAGSystem:
     """RAG智能问答系统主控制器"""
     
     def __init__(self):
         self.config = system_config
         self.document_processor = DocumentProcessor()
-        self.vector_db = VectorDBManager()
-        self.qa_engine = QAEngine(self.vector_db)
+        # replica 模式只读已发布的快照，不打开ChromaDB
+        self.read_only = self.config.VECTOR_DB_MODE == "replica"
+        if self.read_only:
+            self.vector_db = ReplicaVectorDB()
+        elif self.config.VECTOR_DB_MODE == "sharded":
+            self.vector_db = ShardedVectorDB()
+        else:
+            self.vector_db = VectorDBManager()
+        self.qa_engine = QAEngine(self.vector_db, get_catalog=self.get_catalog)
+        self.deduplicator = ChunkDeduplicator(self.vector_db)
+        self.snapshot = IndexSnapshot(self.vector_db)
+        # 默认命名空间的文档目录；其他命名空间的目录按需打开
+        self.catalog = DocumentCatalog()
+        self._catalogs = {}
+        # 各命名空间的文档版本号：入库、删除、清空等变更后递增，供界面层判断缓存是否失效
+        self._revisions = {}
         
         # 系统状态
         self._initialized = False
-        self._document_count = 0
     
     def initialize(self) -> bool:
         """初始化系统"""
@@ -32,9 +58,14 @@ class RAGSystem:
             if not self.vector_db.initialize():
                 return False
             
-            # 获取现有文档统计
-            self._document_count = self.vector_db.get_document_count()
-            
+            # 已有索引但尚无文档目录时（旧版本数据），从块元数据重建一次
+            if not self.read_only and self.catalog.count() == 0 and self.vector_db.get_document_count() > 0:
+                self.catalog.rebuild(self.vector_db.iter_chunks())
+                
+            # 启用嵌入进程池时预先启动各通道的子进程并加载模型，避免首个查询等待
+            if embedding_pool.enabled:
+                embedding_pool.start()
+                
             self._initialized = True
             logger.info("RAG系统初始化完成")
             return True
@@ -44,10 +75,45 @@ class RAGSystem:
             logger.error(error_msg)
             return False
     
-    def add_document(self, file_path: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """添加文档到系统"""
+    def get_catalog(self, namespace: Optional[str] = None) -> DocumentCatalog:
+        """获取命名空间对应的文档目录（只读副本使用当前快照中的目录）"""
+        if self.read_only:
+            return self.vector_db.get_catalog(namespace)
+            
+        name = namespace or self.config.DEFAULT_NAMESPACE
+        if name == self.config.DEFAULT_NAMESPACE:
+            return self.catalog
+        
+        if name not in self._catalogs:
+            self._catalogs[name] = DocumentCatalog(namespace=VectorDBManager.validate_namespace(name))
+        return self._catalogs[name]
+    
+    def get_revision(self, namespace: Optional[str] = None) -> int:
+        """命名空间的文档版本号，内容未变更时保持不变"""
+        if self.read_only:
+            return self.vector_db.snapshot_generation(namespace)
+        return self._revisions.get(namespace or self.config.DEFAULT_NAMESPACE, 0)
+    
+    def _bump_revision(self, namespace: Optional[str] = None) -> None:
+        """标记命名空间内容已变更"""
+        name = namespace or self.config.DEFAULT_NAMESPACE
+        self._revisions[name] = self._revisions.get(name, 0) + 1
+    
+    def list_namespaces(self) -> List[str]:
+        """列出所有命名空间（默认命名空间始终在列）"""
+        return sorted(set(self.vector_db.list_namespaces()) | {self.config.DEFAULT_NAMESPACE})
+    
+    @profiled("ingest", track_memory=True, path_label=True)
+    def add_document(self, file_path: str, metadata: Optional[Dict[str, Any]] = None,
+                     namespace: Optional[str] = None, replace: bool = False) -> Dict[str, Any]:
+        """添加文档到系统
+
+        文档来源按文件名登记；已有同名文档来自另一路径时拒绝添加，replace 为True时用新文件替换。
+        """
         if not self._initialized:
             return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
         
         try:
             # 处理文档
@@ -55,29 +121,196 @@ class RAGSystem:
             
             if not document_data["success"]:
                 return document_data
+                
+            # 不同目录下的同名文件会登记为同一来源，不能静默覆盖
+            source = document_data["metadata"]["source"]
+            existing = self.get_catalog(namespace).get_document(source)
+            if existing and not replace and not _same_path(existing["file_path"], file_path):
+                return {
+                    "success": False,
+                    "error": f"已存在同名文档 {source}（来自 {existing['file_path']}），"
+                             f"如需用 {file_path} 替换请使用替换文档功能"
+                }
+                
+            # 添加到向量数据库并登记到文档目录
+            result = self._ingest(document_data, namespace)
+            logger.info(f"文档添加成功: {os.path.basename(file_path)}")
+            return result
+            
+        except Exception as e:
+            error_msg = f"文档处理失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def _ingest(self, document_data: Dict[str, Any], namespace: Optional[str] = None) -> Dict[str, Any]:
+        """写入向量数据库，并在同一事务中更新文档目录
+        
+        同名文档已存在时，新版本以新的块ID写入，目录切换到新版本并提交后再删除旧块；
+        任一步失败时只需删除新写入的块，旧版本保持完整可用。
+        启用去重（DEDUP_ENABLED）时，与已有内容重复的块不再写入，只在目录中记录引用。
+        """
+        chunks = document_data["chunks"]
+        file_metadata = document_data.get("metadata", {})
+        source = file_metadata["source"]
+        record = {
+            **file_metadata,
+            "chunk_count": len(chunks),
+            "ingested_at": time.time()
+        }
+        
+        is_new = True
+        written = False
+        chunk_ids = []
+        stale_ids = []
+        copied = []
+        try:
+            with self.get_catalog(namespace).transaction() as catalog:
+                old_ids = catalog.get_chunk_ids(source)
+                is_new = not old_ids and not catalog.get_ref_ids(source)
+                if not is_new:
+                    version = uuid.uuid4().hex[:8]
+                    chunks = [{**chunk, "id": f"{chunk['id']}-{version}"} for chunk in chunks]
+                catalog.set_refs(source, [])
+                
+                stored, refs, fingerprints = chunks, {}, []
+                if self.config.DEDUP_ENABLED:
+                    dedup = self.deduplicator.deduplicate(chunks, source, catalog, namespace)
+                    stored, refs, fingerprints = dedup["unique"], dedup["refs"], dedup["fingerprints"]
+                chunk_ids = [chunk["id"] for chunk in stored]
+                
+                # 旧块提交后全部删除：其他文档对旧块的引用改指向内容相同的新块，没有相同内容的先转交给引用方
+                new_by_hash = {row[1]: row[0] for row in fingerprints}
+                redirects = {chunk_id: new_by_hash[content_hash]
+                             for chunk_id, content_hash in catalog.get_content_hashes(old_ids).items()
+                             if content_hash in new_by_hash}
+                catalog.redirect_refs(redirects, exclude_source=source)
+                self._hand_over(catalog, source, [chunk_id for chunk_id in old_ids if chunk_id not in redirects],
+                                namespace, copied)
+                
+                stale_ids = old_ids
+                catalog.upsert_document(record, chunk_ids)
+                catalog.set_refs(source, sorted(set(refs.values())))
+                catalog.set_chunk_order(source, [refs.get(chunk["id"], chunk["id"]) for chunk in chunks])
+                catalog.remove_fingerprints(stale_ids)
+                catalog.add_fingerprints(fingerprints)
+                
+                result = {"success": True, "count": 0}
+                if stored:
+                    written = True
+                    result = self.vector_db.add_documents(
+                        documents=stored, metadata=file_metadata, upsert=True, namespace=namespace
+                    )
+                    if not result["success"]:
+                        # 抛出异常以回滚目录记录
+                        raise RuntimeError(result["error"])
+        except Exception:
+            if written:
+                # 新块使用新ID，撤销（可能只写入了一部分的）新块不影响仍在目录中的旧版本
+                self.vector_db.delete_documents(chunk_ids, namespace=namespace)
+            if copied:
+                # 目录已回滚，转交时复制的块没有登记，一并删除
+                self.vector_db.delete_documents(copied, namespace=namespace)
+            raise
+        finally:
+            self._bump_revision(namespace)
             
-            # 添加到向量数据库
-            result = self.vector_db.add_documents(
-                documents=document_data["chunks"],
-                metadata=document_data.get("metadata", {})
-            )
+        stale_error = None
+        if stale_ids:
+            deleted = self.vector_db.delete_documents(stale_ids, namespace=namespace)
+            if not deleted["success"]:
+                # 目录已切换到新版本；旧块仍在向量库中，可能与新版本一起出现在检索结果里
+                stale_error = f"旧版本的 {len(stale_ids)} 个文档块删除失败: {deleted['error']}"
+                logger.error(f"{source} {stale_error}")
+                
+        # 对外报告文档的总块数，其中重复的块只记录引用
+        result["count"] = len(chunks)
+        result["duplicates"] = len(chunks) - len(chunk_ids)
+        result["message"] = f"成功添加 {len(chunks)} 个文档块" + (
+            f"（其中 {result['duplicates']} 个与已有内容重复，仅记录引用）" if result["duplicates"] else "")
+        result["replaced"] = not is_new
+        if stale_error:
+            result["warning"] = stale_error
+        return result
+    
+    def _hand_over(self, catalog: DocumentCatalog, source: str, chunk_ids: List[str],
+                   namespace: Optional[str] = None, copied: Optional[List[str]] = None) -> None:
+        """把文档中仍被其他文档引用的块复制给引用方（复用已存储的向量），之后原块可以安全删除或覆盖
+        
+        复制出的新块ID在写入向量库之前追加到 copied，目录事务回滚时由调用方删除。
+        """
+        moves = catalog.hand_over_chunks(source, chunk_ids)
+        if not moves:
+            return
             
-            if result["success"]:
-                self._document_count += 1
-                logger.info(f"文档添加成功: {os.path.basename(file_path)}")
+        if copied is not None:
+            copied.extend(new_id for new_id, _ in moves.values())
+        metadata_updates = {}
+        for new_id, owner in moves.values():
+            document = catalog.get_document(owner) or {"source": owner}
+            metadata_updates[new_id] = {
+                field: document[field] for field in ("source", "file_path", "file_type", "file_hash") if field in document
+            }
+        result = self.vector_db.copy_chunks({old_id: new_id for old_id, (new_id, _) in moves.items()},
+                                            metadata_updates, namespace=namespace)
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+        logger.info(f"{source} 的 {len(moves)} 个文档块仍被其他文档引用，已转交")
+    
+    def replace_document(self, file_path: str, metadata: Optional[Dict[str, Any]] = None,
+                         namespace: Optional[str] = None) -> Dict[str, Any]:
+        """用新文件替换同名文档：写入新版本的块后删除旧块，只涉及该文档的块"""
+        result = self.add_document(file_path, metadata, namespace, replace=True)
+        if result["success"] and result.get("replaced"):
+            result["message"] = f"成功替换文档 {os.path.basename(file_path)}，共 {result['count']} 个文档块"
+        return result
+    
+    def delete_document(self, source: str, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """按来源删除文档及其全部文档块"""
+        if not self._initialized:
+            return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+        
+        try:
+            catalog = self.get_catalog(namespace)
+            if catalog.get_document(source) is None:
+                return {"success": False, "error": f"未找到文档: {source}"}
             
-            return result
+            copied = []
+            try:
+                with catalog.transaction():
+                    chunk_ids = catalog.get_chunk_ids(source)
+                    self._hand_over(catalog, source, chunk_ids, namespace, copied)
+                    catalog.remove_document(source)
+                    catalog.remove_fingerprints(chunk_ids)
+                    if chunk_ids:
+                        result = self.vector_db.delete_documents(chunk_ids, namespace=namespace)
+                        if not result["success"]:
+                            raise RuntimeError(result["error"])
+            except Exception:
+                if copied:
+                    # 目录已回滚，文档仍引用原块，转交时复制的块一并删除
+                    self.vector_db.delete_documents(copied, namespace=namespace)
+                raise
+            
+            self._bump_revision(namespace)
+            logger.info(f"文档已删除: {source} ({len(chunk_ids)} 个文档块)")
+            return {
+                "success": True,
+                "message": f"成功删除文档 {source}，共 {len(chunk_ids)} 个文档块",
+                "count": len(chunk_ids)
+            }
             
         except Exception as e:
-            error_msg = f"文档处理失败: {str(e)}"
+            error_msg = f"删除文档失败: {str(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
     
-    def batch_add_documents(self, file_paths: List[str]) -> List[Dict[str, Any]]:
+    def batch_add_documents(self, file_paths: List[str], namespace: Optional[str] = None) -> List[Dict[str, Any]]:
         """批量添加文档"""
         results = []
         for file_path in file_paths:
-            result = self.add_document(file_path)
+            result = self.add_document(file_path, namespace=namespace)
             results.append({
                 "file_path": file_path,
                 "success": result["success"],
@@ -86,8 +319,125 @@ class RAGSystem:
             })
         return results
     
-    def query(self, question: str, top_k: Optional[int] = None) -> Dict[str, Any]:
-        """查询问题"""
+    @profiled("rechunk", track_memory=True)
+    def rechunk_from_cache(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """仅使用已缓存的提取文本，按当前分块配置逐个重建命名空间内的文档（不影响其他命名空间）"""
+        if not self._initialized:
+            return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+        
+        try:
+            documents = self.get_catalog(namespace).list_documents()
+            if not documents:
+                return {"success": False, "error": "当前命名空间中暂无文档，请先添加文档"}
+            
+            chunk_count = 0
+            failed = []
+            for doc in documents:
+                sections = self.document_processor.cached_sections(doc["file_path"], doc["file_hash"])
+                if sections is None:
+                    logger.warning(f"文档缺少文本缓存，跳过重新分块: {doc['source']}")
+                    failed.append(doc["source"])
+                    continue
+                
+                document_data = self.document_processor.process_sections(
+                    sections,
+                    doc["file_path"],
+                    {"file_hash": doc["file_hash"], "size_bytes": doc["size_bytes"]}
+                )
+                if not document_data["success"]:
+                    failed.append(doc["source"])
+                    continue
+                
+                # 按来源替换：新块写入并切换目录后删除旧块
+                try:
+                    chunk_count += self._ingest(document_data, namespace)["count"]
+                except Exception as e:
+                    logger.error(f"重新分块写入失败 {doc['source']}: {e}")
+                    failed.append(doc["source"])
+            
+            document_count = len(documents) - len(failed)
+            message = f"已从缓存重新分块 {document_count} 个文档，共 {chunk_count} 个文档块"
+            logger.info(message)
+            return {
+                "success": True,
+                "message": message,
+                "document_count": document_count,
+                "chunk_count": chunk_count,
+                "failed": failed
+            }
+            
+        except Exception as e:
+            error_msg = f"重新分块失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def rebuild_index(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """按当前HNSW参数重建命名空间的向量索引（文档目录和块ID不变）"""
+        if not self._initialized:
+            return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+            
+        result = self.vector_db.rebuild_index(namespace)
+        if result["success"]:
+            self._bump_revision(namespace)
+            self.vector_db.warm_up(namespace)
+        return result
+    
+    def export_index(self, path: str, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """把命名空间的文档块、向量和文档目录导出为快照"""
+        if not self._initialized:
+            return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+            
+        return self.snapshot.export_snapshot(path, self.get_catalog(namespace), namespace)
+    
+    def publish_snapshot(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """导出并发布新快照，供只读副本切换（只应由唯一的入库进程调用）"""
+        if not self._initialized:
+            return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+            
+        return publish_snapshot(self.snapshot, self.get_catalog(namespace), namespace)
+    
+    @profiled("import", track_memory=True, path_label=True)
+    def import_index(self, path: str, namespace: Optional[str] = None, force: bool = False) -> Dict[str, Any]:
+        """从快照批量导入，替换命名空间中的全部文档（不重新计算嵌入）"""
+        if not self._initialized:
+            return {"success": False, "error": "系统未初始化"}
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+            
+        try:
+            catalog = self.get_catalog(namespace)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        result = self.snapshot.import_snapshot(path, catalog, namespace, force=force)
+        if result["success"]:
+            self.deduplicator.invalidate(namespace)
+            self._bump_revision(namespace)
+            self.vector_db.warm_up(namespace)
+        return result
+    
+    def summarize_document(self, source: str, namespace: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+        """生成整篇文档的摘要（同一文件内容只生成一次）"""
+        if not self._initialized:
+            return {"success": False, "message": "系统未初始化"}
+            
+        return self.qa_engine.get_source_summary(source, namespace=namespace, refresh=refresh)
+    
+    def create_conversation(self, namespace: Optional[str] = None) -> ConversationSession:
+        """创建多轮对话会话（绑定命名空间）"""
+        return ConversationSession(self.qa_engine, namespace=namespace)
+    
+    @profiled("query")
+    def query(self, question: str, top_k: Optional[int] = None, namespace: Optional[str] = None,
+              conversation: Optional[ConversationSession] = None) -> Dict[str, Any]:
+        """查询问题（只检索指定命名空间）；传入 conversation 时作为该会话的下一轮提问"""
         if not self._initialized:
             return {
                 "success": False, 
@@ -95,50 +445,80 @@ class RAGSystem:
                 "sources": []
             }
         
-        if self._document_count == 0:
+        if conversation is not None:
+            namespace = conversation.namespace
+        try:
+            document_count = self.get_catalog(namespace).count()
+        except ValueError as e:
+            return {"success": False, "answer": str(e), "sources": []}
+        
+        if document_count == 0:
             return {
                 "success": False,
                 "answer": "系统中暂无文档，请先添加文档后再提问",
                 "sources": []
             }
         
-        return self.qa_engine.answer_question(question, top_k)
+        if conversation is not None:
+            answer_data = conversation.ask(question, top_k)
+        else:
+            answer_data = self.qa_engine.answer_question(question, top_k, namespace=namespace)
+        self._annotate_sources(answer_data.get("sources", []), namespace)
+        return answer_data
     
-    def get_system_status(self) -> Dict[str, Any]:
+    def _annotate_sources(self, sources: List[Dict[str, Any]], namespace: Optional[str] = None) -> None:
+        """去重后一个文档块可能同时属于多个文档，在来源中补充 also_in（其他包含该内容的文档）"""
+        if not sources:
+            return
+            
+        all_sources = self.get_catalog(namespace).sources_for_chunks([source["id"] for source in sources if "id" in source])
+        for source in sources:
+            others = [name for name in all_sources.get(source.get("id"), []) if name != source["metadata"].get("source")]
+            if others:
+                source["also_in"] = others
+    
+    def get_system_status(self, namespace: Optional[str] = None) -> Dict[str, Any]:
         """获取系统状态"""
-        db_status = self.vector_db.get_status()
+        catalog = self.get_catalog(namespace)
+        db_status = self.vector_db.get_status(namespace)
         
         return {
             "initialized": self._initialized,
-            "document_count": self._document_count,
+            "namespace": catalog.namespace,
+            "document_count": catalog.count(),
+            "chunk_count": catalog.total_chunks(),
             "vector_db": db_status,
             "config": {
                 "embedding_model": self.config.EMBEDDING_MODEL_NAME,
                 "llm_model": self.config.LLM_MODEL,
                 "chunk_size": self.config.CHUNK_SIZE,
-                "similarity_threshold": self.config.SIMILARITY_THRESHOLD
+                "similarity_threshold": self.config.SIMILARITY_THRESHOLD,
+                "retrieval_cutoff": self.config.RETRIEVAL_CUTOFF
             }
         }
     
-    def clear_documents(self) -> Dict[str, Any]:
-        """清空所有文档"""
+    def clear_documents(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """清空命名空间中的所有文档"""
+        if self.read_only:
+            return {"success": False, "error": READ_ONLY_ERROR}
+        
         try:
-            result = self.vector_db.clear_collection()
+            catalog = self.get_catalog(namespace)
+            result = self.vector_db.clear_collection(namespace)
             if result["success"]:
-                self._document_count = 0
-                logger.info("所有文档已清空")
+                catalog.clear()
+                self._bump_revision(namespace)
+                logger.info(f"命名空间 {catalog.namespace} 的文档已清空")
             return result
         except Exception as e:
             error_msg = f"清空文档失败: {str(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
     
-    def get_document_sources(self) -> List[Dict[str, Any]]:
+    def get_document_sources(self, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取所有文档来源"""
         try:
-            # 这里可以实现获取所有文档来源的逻辑
-            # 由于ChromaDB的限制，可能需要维护一个单独的文档索引
-            return []
+            return self.get_catalog(namespace).list_documents()
         except Exception as e:
             logger.error(f"获取文档来源失败: {e}")
             return []
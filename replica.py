@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+只读查询副本 - 多个查询进程共享同一台机器上由入库进程发布的索引快照
+
+入库进程（VECTOR_DB_MODE=local）执行 publish，把命名空间导出为 REPLICA_SNAPSHOT_DIR/<命名空间>/<快照名>，
+写完后原子更新同目录下的 CURRENT 指针。查询进程以 VECTOR_DB_MODE=replica 启动，不打开ChromaDB，也不写入索引和文档目录：
+向量矩阵以内存映射方式读取（多个副本共享操作系统页缓存中的同一份数据），按 REPLICA_REFRESH_SECONDS
+检查指针并切换到新快照，切换前正在进行的查询继续使用旧快照。
+
+用法:
+    python replica.py publish [--namespace 命名空间]
+"""
+
+import os
+import json
+import gzip
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+from vector_db import VectorDBManager
+from document_catalog import DocumentCatalog
+from index_snapshot import read_manifest, EMBEDDINGS_FILE, CHUNKS_FILE, CATALOG_FILE
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+POINTER_FILE = "CURRENT"
+
+READ_ONLY_ERROR = "只读副本不支持写入，请在入库进程中操作后发布快照"
+
+# 暴力检索时每次参与矩阵乘法的向量行数，限制临时内存
+_SEARCH_BLOCK_ROWS = 65536
+
+def _namespace_dir(namespace: str) -> str:
+    """命名空间的快照发布目录"""
+    return os.path.join(system_config.REPLICA_SNAPSHOT_DIR, namespace)
+
+def current_snapshot(namespace: str) -> Optional[str]:
+    """读取命名空间当前发布的快照名，尚未发布时返回None"""
+    try:
+        with open(os.path.join(_namespace_dir(namespace), POINTER_FILE), 'r', encoding='utf-8') as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def publish_snapshot(snapshot, catalog, namespace: Optional[str] = None) -> Dict[str, Any]:
+    """导出新快照并切换 CURRENT 指针（只应由唯一的入库进程调用），随后清理多余的旧快照"""
+    name = namespace or system_config.DEFAULT_NAMESPACE
+    root = _namespace_dir(name)
+    snapshot_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(root, snapshot_name)
+    
+    result = snapshot.export_snapshot(path, catalog, name)
+    if not result["success"]:
+        shutil.rmtree(path, ignore_errors=True)
+        return result
+    
+    # 指针原子替换，副本不会读到写了一半的内容
+    tmp_path = os.path.join(root, f"{POINTER_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(snapshot_name)
+    os.replace(tmp_path, os.path.join(root, POINTER_FILE))
+    
+    # 连同当前快照共保留 REPLICA_KEEP_SNAPSHOTS 个；已打开旧快照的副本持有内存映射，删除目录不影响其继续查询
+    older = sorted(entry for entry in os.listdir(root)
+                   if entry != snapshot_name and os.path.isdir(os.path.join(root, entry)))
+    for old in older[:max(len(older) - system_config.REPLICA_KEEP_SNAPSHOTS + 1, 0)]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    
+    message = f"已发布快照 {snapshot_name}（{result['count']} 个文档块）"
+    logger.info(f"{name}: {message}")
+    return {**result, "message": message, "snapshot": snapshot_name}
+
+class ReplicaSnapshot:
+    """已加载的只读快照：向量矩阵为内存映射，文档块内容和元数据常驻内存"""
+    
+    def __init__(self, path: str, namespace: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        manifest = read_manifest(path)
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode='r')
+        
+        self.ids, self.documents, self.metadatas = [], [], []
+        with gzip.open(os.path.join(path, CHUNKS_FILE), 'rt', encoding='utf-8') as chunks_file:
+            for line in chunks_file:
+                chunk = json.loads(line)
+                self.ids.append(chunk["id"])
+                self.documents.append(chunk["content"])
+                self.metadatas.append(chunk["metadata"])
+        if len(self.ids) != manifest["count"] or self.embeddings.shape[0] != manifest["count"]:
+            raise ValueError(f"快照 {self.name} 的文档块数与清单不一致")
+            
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        # 分块计算向量范数，同时把向量页读入页缓存
+        self.norms = np.concatenate([
+            np.linalg.norm(self.embeddings[start:start + _SEARCH_BLOCK_ROWS], axis=1)
+            for start in range(0, len(self.ids), _SEARCH_BLOCK_ROWS)
+        ] or [np.zeros(0)]).astype(np.float32)
+        self.catalog = DocumentCatalog(os.path.join(path, CATALOG_FILE), namespace=namespace, read_only=True)
+    
+    def filter_rows(self, filter_dict: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """按元数据等值条件筛选行号；无条件时返回None（表示全部行）"""
+        if not filter_dict:
+            return None
+            
+        conditions = {}
+        for key, value in filter_dict.items():
+            if isinstance(value, dict):
+                if set(value) != {"$eq"}:
+                    raise ValueError(f"只读副本只支持按元数据等值过滤: {key}")
+                value = value["$eq"]
+            conditions[key] = value
+        return np.array([
+            row for row, metadata in enumerate(self.metadatas)
+            if all((metadata or {}).get(key) == value for key, value in conditions.items())
+        ], dtype=np.int64)
+    
+    def search(self, query_embeddings: np.ndarray, top_k: int,
+               rows: Optional[np.ndarray] = None) -> List[List[tuple]]:
+        """精确余弦检索，按块分批计算并合并各批的top-k；每个查询返回按相似度降序的 [(行号, 相似度)]"""
+        total = len(self.ids) if rows is None else len(rows)
+        query_norms = np.maximum(np.linalg.norm(query_embeddings, axis=1), 1e-12)
+        best_rows = np.empty((len(query_embeddings), 0), dtype=np.int64)
+        best_scores = np.empty((len(query_embeddings), 0), dtype=np.float32)
+        
+        for start in range(0, total, _SEARCH_BLOCK_ROWS):
+            if rows is None:
+                block_rows = np.arange(start, min(start + _SEARCH_BLOCK_ROWS, total))
+                block = self.embeddings[start:start + _SEARCH_BLOCK_ROWS]
+            else:
+                block_rows = rows[start:start + _SEARCH_BLOCK_ROWS]
+                block = self.embeddings[block_rows]
+            scores = (query_embeddings @ block.T) / np.maximum(np.outer(query_norms, self.norms[block_rows]), 1e-12)
+            
+            best_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1)
+            best_scores = np.concatenate([best_scores, scores.astype(np.float32)], axis=1)
+            if best_scores.shape[1] > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        return [
+            list(zip(np.take(best_rows[q], order[q]).tolist(), np.take(best_scores[q], order[q]).tolist()))
+            for q in range(len(query_embeddings))
+        ]
+
+class ReplicaVectorDB(VectorDBManager):
+    """只读副本的向量数据库 - 从已发布的快照检索，所有写入操作返回失败"""
+    
+    def __init__(self):
+        super().__init__()
+        self._snapshots: Dict[str, ReplicaSnapshot] = {}
+        self._empty_catalogs: Dict[str, DocumentCatalog] = {}
+        self._generations: Dict[str, int] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._refresh_lock = threading.Lock()
+    
+    def initialize(self) -> bool:
+        """初始化：只加载默认命名空间的当前快照，不打开ChromaDB"""
+        self._snapshots.clear()
+        self._checked_at.clear()
+        self._initialized = True
+        snapshot = self._snapshot()
+        logger.info(f"只读副本初始化完成，快照: {snapshot.name if snapshot else '尚未发布'}")
+        return True
+    
+    def _snapshot(self, namespace: Optional[str] = None) -> Optional[ReplicaSnapshot]:
+        """命名空间当前使用的快照；距上次检查超过 REPLICA_REFRESH_SECONDS 时检查是否有新发布的快照"""
+        name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+        now = time.monotonic()
+        if now - self._checked_at.get(name, float("-inf")) >= self.config.REPLICA_REFRESH_SECONDS:
+            # 同一时间只有一个线程加载新快照，其他线程继续使用旧快照
+            if self._refresh_lock.acquire(blocking=name not in self._snapshots):
+                try:
+                    self._checked_at[name] = now
+                    self._refresh(name)
+                finally:
+                    self._refresh_lock.release()
+        return self._snapshots.get(name)
+    
+    def _refresh(self, name: str) -> None:
+        """指针指向的快照与已加载的不同时加载并切换"""
+        snapshot_name = current_snapshot(name)
+        loaded = self._snapshots.get(name)
+        if snapshot_name is None or (loaded is not None and loaded.name == snapshot_name):
+            return
+            
+        try:
+            start = time.perf_counter()
+            self._snapshots[name] = ReplicaSnapshot(os.path.join(_namespace_dir(name), snapshot_name), name)
+            self._generations[name] = self._generations.get(name, 0) + 1
+            self._invalidate(name)
+            logger.info(f"{name}: 已切换到快照 {snapshot_name}（{len(self._snapshots[name].ids)} 个文档块，"
+                        f"加载 {time.perf_counter() - start:.1f}s）")
+        except Exception as e:
+            logger.warning(f"{name}: 加载快照 {snapshot_name} 失败，继续使用当前快照: {e}")
+    
+    def snapshot_generation(self, namespace: Optional[str] = None) -> int:
+        """命名空间已切换快照的次数，供上层判断缓存是否失效"""
+        self._snapshot(namespace)
+        return self._generations.get(namespace or self.config.DEFAULT_NAMESPACE, 0)
+    
+    def get_catalog(self, namespace: Optional[str] = None) -> DocumentCatalog:
+        """当前快照中的只读文档目录；尚未发布快照时返回空目录"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is not None:
+            return snapshot.catalog
+        name = namespace or self.config.DEFAULT_NAMESPACE
+        if name not in self._empty_catalogs:
+            self._empty_catalogs[name] = DocumentCatalog(":memory:", namespace=name)
+        return self._empty_catalogs[name]
+    
+    def get_collection(self, namespace: Optional[str] = None):
+        """只读副本不打开ChromaDB集合"""
+        raise RuntimeError("只读副本没有ChromaDB集合")
+    
+    def _read_only(self) -> Dict[str, Any]:
+        """写入操作的统一返回"""
+        return {"success": False, "error": READ_ONLY_ERROR}
+    
+    def add_documents(self, documents: List[Dict[str, Any]], metadata: Dict[str, Any] = None,
+                      upsert: bool = False, namespace: Optional[str] = None) -> Dict[str, Any]:
+        return self._read_only()
+    
+    def copy_chunks(self, id_map: Dict[str, str], metadata_updates: Dict[str, Dict[str, Any]] = None,
+                    namespace: Optional[str] = None) -> Dict[str, Any]:
+        return self._read_only()
+    
+    def delete_documents(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, Any]:
+        return self._read_only()
+    
+    def clear_collection(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        return self._read_only()
+    
+    def rebuild_index(self, namespace: Optional[str] = None, batch_size: int = 1000) -> Dict[str, Any]:
+        return self._read_only()
+    
+    def bulk_load(self, batches, namespace: Optional[str] = None) -> Dict[str, Any]:
+        return self._read_only()
+    
+    def index_params_outdated(self, namespace: Optional[str] = None) -> bool:
+        """副本使用精确检索，没有HNSW参数"""
+        return False
+    
+    def warm_up(self, namespace: Optional[str] = None) -> float:
+        """加载快照（计算范数时已把向量读入页缓存）；返回耗时（秒）"""
+        start = time.perf_counter()
+        self._snapshot(namespace)
+        return time.perf_counter() - start
+    
+    def list_namespaces(self) -> List[str]:
+        """列出已发布过快照的命名空间"""
+        root = self.config.REPLICA_SNAPSHOT_DIR
+        if not os.path.isdir(root):
+            return []
+        return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, POINTER_FILE)))
+    
+    def _query(self, query_embeddings: np.ndarray, top_k: int, filter_dict: Dict[str, Any] = None,
+               namespace: Optional[str] = None) -> Dict[str, List[List[Any]]]:
+        """在内存映射的向量上精确检索，结果格式与ChromaDB query一致（余弦距离 = 1 - 相似度）"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is None:
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            
+        matches = snapshot.search(query_embeddings, top_k, snapshot.filter_rows(filter_dict))
+        return {
+            "ids": [[snapshot.ids[row] for row, _ in hits] for hits in matches],
+            "documents": [[snapshot.documents[row] for row, _ in hits] for hits in matches],
+            "metadatas": [[snapshot.metadatas[row] for row, _ in hits] for hits in matches],
+            "distances": [[1.0 - score for _, score in hits] for hits in matches]
+        }
+    
+    def get_document_count(self, namespace: Optional[str] = None) -> int:
+        """当前快照中的文档块数量"""
+        if not self._initialized:
+            return 0
+        snapshot = self._snapshot(namespace)
+        return len(snapshot.ids) if snapshot is not None else 0
+    
+    def get_embeddings(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """读取指定文档块的向量（float32副本），不存在的ID不出现在结果中"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is None:
+            return {}
+        return {
+            chunk_id: np.array(snapshot.embeddings[snapshot.rows[chunk_id]], dtype=np.float32)
+            for chunk_id in ids if chunk_id in snapshot.rows
+        }
+    
+    def get_chunks_by_ids(self, ids: List[str], namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按ID读取文档块的内容和元数据"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is None:
+            return []
+        return [
+            {"id": chunk_id, "content": snapshot.documents[row], "metadata": snapshot.metadatas[row]}
+            for chunk_id in ids for row in [snapshot.rows.get(chunk_id)] if row is not None
+        ]
+    
+    def get_chunks(self, source: str, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按原文顺序获取某个来源的全部文档块"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is None:
+            return []
+        rows = snapshot.filter_rows({"source": source})
+        chunks = [{"id": snapshot.ids[row], "content": snapshot.documents[row], "metadata": snapshot.metadatas[row]}
+                  for row in rows.tolist()]
+        return sorted(chunks, key=lambda chunk: chunk["metadata"].get("chunk_index", 0))
+    
+    def iter_chunks(self, batch_size: int = 1000, namespace: Optional[str] = None):
+        """遍历快照中所有文档块的 (ID, 元数据)"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is not None:
+            yield from zip(snapshot.ids, snapshot.metadatas)
+    
+    def iter_records(self, batch_size: int = 1000, namespace: Optional[str] = None):
+        """分批遍历快照，格式与 VectorDBManager.iter_records 一致"""
+        snapshot = self._snapshot(namespace)
+        if snapshot is None:
+            return
+        for start in range(0, len(snapshot.ids), batch_size):
+            yield {
+                "ids": snapshot.ids[start:start + batch_size],
+                "embeddings": snapshot.embeddings[start:start + batch_size],
+                "documents": snapshot.documents[start:start + batch_size],
+                "metadatas": snapshot.metadatas[start:start + batch_size]
+            }
+    
+    def get_status(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """获取只读副本状态"""
+        if not self._initialized:
+            return {"initialized": False}
+            
+        name = namespace or self.config.DEFAULT_NAMESPACE
+        snapshot = self._snapshot(name)
+        return {
+            "initialized": True,
+            "document_count": self.get_document_count(name),
+            "collection_name": name,
+            "namespace": name,
+            "embedding_model": self.config.EMBEDDING_MODEL_NAME,
+            "index_params": {},
+            "index_params_outdated": False,
+            "mode": "replica",
+            "snapshot": snapshot.name if snapshot is not None else None
+        }
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="只读查询副本的快照发布")
+    parser.add_argument("command", choices=["publish"], help="publish 导出并发布当前索引的新快照")
+    parser.add_argument("--namespace", default=system_config.DEFAULT_NAMESPACE, help="命名空间")
+    args = parser.parse_args()
+    
+    from index_snapshot import IndexSnapshot
+    
+    vector_db = VectorDBManager()
+    if not vector_db.initialize():
+        print("❌ 向量数据库初始化失败")
+        return
+    
+    result = publish_snapshot(IndexSnapshot(vector_db), DocumentCatalog(namespace=args.namespace), args.namespace)
+    if result["success"]:
+        print(f"✅ {result['message']}")
+    else:
+        print(f"❌ {result['error']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import re
+import numpy as np
+from typing import List, Callable, Optional
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 句子边界：中文句末标点（含后随引号/括号）、英文句末标点后接空白、换行；边界后的空白归入前一句
+_SENTENCE_BOUNDARY = re.compile(r'([。！？；]+[”’」』）)]*\s*|[.!?;]+["\')\]]*\s+|\n\s*)')
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句子边界切分文本，句子保留原有标点和空白，拼接后与原文一致"""
+    parts = _SENTENCE_BOUNDARY.split(text)
+    sentences = []
+    buffer = ""
+    for i, part in enumerate(parts):
+        buffer += part
+        # 奇数位置是边界本身，边界之后结束当前句子
+        if i % 2 == 1:
+            if buffer.strip():
+                sentences.append(buffer)
+                buffer = ""
+    if buffer.strip():
+        sentences.append(buffer)
+    elif buffer and sentences:
+        sentences[-1] += buffer
+    return sentences
+
+class SentenceTextSplitter:
+    """句子边界分块器 - 以完整句子为单位打包分块，重叠部分也是完整句子"""
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int,
+                 length_function: Callable[[str], int] = len,
+                 batch_length_function: Optional[Callable[[List[str]], List[int]]] = None,
+                 fallback_splitter=None):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function
+        self.batch_length_function = batch_length_function
+        # 单句超过块大小时用于硬切分的分块器
+        self.fallback_splitter = fallback_splitter
+    
+    def split_text(self, text: str) -> List[str]:
+        """将文本切分为块"""
+        sentences = split_sentences(text)
+        if not sentences:
+            return []
+        return self._pack(sentences, self._measure(sentences), breakpoints=set())
+    
+    def _measure(self, sentences: List[str]) -> List[int]:
+        """计算每个句子的长度，支持批量计数时一次完成"""
+        if self.batch_length_function is not None:
+            return self.batch_length_function(sentences)
+        return [self.length_function(sentence) for sentence in sentences]
+    
+    def _pack(self, sentences: List[str], lengths: List[int], breakpoints: set) -> List[str]:
+        """按块大小打包句子；breakpoints 中的句子下标之前强制断开"""
+        chunks = []
+        current, current_lengths = [], []
+        
+        def flush():
+            chunk = "".join(current).strip()
+            if chunk:
+                chunks.append(chunk)
+                
+        for i, (sentence, length) in enumerate(zip(sentences, lengths)):
+            if length > self.chunk_size:
+                # 超长句子单独硬切分
+                if current:
+                    flush()
+                    current, current_lengths = [], []
+                chunks.extend(self._split_long_sentence(sentence))
+                continue
+                
+            if current and (i in breakpoints or sum(current_lengths) + length > self.chunk_size):
+                flush()
+                if i in breakpoints:
+                    current, current_lengths = [], []
+                else:
+                    current, current_lengths = self._overlap_tail(current, current_lengths, length)
+                    
+            current.append(sentence)
+            current_lengths.append(length)
+            
+        if current:
+            flush()
+        return chunks
+    
+    def _overlap_tail(self, sentences: List[str], lengths: List[int], next_length: int):
+        """取上一块末尾的完整句子作为下一块的重叠部分"""
+        tail, tail_lengths = [], []
+        total = 0
+        for sentence, length in zip(reversed(sentences), reversed(lengths)):
+            if total + length > self.chunk_overlap or total + length + next_length > self.chunk_size:
+                break
+            tail.insert(0, sentence)
+            tail_lengths.insert(0, length)
+            total += length
+        return tail, tail_lengths
+    
+    def _split_long_sentence(self, sentence: str) -> List[str]:
+        """硬切分超过块大小的单个句子"""
+        if self.fallback_splitter is not None:
+            return self.fallback_splitter.split_text(sentence)
+        return [sentence.strip()]
+
+class SemanticTextSplitter(SentenceTextSplitter):
+    """语义分块器 - 在相邻句子嵌入相似度低的位置断开，同时不超过块大小"""
+    
+    def __init__(self, chunk_size: int, chunk_overlap: int,
+                 breakpoint_percentile: float = 20.0,
+                 embed_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 **kwargs):
+        super().__init__(chunk_size, chunk_overlap, **kwargs)
+        self.breakpoint_percentile = breakpoint_percentile
+        self.embed_function = embed_function
+    
+    def split_text(self, text: str) -> List[str]:
+        """将文本切分为语义连贯的块"""
+        sentences = split_sentences(text)
+        if not sentences:
+            return []
+            
+        lengths = self._measure(sentences)
+        if len(sentences) < 3:
+            return self._pack(sentences, lengths, breakpoints=set())
+            
+        try:
+            breakpoints = self._find_breakpoints(sentences)
+        except Exception as e:
+            logger.warning(f"语义分块计算句子嵌入失败，退回按句子分块: {e}")
+            breakpoints = set()
+            
+        return self._pack(sentences, lengths, breakpoints)
+    
+    def _find_breakpoints(self, sentences: List[str]) -> set:
+        """批量嵌入所有句子，向量化计算相邻句子相似度，低于分位数阈值处断开"""
+        embed_function = self.embed_function
+        if embed_function is None:
+            from zhipu_service import zhipu_service
+            embed_function = lambda texts: zhipu_service.embed(texts, lane="bulk")
+            
+        embeddings = np.asarray(embed_function([sentence.strip() for sentence in sentences]), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+        
+        # similarities[i] 为第 i 句与第 i+1 句的余弦相似度
+        similarities = np.einsum('ij,ij->i', embeddings[:-1], embeddings[1:])
+        threshold = np.percentile(similarities, self.breakpoint_percentile)
+        return set((np.nonzero(similarities < threshold)[0] + 1).tolist())
@@ -0,0 +1,129 @@
+"""
+向量库分片子进程 - 每个分片进程持有自己目录下的ChromaDB客户端，由 sharding.ShardedVectorDB 调度
+
+本模块只依赖ChromaDB，分片子进程（spawn）导入时不会加载嵌入模型。
+"""
+
+import os
+from typing import List, Dict, Any, Optional
+
+# 允许在分片进程中直接调用的集合方法
+_COLLECTION_METHODS = {"add", "upsert", "query", "get", "delete", "count"}
+
+_client = None
+_collections = {}
+
+def init_shard(path: str) -> None:
+    """子进程初始化：打开分片目录下的ChromaDB（主进程导入本模块时不加载ChromaDB）"""
+    import chromadb
+    from chromadb.config import Settings
+    
+    global _client
+    os.makedirs(path, exist_ok=True)
+    _client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+
+def _collection(name: str, index_metadata: Optional[Dict[str, Any]] = None):
+    """获取集合，不存在时按给定的HNSW参数创建"""
+    collection = _collections.get(name)
+    if collection is None:
+        try:
+            collection = _client.get_collection(name=name)
+        except ValueError:
+            collection = _client.get_or_create_collection(name=name, metadata=index_metadata)
+        _collections[name] = collection
+    return collection
+
+def call(method: str, name: str, index_metadata: Dict[str, Any], kwargs: Dict[str, Any]) -> Any:
+    """在分片的集合上执行一个ChromaDB集合方法"""
+    if method not in _COLLECTION_METHODS:
+        raise ValueError(f"不支持的分片操作: {method}")
+    return getattr(_collection(name, index_metadata), method)(**kwargs)
+
+def collection_metadata(name: str, index_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """集合创建时记录的元数据（HNSW参数）"""
+    return _collection(name, index_metadata).metadata or {}
+
+def list_collections() -> List[str]:
+    """分片中的所有集合名"""
+    return [collection.name for collection in _client.list_collections()]
+
+def drop_collection(name: str) -> None:
+    """删除集合（不存在时忽略）"""
+    _collections.pop(name, None)
+    try:
+        _client.delete_collection(name=name)
+    except ValueError:
+        pass
+
+def _tmp_name(name: str, purpose: str) -> str:
+    """整体替换时使用的临时集合名（后缀与 vector_db.TMP_COLLECTION_SUFFIX 一致）"""
+    return f"{name[:50]}-{purpose}-tmp"
+
+def _backup_name(name: str, purpose: str) -> str:
+    """整体替换时原集合的备份名（新集合改名成功后删除）"""
+    return f"{name[:46]}-{purpose}-old-tmp"
+
+def _existing(name: str):
+    """获取已有集合（不存在时返回None，不创建）"""
+    try:
+        return _client.get_collection(name=name)
+    except ValueError:
+        return None
+
+def begin_replace(name: str, purpose: str, index_metadata: Dict[str, Any]) -> None:
+    """新建临时集合（清理上次中断留下的同名集合；原集合还在备份名下时先恢复）"""
+    tmp_name = _tmp_name(name, purpose)
+    backup = _existing(_backup_name(name, purpose))
+    if backup is not None:
+        current = _existing(name)
+        if current is not None and current.count() > 0:
+            drop_collection(backup.name)
+        else:
+            drop_collection(name)
+            backup.modify(name=name)
+    drop_collection(tmp_name)
+    _collections[tmp_name] = _client.create_collection(name=tmp_name, metadata=index_metadata)
+
+def stage(name: str, purpose: str, batch: Dict[str, Any]) -> int:
+    """向临时集合写入一批数据"""
+    _collections[_tmp_name(name, purpose)].add(**batch)
+    return len(batch["ids"])
+
+def commit_replace(name: str, purpose: str) -> None:
+    """用临时集合替换同名集合：原集合先改名备份，新集合改名失败时恢复"""
+    tmp_name = _tmp_name(name, purpose)
+    backup_name = _backup_name(name, purpose)
+    _collections.pop(name, None)
+    old_collection = _existing(name)
+    if old_collection is not None:
+        old_collection.modify(name=backup_name)
+    try:
+        _collections[tmp_name].modify(name=name)
+    except BaseException:
+        if old_collection is not None:
+            old_collection.modify(name=name)
+        raise
+    _collections.pop(tmp_name)
+    if old_collection is not None:
+        drop_collection(backup_name)
+
+def abort_replace(name: str, purpose: str) -> None:
+    """放弃整体替换，原集合保持不变"""
+    drop_collection(_tmp_name(name, purpose))
+
+def rebuild(name: str, index_metadata: Dict[str, Any], batch_size: int) -> int:
+    """在分片内按新的HNSW参数重建集合（复用已有向量），返回块数"""
+    old_collection = _collection(name, index_metadata)
+    begin_replace(name, "rebuild", index_metadata)
+    copied = 0
+    try:
+        while True:
+            batch = old_collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=copied)
+            if not batch["ids"]:
+                break
+            copied += stage(name, "rebuild", {key: batch[key] for key in ("ids", "embeddings", "documents", "metadatas")})
+    except BaseException:
+        abort_replace(name, "rebuild")
+        raise
+    commit_replace(name, "rebuild")
+    return copied
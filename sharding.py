@@ -0,0 +1,428 @@
+import os
+import json
+import time
+import zlib
+import heapq
+import atexit
+import threading
+import multiprocessing
+import numpy as np
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Iterable
+import shard_worker
+from vector_db import VectorDBManager
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 记录分片数的文件，分片数与已有数据不一致时拒绝启动
+_LAYOUT_FILE = "shards.json"
+
+def shard_for(source: str, shard_count: int) -> int:
+    """按来源的CRC32选择分片：同一文档的块都在同一分片，结果不受进程哈希随机化影响"""
+    return zlib.crc32((source or "").encode('utf-8')) % shard_count
+
+class ShardedVectorDB(VectorDBManager):
+    """分片向量数据库 - 文档块按来源分布到 VECTOR_DB_SHARDS 个分片，每个分片由独立子进程持有
+
+    查询向量在主进程中计算一次，并行发给所有分片检索，各分片按距离升序返回的 top_k 用堆归并。
+    写入按来源路由到所在分片；按ID删除或读取时先并行定位ID所在的分片。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.shard_count = max(1, self.config.VECTOR_DB_SHARDS)
+        self.shards_dir = os.path.join(self.config.VECTOR_DB_DIR, "shards")
+        self._executors: Dict[int, ProcessPoolExecutor] = {}
+        self._executors_lock = threading.Lock()
+        atexit.register(self.shutdown)
+    
+    def initialize(self) -> bool:
+        """初始化：校验分片数，启动各分片进程并打开默认命名空间的集合"""
+        try:
+            self._check_layout()
+            self._collections.clear()
+            self._count_cache.clear()
+            self._broadcast("count", None, {})
+            
+            self._initialized = True
+            logger.info(f"分片向量数据库初始化完成: {self.shard_count} 个分片")
+            
+            if self.config.INDEX_WARMUP_ENABLED:
+                self.warm_up()
+            return True
+            
+        except Exception as e:
+            error_msg = f"分片向量数据库初始化失败: {str(e)}"
+            logger.error(error_msg)
+            return False
+    
+    def _check_layout(self) -> None:
+        """已有数据的分片数必须与配置一致，否则按来源路由会找错分片"""
+        os.makedirs(self.shards_dir, exist_ok=True)
+        layout_path = os.path.join(self.shards_dir, _LAYOUT_FILE)
+        if os.path.exists(layout_path):
+            with open(layout_path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)["shards"]
+            if stored != self.shard_count:
+                raise ValueError(
+                    f"已有数据按 {stored} 个分片存储，与 VECTOR_DB_SHARDS={self.shard_count} 不一致；"
+                    f"请按原分片数导出快照，再在新的 VECTOR_DB_DIR 中导入"
+                )
+            return
+        with open(layout_path, 'w', encoding='utf-8') as file:
+            json.dump({"shards": self.shard_count}, file)
+    
+    def _executor(self, shard: int) -> ProcessPoolExecutor:
+        """按需创建分片进程（spawn方式，子进程只导入 shard_worker，不加载嵌入模型）"""
+        with self._executors_lock:
+            executor = self._executors.get(shard)
+            if executor is None:
+                executor = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=shard_worker.init_shard,
+                    initargs=(os.path.join(self.shards_dir, f"shard-{shard:02d}"),)
+                )
+                self._executors[shard] = executor
+            return executor
+    
+    def _gather(self, futures: Dict[int, Future]) -> Dict[int, Any]:
+        """等待各分片的结果；分片进程异常退出时下次调用重新创建"""
+        results = {}
+        for shard, future in futures.items():
+            try:
+                results[shard] = future.result()
+            except BrokenProcessPool:
+                logger.error(f"分片 {shard} 的进程异常退出，下次调用时重新创建")
+                with self._executors_lock:
+                    self._executors.pop(shard, None)
+                raise
+        return results
+    
+    def _run(self, calls: Dict[int, tuple]) -> Dict[int, Any]:
+        """在各分片进程中并行执行 {分片: (函数, *参数)}"""
+        return self._gather({shard: self._executor(shard).submit(*call) for shard, call in calls.items()})
+    
+    def _call(self, method: str, namespace: Optional[str], kwargs_by_shard: Dict[int, Dict[str, Any]]) -> Dict[int, Any]:
+        """在指定分片的集合上并行执行集合方法，每个分片使用各自的参数"""
+        name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+        index_metadata = self._index_metadata()
+        return self._run({
+            shard: (shard_worker.call, method, name, index_metadata, kwargs)
+            for shard, kwargs in kwargs_by_shard.items()
+        })
+    
+    def _broadcast(self, method: str, namespace: Optional[str], kwargs: Dict[str, Any]) -> Dict[int, Any]:
+        """在所有分片上以相同参数执行集合方法"""
+        return self._call(method, namespace, {shard: kwargs for shard in range(self.shard_count)})
+    
+    def get_collection(self, namespace: Optional[str] = None):
+        """分片模式的集合分布在各分片进程中，不能直接访问"""
+        raise RuntimeError("分片模式下集合位于各分片进程中")
+    
+    def _stored_index_metadata(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """各分片使用同一组HNSW参数创建集合，取第一个分片的记录"""
+        name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+        return self._run({0: (shard_worker.collection_metadata, name, self._index_metadata())})[0]
+    
+    def _write(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]],
+               upsert: bool = False, namespace: Optional[str] = None) -> None:
+        """按来源把文档块写入所在分片"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        groups: Dict[int, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_for((metadata or {}).get("source", ""), self.shard_count), []).append(i)
+            
+        self._call("upsert" if upsert else "add", namespace, {
+            shard: {
+                "ids": [ids[i] for i in rows],
+                "embeddings": embeddings[rows].tolist(),
+                "documents": [documents[i] for i in rows],
+                "metadatas": [metadatas[i] for i in rows]
+            }
+            for shard, rows in groups.items()
+        })
+    
+    def _query(self, query_embeddings: np.ndarray, top_k: int, filter_dict: Dict[str, Any] = None,
+               namespace: Optional[str] = None) -> Dict[str, List[List[Any]]]:
+        """并行检索各分片并用堆归并各自的 top_k；按来源过滤时只检索该来源所在的分片"""
+        search_kwargs = {"query_embeddings": query_embeddings.tolist(), "n_results": top_k}
+        if filter_dict:
+            search_kwargs["where"] = filter_dict
+        source = (filter_dict or {}).get("source")
+        shards = [shard_for(source, self.shard_count)] if isinstance(source, str) else range(self.shard_count)
+        per_shard = self._call("query", namespace, {shard: search_kwargs for shard in shards})
+        
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in range(len(query_embeddings)):
+            # 各分片的结果已按距离升序排列
+            streams = [
+                zip(result["distances"][q], result["ids"][q], result["documents"][q], result["metadatas"][q])
+                for result in per_shard.values() if q < len(result["ids"])
+            ]
+            top = list(islice(heapq.merge(*streams, key=lambda hit: hit[0]), top_k))
+            merged["distances"].append([hit[0] for hit in top])
+            merged["ids"].append([hit[1] for hit in top])
+            merged["documents"].append([hit[2] for hit in top])
+            merged["metadatas"].append([hit[3] for hit in top])
+        return merged
+    
+    def _locate(self, ids: List[str], namespace: Optional[str] = None) -> Dict[int, List[str]]:
+        """并行查找各ID所在的分片"""
+        found = self._broadcast("get", namespace, {"ids": list(ids), "include": []})
+        return {shard: batch["ids"] for shard, batch in found.items() if batch["ids"]}
+    
+    def get_document_count(self, namespace: Optional[str] = None) -> int:
+        """各分片文档块数量之和（按命名空间缓存，写入或清空后失效）"""
+        if not self._initialized:
+            return 0
+            
+        try:
+            name = namespace or self.config.DEFAULT_NAMESPACE
+            if name not in self._count_cache:
+                self._count_cache[name] = sum(self._broadcast("count", name, {}).values())
+            return self._count_cache[name]
+        except Exception as e:
+            logger.error(f"获取文档数量失败: {e}")
+            return 0
+    
+    def get_embeddings(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """读取指定文档块已存储的向量（float32），不存在的ID不出现在结果中"""
+        if not self._initialized or not ids:
+            return {}
+            
+        stored = {}
+        for batch in self._broadcast("get", namespace, {"ids": list(ids), "include": ["embeddings"]}).values():
+            stored.update(zip(batch["ids"], np.asarray(batch["embeddings"], dtype=np.float32)))
+        return stored
+    
+    def get_chunks_by_ids(self, ids: List[str], namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按ID读取文档块的内容和元数据"""
+        if not self._initialized or not ids:
+            return []
+            
+        return [
+            {"id": chunk_id, "content": content, "metadata": metadata}
+            for batch in self._broadcast("get", namespace, {"ids": list(ids), "include": ["documents", "metadatas"]}).values()
+            for chunk_id, content, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+        ]
+    
+    def copy_chunks(self, id_map: Dict[str, str], metadata_updates: Dict[str, Dict[str, Any]] = None,
+                    namespace: Optional[str] = None) -> Dict[str, Any]:
+        """以新ID复制文档块（复用已存储的向量），副本按更新后的来源写入所在分片"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            metadata_updates = metadata_updates or {}
+            ids, embeddings, documents, metadatas = [], [], [], []
+            found = self._broadcast("get", namespace, {"ids": list(id_map), "include": ["documents", "metadatas", "embeddings"]})
+            for batch in found.values():
+                for chunk_id, embedding, content, metadata in zip(batch["ids"], batch["embeddings"],
+                                                                  batch["documents"], batch["metadatas"]):
+                    ids.append(id_map[chunk_id])
+                    embeddings.append(embedding)
+                    documents.append(content)
+                    metadatas.append({**metadata, **metadata_updates.get(id_map[chunk_id], {})})
+            if ids:
+                self._write(ids, np.asarray(embeddings, dtype=np.float32), documents, metadatas, True, namespace)
+            self._invalidate(namespace)
+            return {"success": True, "count": len(ids)}
+        except Exception as e:
+            error_msg = f"复制文档块失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def delete_documents(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, Any]:
+        """删除指定ID的文档（只发送到ID所在的分片）"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            located = self._locate(ids, namespace)
+            self._call("delete", namespace, {shard: {"ids": shard_ids} for shard, shard_ids in located.items()})
+            self._invalidate(namespace)
+            return {
+                "success": True,
+                "message": f"成功删除 {len(ids)} 个文档"
+            }
+        except Exception as e:
+            error_msg = f"删除文档失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def get_chunks(self, source: str, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按原文顺序获取某个来源的全部文档块（只读取该来源所在的分片）"""
+        if not self._initialized:
+            return []
+            
+        shard = shard_for(source, self.shard_count)
+        batch = self._call("get", namespace, {shard: {"where": {"source": source}, "include": ["documents", "metadatas"]}})[shard]
+        chunks = [
+            {"id": chunk_id, "content": content, "metadata": metadata}
+            for chunk_id, content, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+        ]
+        return sorted(chunks, key=lambda chunk: chunk["metadata"].get("chunk_index", 0))
+    
+    def iter_records(self, batch_size: int = 1000, namespace: Optional[str] = None):
+        """依次分页遍历各分片，每批返回 {"ids", "embeddings", "documents", "metadatas"}"""
+        if not self._initialized:
+            return
+            
+        for shard in range(self.shard_count):
+            offset = 0
+            while True:
+                batch = self._call("get", namespace, {shard: {
+                    "include": ["embeddings", "documents", "metadatas"], "limit": batch_size, "offset": offset
+                }})[shard]
+                if not batch["ids"]:
+                    break
+                yield batch
+                offset += len(batch["ids"])
+    
+    def iter_chunks(self, batch_size: int = 1000, namespace: Optional[str] = None):
+        """分页遍历所有分片中文档块的 (ID, 元数据)"""
+        for batch in self.iter_records(batch_size, namespace):
+            yield from zip(batch["ids"], batch["metadatas"])
+    
+    def warm_up(self, namespace: Optional[str] = None) -> float:
+        """各分片并行用已有的一个向量执行一次检索；返回耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            samples = self._broadcast("get", namespace, {"limit": 1, "include": ["embeddings"]})
+            self._call("query", namespace, {
+                shard: {"query_embeddings": sample["embeddings"], "n_results": 1}
+                for shard, sample in samples.items() if sample["ids"]
+            })
+        except Exception as e:
+            logger.warning(f"索引预热失败: {e}")
+        elapsed = time.perf_counter() - start
+        logger.info(f"索引预热完成: {namespace or self.config.DEFAULT_NAMESPACE} ({elapsed * 1000:.0f}ms)")
+        return elapsed
+    
+    def rebuild_index(self, namespace: Optional[str] = None, batch_size: int = 1000) -> Dict[str, Any]:
+        """各分片进程并行按当前HNSW配置重建自己的集合"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+            index_metadata = self._index_metadata()
+            copied = sum(self._run({
+                shard: (shard_worker.rebuild, name, index_metadata, batch_size) for shard in range(self.shard_count)
+            }).values())
+            self._invalidate(name)
+            message = f"索引已按新参数重建，共 {copied} 个文档块（{self.shard_count} 个分片）"
+            logger.info(f"{name}: {message}")
+            return {"success": True, "message": message, "count": copied}
+            
+        except Exception as e:
+            error_msg = f"重建索引失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def bulk_load(self, batches: Iterable[Dict[str, Any]], namespace: Optional[str] = None) -> Dict[str, Any]:
+        """用已计算好的向量整体替换命名空间：各分片先写入临时集合，全部成功后再一起替换"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        shards = range(self.shard_count)
+        try:
+            name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+            index_metadata = self._index_metadata()
+            self._run({shard: (shard_worker.begin_replace, name, "import", index_metadata) for shard in shards})
+            
+            loaded = 0
+            try:
+                for batch in batches:
+                    embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+                    groups: Dict[int, List[int]] = {}
+                    for i, metadata in enumerate(batch["metadatas"]):
+                        groups.setdefault(shard_for((metadata or {}).get("source", ""), self.shard_count), []).append(i)
+                    loaded += sum(self._run({
+                        shard: (shard_worker.stage, name, "import", {
+                            "ids": [batch["ids"][i] for i in rows],
+                            "embeddings": embeddings[rows].tolist(),
+                            "documents": [batch["documents"][i] for i in rows],
+                            "metadatas": [batch["metadatas"][i] for i in rows]
+                        })
+                        for shard, rows in groups.items()
+                    }).values())
+            except BaseException:
+                self._run({shard: (shard_worker.abort_replace, name, "import") for shard in shards})
+                raise
+                
+            self._run({shard: (shard_worker.commit_replace, name, "import") for shard in shards})
+            self._invalidate(name)
+            return {"success": True, "message": f"成功导入 {loaded} 个文档块", "count": loaded}
+        except Exception as e:
+            error_msg = f"批量导入失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def list_namespaces(self) -> List[str]:
+        """列出所有命名空间（各分片集合名的并集）"""
+        if not self._initialized:
+            return []
+            
+        try:
+            names = self._run({shard: (shard_worker.list_collections,) for shard in range(self.shard_count)})
+            return sorted(name for name in set().union(*names.values()) if not self.is_temporary(name))
+        except Exception as e:
+            logger.error(f"获取命名空间列表失败: {e}")
+            return []
+    
+    def clear_collection(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """清空所有分片中该命名空间的集合"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+            self._run({shard: (shard_worker.drop_collection, name) for shard in range(self.shard_count)})
+            self._invalidate(name)
+            # 重新创建集合
+            self._broadcast("count", name, {})
+            return {
+                "success": True,
+                "message": "集合已清空"
+            }
+        except Exception as e:
+            error_msg = f"清空集合失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def get_status(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """获取分片向量数据库状态"""
+        if not self._initialized:
+            return {"initialized": False}
+            
+        try:
+            name = namespace or self.config.DEFAULT_NAMESPACE
+            shard_counts = self._broadcast("count", name, {})
+            return {
+                "initialized": True,
+                "document_count": self.get_document_count(name),
+                "collection_name": name,
+                "namespace": name,
+                "embedding_model": self.config.EMBEDDING_MODEL_NAME,
+                "index_params": {
+                    key: value for key, value in self._stored_index_metadata(name).items() if key.startswith("hnsw:")
+                },
+                "index_params_outdated": self.index_params_outdated(name),
+                "mode": "sharded",
+                "shard_counts": [shard_counts[shard] for shard in range(self.shard_count)]
+            }
+        except Exception as e:
+            logger.error(f"获取状态失败: {e}")
+            return {"initialized": False, "error": str(e)}
+    
+    def shutdown(self) -> None:
+        """关闭所有分片进程"""
+        with self._executors_lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
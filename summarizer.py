@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 提示词或分组方式变化时递增，使旧摘要缓存失效
+SUMMARY_VERSION = 2
+
+# 合并部分摘要的最大层数，超过后截断各部分摘要做最后一次合并
+MAX_REDUCE_LEVELS = 4
+
+_MAP_PROMPT = """你是一个专业的文档摘要助手。下面是一篇文档中连续的一部分内容（第{index}部分，共{total}部分），
+请概括这部分的要点，保留关键事实、数字和结论，不要添加原文没有的信息。"""
+
+_REDUCE_PROMPT = """你是一个专业的文档摘要助手。下面是同一篇文档各部分按原文顺序排列的摘要，
+请将它们整合为一份简洁、准确、有条理的完整文档摘要，去除重复内容，保留关键事实和结论。"""
+
+_STUFF_PROMPT = "你是一个专业的文档摘要助手，请生成简洁、准确的文档摘要。"
+
+class SummaryCache:
+    """文档摘要缓存 - 以文件内容哈希、语言模型和摘要版本为键持久化"""
+    
+    def __init__(self, cache_dir: str = None):
+        self.config = system_config
+        self.cache_dir = cache_dir or os.path.join(self.config.CACHE_DIR, "summaries")
+    
+    def _entry_path(self, content_hash: str) -> str:
+        """缓存条目路径，按哈希前两位分目录"""
+        key = f"{self.config.LLM_MODEL}.v{SUMMARY_VERSION}"
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.{key}.json")
+    
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的摘要，未命中时返回None"""
+        entry_path = self._entry_path(content_hash)
+        if not os.path.exists(entry_path):
+            return None
+            
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except Exception as e:
+            logger.warning(f"读取摘要缓存失败，将重新生成: {e}")
+            return None
+    
+    def put(self, content_hash: str, entry: Dict[str, Any]) -> None:
+        """写入缓存条目（原子替换）"""
+        entry_path = self._entry_path(content_hash)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({**entry, "created_at": time.time()}, file, ensure_ascii=False)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            logger.warning(f"写入摘要缓存失败: {e}")
+
+def group_texts(texts: List[str], max_chars: int) -> List[List[str]]:
+    """按原顺序把文本装入不超过 max_chars 的分组（单条超长文本独占一组）"""
+    groups, current, size = [], [], 0
+    for text in texts:
+        if current and size + len(text) > max_chars:
+            groups.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += len(text)
+    if current:
+        groups.append(current)
+    return groups
+
+def reduce_groups(partials: List[str], max_chars: int) -> List[List[str]]:
+    """合并用的分组：按 max_chars 分组，但每组至少两条部分摘要，保证每一层的摘要数至少减半"""
+    merged = []
+    for group in group_texts(partials, max_chars):
+        if merged and len(merged[-1]) < 2:
+            merged[-1].extend(group)
+        else:
+            merged.append(group)
+    if len(merged) > 1 and len(merged[-1]) < 2:
+        merged[-2].extend(merged.pop())
+    return merged
+
+class DocumentSummarizer:
+    """分层（map-reduce）文档摘要 - 按顺序读取文档的全部块，分组并发摘要后逐层合并"""
+    
+    def __init__(self, vector_db_manager, cache: SummaryCache = None, get_catalog: Optional[Callable] = None):
+        self.vector_db = vector_db_manager
+        self.config = system_config
+        self.cache = cache or SummaryCache()
+        # 按命名空间获取文档目录；入库去重后文档的部分块只在目录中记录引用，需要经目录解析
+        self.get_catalog = get_catalog
+    
+    def _document_chunks(self, source: str, namespace: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """按原文顺序读取文档的全部块（含引用其他文档的重复块），同时返回目录中记录的文件哈希"""
+        if self.get_catalog is None:
+            return self.vector_db.get_chunks(source, namespace=namespace), None
+            
+        catalog = self.get_catalog(namespace)
+        document = catalog.get_document(source)
+        if document is None:
+            return self.vector_db.get_chunks(source, namespace=namespace), None
+            
+        order = catalog.get_chunk_order(source)
+        if not order:
+            # 旧版本入库的文档没有记录顺序：自身的块加引用的块，按块序号排列
+            chunks = self.vector_db.get_chunks_by_ids(catalog.get_chunk_ids(source) + catalog.get_ref_ids(source),
+                                                      namespace=namespace)
+            return sorted(chunks, key=lambda chunk: chunk["metadata"].get("chunk_index", 0)), document.get("file_hash")
+            
+        found = {chunk["id"]: chunk for chunk in self.vector_db.get_chunks_by_ids(list(dict.fromkeys(order)), namespace=namespace)}
+        return [found[chunk_id] for chunk_id in order if chunk_id in found], document.get("file_hash")
+    
+    def summarize(self, source: str, namespace: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+        """生成文档摘要；同一文件内容的摘要持久化缓存，refresh 为True时重新生成"""
+        chunks, file_hash = self._document_chunks(source, namespace)
+        if not chunks:
+            return {"success": False, "message": f"未找到来源: {source}"}
+            
+        texts = [chunk["content"] for chunk in chunks]
+        # 引用的重复块带有存储方文档的元数据，文件哈希以目录中本文档的记录为准
+        content_hash = (file_hash or chunks[0]["metadata"].get("file_hash")
+                        or hashlib.sha256("\n".join(texts).encode('utf-8')).hexdigest())
+        
+        if self.config.SUMMARY_CACHE_ENABLED and not refresh:
+            cached = self.cache.get(content_hash)
+            if cached is not None:
+                return {"success": True, "summary": cached["summary"], "chunks_count": len(chunks),
+                        "levels": cached.get("levels", 1), "cached": True}
+                        
+        start = time.perf_counter()
+        try:
+            summary, levels = self._map_reduce(texts)
+        except RuntimeError as e:
+            error_msg = f"生成摘要失败: {e}"
+            logger.error(error_msg)
+            return {"success": False, "message": error_msg}
+            
+        logger.info(f"文档摘要完成: {source}，{len(chunks)} 个文档块，{levels} 层，耗时 {time.perf_counter() - start:.1f}s")
+        if self.config.SUMMARY_CACHE_ENABLED:
+            self.cache.put(content_hash, {"source": source, "summary": summary, "levels": levels})
+        return {"success": True, "summary": summary, "chunks_count": len(chunks), "levels": levels, "cached": False}
+    
+    def _map_reduce(self, texts: List[str]) -> Tuple[str, int]:
+        """逐层分组摘要，直到内容能放进一次请求；返回 (摘要, 层数)"""
+        max_chars = self.config.SUMMARY_GROUP_CHARS
+        groups = group_texts(texts, max_chars)
+        if len(groups) == 1:
+            return self._complete(_STUFF_PROMPT, f"请为以下文档内容生成一个简洁的摘要：\n\n{chr(10).join(texts)}"), 1
+            
+        levels = 1
+        partials = self._summarize_groups(groups)
+        # 部分摘要合计仍超出一次请求的容量时，继续分组合并（每组至少两条，层数有上限）
+        while sum(map(len, partials)) > max_chars and len(partials) > 1 and levels < MAX_REDUCE_LEVELS:
+            levels += 1
+            partials = self._summarize_groups(reduce_groups(partials, max_chars), prompt=_REDUCE_PROMPT)
+            
+        if len(partials) == 1:
+            return partials[0], levels
+        if sum(map(len, partials)) > max_chars:
+            # 达到层数上限仍放不下：各部分摘要按相同长度截断后做最后一次合并
+            budget = max(1, max_chars // len(partials))
+            logger.warning(f"部分摘要合并 {levels} 层后仍超出 {max_chars} 字符，截断为每部分 {budget} 字符")
+            partials = [partial[:budget] for partial in partials]
+        return self._complete(_REDUCE_PROMPT, self._numbered(partials)), levels + 1
+    
+    def _summarize_groups(self, groups: List[List[str]], prompt: str = None) -> List[str]:
+        """在并发上限内同时摘要各分组，结果保持原顺序"""
+        def summarize_group(item):
+            index, group = item
+            if prompt is None:
+                return self._complete(_MAP_PROMPT.format(index=index + 1, total=len(groups)), "\n\n".join(group))
+            return self._complete(prompt, self._numbered(group))
+            
+        workers = max(1, min(self.config.MAX_CONCURRENT_REQUESTS, len(groups)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary") as executor:
+            return list(executor.map(summarize_group, enumerate(groups)))
+    
+    @staticmethod
+    def _numbered(partials: List[str]) -> str:
+        """按顺序编号部分摘要"""
+        return "\n\n".join(f"第{i}部分摘要：\n{partial}" for i, partial in enumerate(partials, start=1))
+    
+    @staticmethod
+    def _complete(system_prompt: str, content: str) -> str:
+        """调用大模型，失败时抛出异常以中止整个摘要"""
+        from zhipu_service import zhipu_service
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ]
+        response = zhipu_service.chat_completion(messages)
+        if not response["success"]:
+            raise RuntimeError(response.get("error", "大模型请求失败"))
+        return response["content"]
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from qa_engine import QAEngine
+from conversation import ConversationSession
+from config import system_config
+
+def make_chunk(chunk_id, content, similarity):
+    """构造检索结果"""
+    return {"id": chunk_id, "content": content, "metadata": {"source": f"{chunk_id}.txt"}, "similarity": similarity, "rank": 1}
+
+class TestConversationSession(unittest.TestCase):
+    """多轮对话会话测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.vector_db = MagicMock()
+        self.qa_engine = QAEngine(self.vector_db)
+        self.session = ConversationSession(self.qa_engine, namespace="team-a")
+        self.requests = []
+    
+    def fake_completion(self, messages):
+        """记录发送给大模型的消息，压缩请求返回固定摘要"""
+        self.requests.append(messages)
+        if "对话记录助手" in messages[0]["content"]:
+            return {"success": True, "content": "用户在询问年假制度"}
+        return {"success": True, "content": "这是一个比较长的回答，" * 3}
+    
+    def test_history_is_compressed_under_budget(self):
+        """测试较早的轮次被压缩为摘要，历史token数不超过预算，摘要随后续提问发送"""
+        with patch.object(self.qa_engine, 'retrieve', return_value=[make_chunk("c1", "年假规定", 0.8)]), \
+             patch('zhipu_service.zhipu_service.chat_completion', side_effect=self.fake_completion), \
+             patch.multiple(system_config, CONVERSATION_HISTORY_TOKENS=80, CONVERSATION_RECENT_TURNS=2):
+            for question in ["年假有几天？", "怎么申请？", "可以分开休吗？"]:
+                result = self.session.ask(question)
+                self.assertTrue(result["success"])
+                self.assertLessEqual(result["history_tokens"], 80)
+            self.session.ask("那病假呢？")
+            
+        self.assertEqual(self.session.turn_count, 4)
+        self.assertEqual(self.session.summary, "用户在询问年假制度")
+        self.assertLess(len(self.session.turns), 4)
+        
+        # 最后一次提问的消息：系统提示、对话摘要、保留的最近轮次、当前问题
+        last_messages = self.requests[-1] if "对话记录助手" not in self.requests[-1][0]["content"] else self.requests[-2]
+        self.assertIn("用户在询问年假制度", last_messages[1]["content"])
+        self.assertIn("那病假呢？", last_messages[-1]["content"])
+    
+    def test_carried_chunks_reused_when_relevant(self):
+        """测试此前轮次的文档块与新问题仍相关时并入上下文，不相关时丢弃"""
+        with patch.object(self.qa_engine, 'retrieve', side_effect=[[make_chunk("c1", "年假规定", 0.8)], [], []]), \
+             patch('zhipu_service.zhipu_service.chat_completion', side_effect=self.fake_completion), \
+             patch.object(system_config, 'CONVERSATION_REUSE_THRESHOLD', 0.5):
+            self.session.ask("年假有几天？")
+            
+            self.vector_db.score_chunks.return_value = {"c1": 0.7}
+            result = self.session.ask("那新员工呢？")
+            self.vector_db.score_chunks.assert_called_with("那新员工呢？", ["c1"], namespace="team-a")
+            self.assertEqual(result["reused_sources"], 1)
+            self.assertEqual([source["id"] for source in result["sources"]], ["c1"])
+            self.assertIn("年假规定", self.requests[-1][-1]["content"])
+            
+            self.vector_db.score_chunks.return_value = {"c1": 0.2}
+            result = self.session.ask("报销怎么走流程？")
+            self.assertEqual(result["sources"], [])
+            self.assertEqual(result["reused_sources"], 0)
+    
+    def test_context_fits_token_budget(self):
+        """测试本轮上下文按相似度装入，超出预算的低相关块被舍弃"""
+        chunks = [make_chunk("c1", "短" * 10, 0.6), make_chunk("c2", "长" * 50, 0.9), make_chunk("c3", "短" * 10, 0.5)]
+        with patch.object(system_config, 'CONVERSATION_CONTEXT_TOKENS', 65):
+            fitted = self.session._fit_context(chunks)
+            
+        self.assertEqual([chunk["id"] for chunk in fitted], ["c2", "c1"])
+        self.assertEqual([chunk["rank"] for chunk in fitted], [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
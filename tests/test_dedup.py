@@ -0,0 +1,208 @@
+import os
+import sys
+import shutil
+import unittest
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from chromadb.api.client import SharedSystemClient
+from dedup import normalize_text, content_hash, minhash_signature, estimate_jaccard
+from document_catalog import DocumentCatalog
+from config import system_config
+
+def make_line(seed, length=80):
+    """生成互不相同的长行文本"""
+    return f"第{seed}条" + "".join(chr(0x4e00 + (seed * 97 + k * 13) % 2000) for k in range(length))
+
+class TestDedup(unittest.TestCase):
+    """入库去重测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_dedup')
+        self.catalog = DocumentCatalog(os.path.join(self.test_dir, 'documents.sqlite3'))
+    
+    def tearDown(self):
+        """测试后清理"""
+        if self.catalog._conn is not None:
+            self.catalog._conn.close()
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_fingerprints(self):
+        """测试归一化统一全半角、大小写和空白但保留标点和数字，MinHash区分近似重复与不同内容"""
+        self.assertEqual(content_hash("年假 \n 规定：15天。"), content_hash("年假 规定:15天。"))
+        self.assertEqual(normalize_text("ＡＢ  c"), "ab c")
+        for first, second in (("价格为1.5元", "价格为15元"), ("温度-5度", "温度5度"), ("3/4", "34")):
+            self.assertNotEqual(content_hash(first), content_hash(second))
+        
+        original = make_line(1)
+        edited = original[:40] + "改" + original[41:]
+        self.assertGreaterEqual(estimate_jaccard(minhash_signature(original), minhash_signature(edited)), 0.75)
+        self.assertLess(estimate_jaccard(minhash_signature(original), minhash_signature(make_line(2))), 0.2)
+    
+    @patch('vector_db.zhipu_service')
+    def test_duplicates_stored_once_and_handed_over(self, mock_zhipu_service):
+        """测试重复块只存储一次并记录多个来源，删除存储方后块转交给引用方"""
+        from rag_system import RAGSystem
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[float(len(text)), 1.0, 0.0] for text in texts]
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.multiple(system_config, CHUNK_SIZE=100, CHUNK_OVERLAP=0, TEXT_CACHE_ENABLED=False,
+                            DEDUP_ENABLED=True, DEDUP_NEAR_ENABLED=True, DEDUP_JACCARD_THRESHOLD=0.75):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            near = make_line(1)[:40] + "改" + make_line(1)[41:]
+            first_path = os.path.join(self.test_dir, 'policy_v1.txt')
+            second_path = os.path.join(self.test_dir, 'policy_v2.txt')
+            os.makedirs(self.test_dir, exist_ok=True)
+            with open(first_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join([make_line(0), make_line(1), make_line(2)]))
+            with open(second_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join([make_line(0), near, make_line(3), make_line(0)]))
+                
+            self.assertEqual(rag.add_document(first_path)["duplicates"], 0)
+            result = rag.add_document(second_path)
+            self.assertTrue(result["success"])
+            self.assertEqual(result["count"], 4)
+            self.assertEqual(result["duplicates"], 3)
+            self.assertEqual(rag.vector_db.get_document_count(), 4)
+            
+            first_ids = sorted(self.catalog.get_chunk_ids("policy_v1.txt"))
+            self.assertEqual(sorted(self.catalog.get_ref_ids("policy_v2.txt")), first_ids[:2])
+            self.assertEqual(self.catalog.sources_for_chunks([first_ids[0]])[first_ids[0]], ["policy_v1.txt", "policy_v2.txt"])
+            
+            # 删除存储方：仍被引用的两个块转交给 policy_v2.txt，其余块删除
+            self.assertTrue(rag.delete_document("policy_v1.txt")["success"])
+            self.assertEqual(rag.vector_db.get_document_count(), 3)
+            self.assertEqual(self.catalog.get_ref_ids("policy_v2.txt"), [])
+            owned = self.catalog.get_chunk_ids("policy_v2.txt")
+            self.assertEqual(len(owned), 3)
+            self.assertEqual({chunk["metadata"]["source"] for chunk in rag.vector_db.get_chunks_by_ids(owned)},
+                             {"policy_v2.txt"})
+                             
+            # 同一文档重新入库不会与自身旧版本去重
+            self.assertEqual(rag.replace_document(second_path)["duplicates"], 1)
+            self.assertEqual(rag.vector_db.get_document_count(), 3)
+    
+    @patch('vector_db.zhipu_service')
+    def test_near_duplicates_kept_by_default(self, mock_zhipu_service):
+        """测试默认只合并完全重复的块，只差一个数字的条款分别存储"""
+        from rag_system import RAGSystem
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[float(len(text)), 1.0, 0.0] for text in texts]
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.multiple(system_config, TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=True, DEDUP_NEAR_ENABLED=False):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            clause = make_line(1)
+            versions = {"policy_2023.txt": clause + "年假15天", "policy_2024.txt": clause + "年假20天"}
+            for source, text in versions.items():
+                chunks = [{"id": f"{source}_0", "content": text, "metadata": {"chunk_index": 0}},
+                          {"id": f"{source}_1", "content": make_line(0), "metadata": {"chunk_index": 1}}]
+                rag._ingest({"chunks": chunks, "metadata": {"source": source, "file_hash": source}})
+                
+            self.assertEqual(self.catalog.get_ref_ids("policy_2024.txt"), ["policy_2023.txt_1"])
+            self.assertEqual(self.catalog.get_chunk_ids("policy_2024.txt"), ["policy_2024.txt_0"])
+            self.assertEqual(rag.vector_db.get_document_count(), 3)
+    
+    @patch('vector_db.zhipu_service')
+    def test_chunks_differing_in_punctuation_are_stored(self, mock_zhipu_service):
+        """测试只差小数点或负号的块不是完全重复，各自存储并能检索到原文"""
+        from rag_system import RAGSystem
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[float(len(text)), 1.0, 0.0] for text in texts]
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.multiple(system_config, TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=True, DEDUP_NEAR_ENABLED=False):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            versions = {"price_a.txt": ["价格为1.5元", "温度-5度"], "price_b.txt": ["价格为15元", "温度5度"]}
+            for source, contents in versions.items():
+                chunks = [{"id": f"{source}_{i}", "content": content, "metadata": {"chunk_index": i}}
+                          for i, content in enumerate(contents)]
+                rag._ingest({"chunks": chunks, "metadata": {"source": source, "file_hash": source}})
+                
+            self.assertEqual(self.catalog.get_ref_ids("price_b.txt"), [])
+            self.assertEqual(rag.vector_db.get_document_count(), 4)
+            self.assertEqual([chunk["content"] for chunk in rag.vector_db.get_chunks("price_b.txt")], versions["price_b.txt"])
+            
+        # 旧版本按去掉标点的文本计算的指纹在重新打开目录时作废，之后按新规则补算
+        self.catalog.add_fingerprints([("price_a.txt_0", content_hash("价格为15元"), minhash_signature("x"), [])])
+        self.catalog._connection().execute("PRAGMA user_version = 1")
+        self.catalog._conn.close()
+        self.catalog._conn = None
+        self.assertEqual(self.catalog.find_content_hashes([content_hash("价格为15元")]), {})
+        self.assertEqual(len(self.catalog.chunks_without_fingerprints()), 4)
+    
+    @patch('vector_db.zhipu_service')
+    def test_summary_includes_referenced_chunks(self, mock_zhipu_service):
+        """测试去重后的文档摘要包含引用的重复块并保持本文档的原文顺序，完全重复的文档也能摘要"""
+        from rag_system import RAGSystem
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[float(len(text)), 1.0, 0.0] for text in texts]
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.multiple(system_config, TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=True, SUMMARY_CACHE_ENABLED=False,
+                            SUMMARY_GROUP_CHARS=100000):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            def ingest(source, seeds):
+                chunks = [{"id": f"{source}_{i}", "content": make_line(seed), "metadata": {"chunk_index": i}}
+                          for i, seed in enumerate(seeds)]
+                return rag._ingest({"chunks": chunks, "metadata": {"source": source, "file_hash": source}})
+                
+            ingest("original.txt", [0, 1, 2])
+            self.assertEqual(ingest("reordered.txt", [5, 2, 0])["duplicates"], 2)
+            self.assertEqual(ingest("copy.txt", [0, 1, 2])["duplicates"], 3)
+            self.assertEqual(self.catalog.get_chunk_ids("copy.txt"), [])
+            
+            prompts = []
+            
+            def fake_completion(messages):
+                prompts.append(messages[1]["content"])
+                return {"success": True, "content": "摘要"}
+                
+            with patch('zhipu_service.zhipu_service.chat_completion', side_effect=fake_completion):
+                for source, seeds in (("reordered.txt", [5, 2, 0]), ("copy.txt", [0, 1, 2])):
+                    result = rag.summarize_document(source)
+                    self.assertTrue(result["success"], result)
+                    self.assertEqual(result["chunks_count"], 3)
+                    positions = [prompts[-1].index(make_line(seed)) for seed in seeds]
+                    self.assertEqual(positions, sorted(positions))
+                    
+                # 删除存储方时向量库删除失败：目录回滚，转交时复制出的块也被删除
+                original_delete = rag.vector_db.delete_documents
+                responses = iter([{"success": False, "error": "向量库不可用"}])
+                with patch.object(rag.vector_db, 'delete_documents',
+                                  side_effect=lambda ids, **kwargs: next(responses, None) or original_delete(ids, **kwargs)):
+                    self.assertFalse(rag.delete_document("original.txt")["success"])
+                self.assertEqual(rag.vector_db.get_document_count(), 4)
+                self.assertEqual(len(self.catalog.get_chunk_ids("original.txt")), 3)
+                self.assertEqual(self.catalog.get_chunk_ids("copy.txt"), [])
+                
+                # 存储方删除后引用的块转交给引用方，摘要内容和顺序不变
+                self.assertTrue(rag.delete_document("original.txt")["success"])
+                result = rag.summarize_document("reordered.txt")
+                self.assertEqual(result["chunks_count"], 3)
+                positions = [prompts[-1].index(make_line(seed)) for seed in (5, 2, 0)]
+                self.assertEqual(positions, sorted(positions))
+
+if __name__ == '__main__':
+    unittest.main()
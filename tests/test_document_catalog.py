@@ -0,0 +1,246 @@
+import os
+import sys
+import shutil
+import unittest
+from unittest.mock import MagicMock, patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from chromadb.api.client import SharedSystemClient
+from document_catalog import DocumentCatalog
+from config import system_config
+
+class TestDocumentCatalog(unittest.TestCase):
+    """文档目录测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_catalog')
+        self.catalog = DocumentCatalog(os.path.join(self.test_dir, 'documents.sqlite3'))
+    
+    def tearDown(self):
+        """测试后清理"""
+        if self.catalog._conn is not None:
+            self.catalog._conn.close()
+        # ChromaDB按路径缓存客户端，删除目录前清除缓存
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_upsert_and_list(self):
+        """测试登记文档后计数和列表准确"""
+        self.catalog.upsert_document({"source": "a.pdf", "chunk_count": 3, "size_bytes": 100, "ingested_at": 1})
+        self.catalog.upsert_document({"source": "b.md", "chunk_count": 2, "size_bytes": 50, "ingested_at": 2})
+        
+        self.assertEqual(self.catalog.count(), 2)
+        self.assertEqual(self.catalog.total_chunks(), 5)
+        self.assertEqual([doc["source"] for doc in self.catalog.list_documents()], ["b.md", "a.pdf"])
+        
+        # 重新打开后数据仍在
+        reopened = DocumentCatalog(self.catalog.db_path)
+        self.assertEqual(reopened.count(), 2)
+        reopened._conn.close()
+    
+    def test_transaction_rollback(self):
+        """测试事务内异常时回滚"""
+        with self.assertRaises(RuntimeError):
+            with self.catalog.transaction() as catalog:
+                catalog.upsert_document({"source": "a.pdf", "chunk_count": 3})
+                raise RuntimeError("向量库写入失败")
+                
+        self.assertEqual(self.catalog.count(), 0)
+    
+    def test_rebuild_from_chunks(self):
+        """测试从块ID和元数据重建目录"""
+        chunks = [("c1", {"source": "a.pdf"}), ("c2", {"source": "a.pdf"}), ("c3", {"source": "b.md"}), ("c4", {})]
+        self.assertEqual(self.catalog.rebuild(chunks), 2)
+        self.assertEqual(self.catalog.get_document("a.pdf")["chunk_count"], 2)
+        self.assertEqual(sorted(self.catalog.get_chunk_ids("a.pdf")), ["c1", "c2"])
+        self.assertEqual(self.catalog.total_chunks(), 3)
+    
+    def test_ingest_failure_keeps_catalog_consistent(self):
+        """测试向量库写入失败时不登记文档"""
+        from rag_system import RAGSystem
+        
+        rag = RAGSystem()
+        rag.catalog = self.catalog
+        rag.vector_db = MagicMock()
+        rag.vector_db.add_documents.return_value = {"success": False, "error": "写入失败"}
+        
+        document_data = {
+            "chunks": [{"id": "c1", "content": "内容", "metadata": {}}],
+            "metadata": {"source": "a.pdf"}
+        }
+        with self.assertRaises(RuntimeError):
+            rag._ingest(document_data)
+        self.assertEqual(self.catalog.count(), 0)
+    
+    @patch('vector_db.zhipu_service')
+    def test_replace_and_delete_document(self, mock_zhipu_service):
+        """测试按来源替换和删除文档只影响该文档的块"""
+        from rag_system import RAGSystem
+        from text_cache import ExtractedTextCache
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3]] * len(texts)
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.object(system_config, 'CHUNK_SIZE', 20), \
+             patch.object(system_config, 'CHUNK_OVERLAP', 0):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            rag.document_processor.text_cache = ExtractedTextCache(os.path.join(self.test_dir, 'cache'))
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            doc_path = os.path.join(self.test_dir, 'policy.txt')
+            other_path = os.path.join(self.test_dir, 'other.txt')
+            with open(doc_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(f"第{i}条规定的具体内容" for i in range(6)))
+            with open(other_path, 'w', encoding='utf-8') as f:
+                f.write("其他文档内容")
+                
+            self.assertTrue(rag.add_document(doc_path)["success"])
+            self.assertTrue(rag.add_document(other_path)["success"])
+            self.assertEqual(rag.vector_db.get_document_count(), 7)
+            revision = rag.get_revision()
+            self.assertEqual(rag.get_revision("team-a"), 0)
+            
+            # 新版本更短：覆盖已有块并删除多余的旧块
+            with open(doc_path, 'w', encoding='utf-8') as f:
+                f.write("第0条规定的具体内容\n第1条规定的具体内容")
+            result = rag.replace_document(doc_path)
+            self.assertTrue(result["success"])
+            self.assertTrue(result["replaced"])
+            self.assertEqual(rag.vector_db.get_document_count(), 3)
+            self.assertEqual(self.catalog.get_document("policy.txt")["chunk_count"], 2)
+            
+            result = rag.delete_document("policy.txt")
+            self.assertTrue(result["success"])
+            self.assertEqual(rag.vector_db.get_document_count(), 1)
+            self.assertEqual([doc["source"] for doc in rag.get_document_sources()], ["other.txt"])
+            
+            # 替换和删除都使文档版本号递增，读取状态不改变版本号
+            rag.get_system_status()
+            self.assertEqual(rag.get_revision(), revision + 2)
+    
+    @patch('vector_db.zhipu_service')
+    def test_same_name_from_another_directory_is_rejected(self, mock_zhipu_service):
+        """测试不同目录下的同名文件不会静默覆盖已有文档，显式替换时才覆盖"""
+        from rag_system import RAGSystem
+        from text_cache import ExtractedTextCache
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3]] * len(texts)
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.multiple(system_config, DEDUP_ENABLED=False):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            rag.document_processor.text_cache = ExtractedTextCache(os.path.join(self.test_dir, 'cache'))
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            paths = [os.path.join(self.test_dir, folder, 'report.txt') for folder in ('a', 'b')]
+            for path, content in zip(paths, ("甲部门报告", "乙部门报告")):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                    
+            self.assertTrue(rag.add_document(paths[0])["success"])
+            # 同一文件重新添加仍按原位覆盖
+            self.assertTrue(rag.add_document(paths[0])["success"])
+            
+            result = rag.add_document(paths[1])
+            self.assertFalse(result["success"])
+            self.assertIn("已存在同名文档", result["error"])
+            self.assertEqual(self.catalog.get_document("report.txt")["file_path"], paths[0])
+            self.assertEqual([c["content"] for c in rag.vector_db.get_chunks("report.txt")], ["甲部门报告"])
+            
+            self.assertTrue(rag.replace_document(paths[1])["replaced"])
+            self.assertEqual([c["content"] for c in rag.vector_db.get_chunks("report.txt")], ["乙部门报告"])
+    
+    @patch('vector_db.zhipu_service')
+    def test_failed_replace_keeps_previous_version(self, mock_zhipu_service):
+        """测试替换时写入失败，撤销新写入的块，旧版本的目录记录和向量保持完整"""
+        from rag_system import RAGSystem
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3]] * len(texts)
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.multiple(system_config, DEDUP_ENABLED=False):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            def document(contents):
+                chunks = [{"id": f"policy_{i}", "content": content, "metadata": {"chunk_index": i}}
+                          for i, content in enumerate(contents)]
+                return {"chunks": chunks, "metadata": {"source": "policy.txt", "file_hash": contents[0]}}
+                
+            rag._ingest(document(["旧版第一条", "旧版第二条"]))
+            old_ids = sorted(self.catalog.get_chunk_ids("policy.txt"))
+            
+            # 新版本的块已写入一部分后失败
+            original_add = rag.vector_db.add_documents
+            
+            def failing_add(documents, **kwargs):
+                original_add(documents[:1], **kwargs)
+                return {"success": False, "error": "磁盘已满"}
+                
+            with patch.object(rag.vector_db, 'add_documents', side_effect=failing_add):
+                with self.assertRaises(RuntimeError):
+                    rag._ingest(document(["新版第一条", "新版第二条", "新版第三条"]))
+                    
+            self.assertEqual(sorted(self.catalog.get_chunk_ids("policy.txt")), old_ids)
+            self.assertEqual([c["content"] for c in rag.vector_db.get_chunks("policy.txt")], ["旧版第一条", "旧版第二条"])
+            self.assertEqual(rag.vector_db.get_document_count(), 2)
+            
+            # 替换成功后只保留新版本
+            self.assertTrue(rag._ingest(document(["新版第一条"]))["replaced"])
+            self.assertEqual([c["content"] for c in rag.vector_db.get_chunks("policy.txt")], ["新版第一条"])
+            self.assertEqual(rag.vector_db.get_chunks_by_ids(old_ids), [])
+    
+    @patch('vector_db.zhipu_service')
+    def test_namespace_routing_and_rechunk(self, mock_zhipu_service):
+        """测试文档按命名空间登记，重新分块只重建该命名空间"""
+        from rag_system import RAGSystem
+        from text_cache import ExtractedTextCache
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3]] * len(texts)
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, 'vector_db')), \
+             patch.object(system_config, 'CATALOG_DIR', self.test_dir), \
+             patch.object(system_config, 'CHUNK_SIZE', 20), \
+             patch.object(system_config, 'CHUNK_OVERLAP', 0):
+            rag = RAGSystem()
+            rag.catalog = self.catalog
+            rag.document_processor.text_cache = ExtractedTextCache(os.path.join(self.test_dir, 'cache'))
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+            
+            doc_path = os.path.join(self.test_dir, 'policy.txt')
+            with open(doc_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(f"第{i}条规定的具体内容" for i in range(6)))
+                
+            self.assertTrue(rag.add_document(doc_path, namespace="team-a")["success"])
+            self.assertEqual(rag.get_system_status("team-a")["document_count"], 1)
+            self.assertEqual(rag.get_system_status()["document_count"], 0)
+            self.assertFalse(rag.query("规定", namespace="team-b")["success"])
+            self.assertIn("team-a", rag.list_namespaces())
+            
+            # 原文件删除后仍可从缓存按新的块大小重建
+            os.remove(doc_path)
+            with patch.object(system_config, 'CHUNK_SIZE', 40):
+                rag.document_processor = type(rag.document_processor)()
+                rag.document_processor.text_cache = ExtractedTextCache(os.path.join(self.test_dir, 'cache'))
+                result = rag.rechunk_from_cache("team-a")
+                
+            self.assertTrue(result["success"])
+            self.assertEqual(result["failed"], [])
+            self.assertEqual(rag.vector_db.get_document_count("team-a"), result["chunk_count"])
+            self.assertEqual(rag.get_catalog("team-a").get_document("policy.txt")["chunk_count"], result["chunk_count"])
+            self.assertLess(result["chunk_count"], 6)
+            rag.get_catalog("team-a")._conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
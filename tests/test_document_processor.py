@@ -7,8 +7,38 @@ from unittest.mock import patch, MagicMock
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from document_processor import DocumentProcessor
+from text_cache import ExtractedTextCache
 from config import system_config
 
+def build_pdf(page_texts):
+    """生成每页包含一行ASCII文本的最小PDF"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(page_texts))), len(page_texts)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(data))
+        data += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode()
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return data
+
 class TestDocumentProcessor(unittest.TestCase):
     """文档处理器测试类"""
     
@@ -16,6 +46,8 @@ class TestDocumentProcessor(unittest.TestCase):
         """测试前准备"""
         self.processor = DocumentProcessor()
         self.test_data_dir = os.path.join(os.path.dirname(__file__), 'test_data')
+        self.cache_dir = os.path.join(self.test_data_dir, 'cache')
+        self.processor.text_cache = ExtractedTextCache(self.cache_dir)
         
         # 确保测试数据目录存在
         os.makedirs(self.test_data_dir, exist_ok=True)
@@ -30,6 +62,9 @@ class TestDocumentProcessor(unittest.TestCase):
         # 删除测试文件
         if os.path.exists(self.test_txt_path):
             os.remove(self.test_txt_path)
+        
+        import shutil
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
     
     def test_load_text_file(self):
         """测试加载文本文件"""
@@ -37,6 +72,86 @@ class TestDocumentProcessor(unittest.TestCase):
         self.assertIn("这是一个测试文档", text)
         self.assertIn("包含多行内容", text)
     
+    def test_load_pdf_parallel(self):
+        """测试PDF多进程解析保持页面顺序"""
+        pdf_path = os.path.join(self.test_data_dir, 'test.pdf')
+        with open(pdf_path, 'wb') as f:
+            f.write(build_pdf(["Page one", "Page two", "Page three", "Page four"]))
+        
+        try:
+            with patch.object(system_config, 'PDF_WORKERS', 2), \
+                 patch.object(system_config, 'PDF_PARALLEL_MIN_PAGES', 2):
+                text = self.processor.load_document(pdf_path)
+            self.assertEqual(
+                [line.strip() for line in text.strip().split("\n")],
+                ["Page one", "Page two", "Page three", "Page four"]
+            )
+        finally:
+            os.remove(pdf_path)
+    
+    def test_process_document_uses_text_cache(self):
+        """测试重复处理同一文档时命中提取文本缓存"""
+        first = self.processor.process_document(self.test_txt_path)
+        
+        with patch.object(self.processor, 'load_document') as mock_load:
+            second = self.processor.process_document(self.test_txt_path)
+            mock_load.assert_not_called()
+        
+        self.assertEqual(
+            [chunk["content"] for chunk in first["chunks"]],
+            [chunk["content"] for chunk in second["chunks"]]
+        )
+        
+        file_hash = self.processor.text_cache.file_hash(self.test_txt_path)
+        self.assertEqual(first["metadata"]["file_hash"], file_hash)
+        self.assertIsNotNone(self.processor.cached_sections(self.test_txt_path, file_hash))
+    
+    def test_load_markdown_sections(self):
+        """测试Markdown直接转为纯文本并保留标题结构"""
+        md_path = os.path.join(self.test_data_dir, 'test.md')
+        with open(md_path, 'w', encoding='utf-8') as f:
+            f.write("# 总则\n\n这是**重要**的[说明](http://example.com)。\n\n"
+                    "## 适用范围\n\n- 第一条\n- 第二条\n\n"
+                    "| 项目 | 值 |\n|---|---|\n| 期限 | 三年 |\n")
+        
+        try:
+            sections = self.processor.load_sections(md_path)
+        finally:
+            os.remove(md_path)
+        
+        self.assertEqual([s["section"] for s in sections], ["总则", "总则 > 适用范围"])
+        self.assertIn("这是重要的说明。", sections[0]["text"])
+        self.assertIn("第一条\n第二条", sections[1]["text"])
+        self.assertIn("期限 | 三年", sections[1]["text"])
+        self.assertNotIn("<", sections[0]["text"])
+    
+    def test_load_docx_paragraphs_and_tables_in_order(self):
+        """测试Word文档按顺序读取段落和表格"""
+        from docx import Document
+        
+        docx_path = os.path.join(self.test_data_dir, 'test.docx')
+        doc = Document()
+        doc.add_heading("报销制度", level=1)
+        doc.add_paragraph("差旅费用标准如下：")
+        table = doc.add_table(rows=2, cols=2)
+        table.cell(0, 0).text = "城市"
+        table.cell(0, 1).text = "标准"
+        table.cell(1, 0).text = "北京"
+        table.cell(1, 1).text = "500元"
+        doc.add_paragraph("超出部分自理。")
+        doc.save(docx_path)
+        
+        try:
+            result = self.processor.process_document(docx_path)
+        finally:
+            os.remove(docx_path)
+        
+        self.assertTrue(result["success"])
+        content = "".join(chunk["content"] for chunk in result["chunks"])
+        self.assertLess(content.index("差旅费用标准"), content.index("北京 | 500元"))
+        self.assertLess(content.index("北京 | 500元"), content.index("超出部分自理"))
+        self.assertEqual(result["chunks"][0]["metadata"]["section"], "报销制度")
+    
     def test_chunk_document(self):
         """测试文档分块"""
         text = "这是一个测试文档。用于测试文档分块功能。分块应该按照指定大小进行。"
@@ -49,6 +164,21 @@ class TestDocumentProcessor(unittest.TestCase):
             self.assertIn("content", chunk)
             self.assertIn("id", chunk)
     
+    def test_token_length_chunking(self):
+        """测试按token计数分块时每块不超过嵌入模型窗口"""
+        from token_counter import token_counter
+        
+        with patch.object(system_config, 'CHUNK_LENGTH_UNIT', 'token'), \
+             patch.object(system_config, 'EMBEDDING_MAX_TOKENS', 34):
+            processor = DocumentProcessor()
+        
+        text = "\n".join(f"第{i}条：员工出差应提前提交申请，经部门负责人审批后方可出行。" for i in range(20))
+        chunks = processor.chunk_sections([{"section": "", "text": text}])
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(token_counter.count(chunk["content"]), 32)
+    
     def test_process_document(self):
         """测试完整文档处理流程"""
         result = self.processor.process_document(self.test_txt_path)
@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embedding_pool import EmbeddingPool, QUERY_LANE, BULK_LANE
+from config import system_config
+
+class TestEmbeddingPool(unittest.TestCase):
+    """嵌入进程池测试类"""
+    
+    def test_lane_settings(self):
+        """测试批量通道线程数默认使用查询通道之外的剩余核心"""
+        with patch.multiple(system_config, EMBEDDING_QUERY_WORKERS=1, EMBEDDING_QUERY_THREADS=2,
+                            EMBEDDING_BULK_WORKERS=2, EMBEDDING_BULK_THREADS=0), \
+             patch('embedding_pool.os.cpu_count', return_value=8):
+            settings = EmbeddingPool().lane_settings()
+            
+        self.assertEqual(settings[QUERY_LANE], {"workers": 1, "threads": 2})
+        self.assertEqual(settings[BULK_LANE], {"workers": 2, "threads": 3})
+    
+    def test_bulk_lane_batches_and_keeps_order(self):
+        """测试批量通道按批次分发，结果按原顺序拼接；查询通道整体提交"""
+        calls = []
+        
+        def fake_embed(texts):
+            calls.append(list(texts))
+            return np.array([[float(text)] for text in texts], dtype=np.float32)
+            
+        pool = EmbeddingPool()
+        executor = ThreadPoolExecutor(max_workers=2)
+        texts = [str(i) for i in range(7)]
+        with patch('embedding_pool._embed_in_worker', side_effect=fake_embed), \
+             patch.object(pool, '_get_executor', return_value=executor), \
+             patch.object(system_config, 'EMBEDDING_BULK_BATCH_SIZE', 3):
+            embeddings = pool.embed(texts, BULK_LANE)
+            self.assertEqual(sorted(map(len, calls)), [1, 3, 3])
+            
+            calls.clear()
+            pool.embed(texts[:2], QUERY_LANE)
+            self.assertEqual(calls, [["0", "1"]])
+        executor.shutdown()
+        
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(embeddings[:, 0].tolist(), list(range(7)))
+
+if __name__ == '__main__':
+    unittest.main()
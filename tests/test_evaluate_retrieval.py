@@ -0,0 +1,106 @@
+import os
+import sys
+import shutil
+import unittest
+from unittest.mock import MagicMock, patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from evaluate_retrieval import (
+    load_questions, recall_at_k, reciprocal_rank, pareto_front, evaluate, index_namespace
+)
+from config import system_config
+
+class TestEvaluateRetrieval(unittest.TestCase):
+    """检索评估工具测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_evaluate')
+        os.makedirs(self.test_dir, exist_ok=True)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_metrics(self):
+        """测试recall@k和倒数排名"""
+        retrieved = ["b.pdf", "a.pdf", "c.md"]
+        self.assertEqual(recall_at_k(retrieved, ["a.pdf"], 1), 0.0)
+        self.assertEqual(recall_at_k(retrieved, ["a.pdf", "c.md"], 3), 1.0)
+        self.assertEqual(reciprocal_rank(retrieved, ["a.pdf"]), 0.5)
+        self.assertEqual(reciprocal_rank(retrieved, ["x.txt"]), 0.0)
+    
+    def test_pareto_front(self):
+        """测试帕累托前沿只保留不被支配的配置"""
+        rows = [
+            {"name": "fast", "recall": 0.6, "p95_ms": 5.0},
+            {"name": "slow_worse", "recall": 0.6, "p95_ms": 9.0},
+            {"name": "best", "recall": 0.9, "p95_ms": 8.0},
+            {"name": "slow_same", "recall": 0.9, "p95_ms": 12.0}
+        ]
+        self.assertEqual([row["name"] for row in pareto_front(rows)], ["fast", "best"])
+    
+    def test_load_questions(self):
+        """测试读取JSONL和CSV标注文件"""
+        jsonl_path = os.path.join(self.test_dir, 'questions.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.write('{"question": "年假怎么算？", "expected_sources": ["手册.pdf"]}\n\n')
+            f.write('{"question": "报销时限", "expected_source": "财务.md"}\n')
+        csv_path = os.path.join(self.test_dir, 'questions.csv')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write("question,expected_sources\n年假怎么算？,手册.pdf|制度.docx\n")
+            
+        self.assertEqual(load_questions(jsonl_path)[1], {"question": "报销时限", "expected_sources": ["财务.md"]})
+        self.assertEqual(load_questions(csv_path)[0]["expected_sources"], ["手册.pdf", "制度.docx"])
+    
+    def test_index_namespace_tracks_documents_and_config(self):
+        """测试评估索引的命名空间随文档内容、分块配置变化，未变化时保持不变"""
+        path = os.path.join(self.test_dir, 'policy.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("年假十五天")
+            
+        with patch.multiple(system_config, CHUNK_STRATEGY="recursive", CHUNK_LENGTH_UNIT="char"):
+            namespace = index_namespace([path], 500, 50)
+            self.assertTrue(namespace.startswith("eval-recursive-char-c500-o50-"))
+            self.assertLessEqual(len(namespace), 63)
+            self.assertEqual(index_namespace([path], 500, 50), namespace)
+            self.assertNotEqual(index_namespace([path], 500, 0), namespace)
+            
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("年假二十天，病假另计")
+            self.assertNotEqual(index_namespace([path], 500, 50), namespace)
+        with patch.multiple(system_config, CHUNK_STRATEGY="sentence", CHUNK_LENGTH_UNIT="char"):
+            self.assertTrue(index_namespace([path], 500, 50).startswith("eval-sentence-char-"))
+    
+    def test_evaluate(self):
+        """测试单个配置的评估结果"""
+        cache_sizes = []
+        
+        def fake_search(question, top_k, **kwargs):
+            cache_sizes.append(system_config.QUERY_EMBEDDING_CACHE_SIZE)
+            return [{"metadata": {"source": source}} for source in ["a.pdf", "b.pdf"][:top_k]]
+            
+        vector_db = MagicMock()
+        vector_db.search.side_effect = fake_search
+        questions = [
+            {"question": "问题一", "expected_sources": ["a.pdf"]},
+            {"question": "问题二", "expected_sources": ["b.pdf"]}
+        ]
+        
+        original_cache_size = system_config.QUERY_EMBEDDING_CACHE_SIZE
+        row = evaluate(vector_db, questions, "eval-c500-o0", top_k=2, threshold=0.5, repeat=2)
+        
+        self.assertEqual(row["recall"], 1.0)
+        self.assertEqual(row["mrr"], 0.75)
+        self.assertEqual(row["avg_k"], 2.0)
+        self.assertEqual(vector_db.search.call_args.kwargs["cutoff"], "fixed")
+        self.assertGreaterEqual(row["p99_ms"], row["p50_ms"])
+        # 预热1次 + 2个问题各重复2次，全部在关闭查询嵌入缓存的情况下执行
+        self.assertEqual(vector_db.search.call_count, 5)
+        self.assertEqual(cache_sizes, [0] * 5)
+        self.assertEqual(system_config.QUERY_EMBEDDING_CACHE_SIZE, original_cache_size)
+
+if __name__ == '__main__':
+    unittest.main()
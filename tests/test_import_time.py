@@ -0,0 +1,53 @@
+import os
+import sys
+import subprocess
+import unittest
+
+# 添加项目根目录到Python路径
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+# 只应在首次使用对应加载器或后端时导入的依赖
+HEAVY_MODULES = ("chromadb", "PyPDF2", "pypdfium2", "docx", "langchain", "langchain_core", "requests",
+                 "sentence_transformers", "transformers", "torch", "onnxruntime")
+
+# 导入命令行入口的累计耗时上限（毫秒），留有余量，只用于发现重新引入的重量级依赖
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+def import_times(module):
+    """在新的解释器中用 -X importtime 导入模块，返回 {模块名: 累计耗时(微秒)}"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120
+    )
+    if completed.returncode != 0:
+        raise AssertionError(f"导入 {module} 失败:\n{completed.stderr[-2000:]}")
+    
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+class TestImportTime(unittest.TestCase):
+    """导入耗时回归测试类"""
+    
+    def test_core_modules_defer_heavy_imports(self):
+        """测试导入核心模块时不加载PDF/Word解析库、ChromaDB、langchain和嵌入模型依赖"""
+        for module in ("main", "rag_system", "document_processor", "vector_db", "zhipu_service", "shard_worker"):
+            with self.subTest(module=module):
+                times = import_times(module)
+                loaded = sorted({name.split(".")[0] for name in times} & set(HEAVY_MODULES))
+                self.assertEqual(loaded, [], f"导入 {module} 时加载了 {loaded}")
+    
+    def test_cli_import_within_budget(self):
+        """测试导入命令行入口的累计耗时不超过预算"""
+        times = import_times("main")
+        slowest = sorted(times.items(), key=lambda item: -item[1])[:10]
+        self.assertLess(times["main"] / 1000, IMPORT_BUDGET_MS,
+                        "导入最慢的模块: " + ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in slowest))
+
+if __name__ == '__main__':
+    unittest.main()
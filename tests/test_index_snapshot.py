@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import unittest
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from chromadb.api.client import SharedSystemClient
+from document_catalog import DocumentCatalog
+from index_snapshot import MANIFEST_FILE, CHUNKS_FILE, read_manifest
+from config import system_config
+
+def make_document(source, contents):
+    """构造已分块的文档数据"""
+    stem = os.path.splitext(source)[0]
+    return {
+        "chunks": [{"id": f"{stem}_{i}", "content": content, "metadata": {"chunk_index": i}}
+                   for i, content in enumerate(contents)],
+        "metadata": {"source": source, "file_hash": stem}
+    }
+
+class TestIndexSnapshot(unittest.TestCase):
+    """索引快照导出/导入测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_index_snapshot')
+        self.snapshot_dir = os.path.join(self.test_dir, 'snapshot')
+        self.catalogs = []
+    
+    def tearDown(self):
+        """测试后清理"""
+        for catalog in self.catalogs:
+            if catalog._conn is not None:
+                catalog._conn.close()
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def make_system(self, name):
+        """创建使用独立向量库和文档目录的系统（模拟不同机器）"""
+        from rag_system import RAGSystem
+        
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, name, 'vector_db')):
+            rag = RAGSystem()
+            rag.catalog = DocumentCatalog(os.path.join(self.test_dir, name, 'documents.sqlite3'))
+            self.assertTrue(rag.vector_db.initialize())
+            rag._initialized = True
+        self.catalogs.append(rag.catalog)
+        return rag
+    
+    @patch('vector_db.zhipu_service')
+    def test_export_then_import_without_embedding(self, mock_zhipu_service):
+        """测试导出后在新的向量库中导入：块、向量和文档目录一致，且不调用嵌入模型"""
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[float(len(text)), 1.0, 0.5] for text in texts]
+        
+        with patch.multiple(system_config, SNAPSHOT_BATCH_SIZE=2, TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=False):
+            source = self.make_system('source')
+            for name in ("policy_a.txt", "policy_b.txt"):
+                source._ingest(make_document(name, ["内容" * (i + 1) for i in range(3)]))
+            exported = source.export_index(self.snapshot_dir)
+            self.assertTrue(exported["success"], exported)
+            self.assertEqual(exported["count"], 6)
+            self.assertEqual(read_manifest(self.snapshot_dir)["dimension"], 3)
+            
+            embed_calls = mock_zhipu_service.embed.call_count
+            replica = self.make_system('replica')
+            imported = replica.import_index(self.snapshot_dir)
+            self.assertTrue(imported["success"], imported)
+            self.assertEqual(mock_zhipu_service.embed.call_count, embed_calls)
+            
+        self.assertEqual(replica.vector_db.get_document_count(), 6)
+        self.assertEqual(sorted(replica.catalog.get_chunk_ids("policy_b.txt")), ["policy_b_0", "policy_b_1", "policy_b_2"])
+        self.assertEqual(replica.catalog.count(), 2)
+        stored = replica.vector_db.get_embeddings(["policy_a_2"])
+        self.assertEqual(stored["policy_a_2"].tolist(), [6.0, 1.0, 0.5])
+        self.assertEqual(replica.vector_db.get_chunks("policy_a.txt")[1]["content"], "内容内容")
+    
+    @patch('vector_db.zhipu_service')
+    def test_corrupt_or_mismatched_snapshot_keeps_existing_index(self, mock_zhipu_service):
+        """测试快照损坏或嵌入模型不一致时拒绝导入，已有索引保持不变"""
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[1.0, 0.0, 0.0] for _ in texts]
+        
+        with patch.multiple(system_config, TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=False):
+            rag = self.make_system('source')
+            rag._ingest(make_document("a.txt", ["年假"]))
+            self.assertTrue(rag.export_index(self.snapshot_dir)["success"])
+            
+            with patch.object(system_config, 'EMBEDDING_MODEL_NAME', 'other-model'):
+                result = rag.import_index(self.snapshot_dir)
+            self.assertFalse(result["success"])
+            self.assertIn("other-model", result["error"])
+            
+            with open(os.path.join(self.snapshot_dir, CHUNKS_FILE), 'ab') as file:
+                file.write(b'corrupted')
+            result = rag.import_index(self.snapshot_dir)
+            self.assertFalse(result["success"])
+            self.assertIn(CHUNKS_FILE, result["error"])
+            
+            os.remove(os.path.join(self.snapshot_dir, MANIFEST_FILE))
+            self.assertFalse(rag.import_index(self.snapshot_dir)["success"])
+            
+        self.assertEqual(rag.vector_db.get_document_count(), 1)
+        self.assertEqual(rag.catalog.get_chunk_ids("a.txt"), ["a_0"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm_cache import LLMResponseCache
+from zhipu_service import zhipu_service
+from config import system_config
+
+def api_response(content):
+    """构造智普AI接口响应"""
+    response = MagicMock()
+    response.json.return_value = {"choices": [{"message": {"content": content}}], "usage": {"total_tokens": 10}, "model": "glm-4"}
+    return response
+
+class TestLLMResponseCache(unittest.TestCase):
+    """大模型响应缓存测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = LLMResponseCache(os.path.join(self.cache_dir, "llm.sqlite3"))
+        self.messages = [{"role": "user", "content": "年假有几天？"}]
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.cache.close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+    
+    def test_key_covers_messages_and_sampling_params(self):
+        """测试缓存键随消息和采样参数变化，与字段顺序无关"""
+        payload = {"model": "glm-4", "messages": self.messages, "temperature": 0.0, "max_tokens": 100, "top_p": 0.9}
+        self.assertEqual(self.cache.make_key(payload), self.cache.make_key(dict(reversed(list(payload.items())))))
+        self.assertNotEqual(self.cache.make_key(payload), self.cache.make_key({**payload, "temperature": 0.1}))
+        self.assertNotEqual(self.cache.make_key(payload), self.cache.make_key({**payload, "messages": []}))
+    
+    def test_read_write_only_caches_low_temperature(self):
+        """测试 read_write 模式只缓存低温度请求，命中时不再请求API"""
+        with patch('zhipu_service.llm_cache', self.cache), \
+             patch.object(zhipu_service.session, 'post', return_value=api_response("15天")) as post, \
+             patch.multiple(system_config, LLM_CACHE_MODE="read_write", LLM_CACHE_MAX_TEMPERATURE=0.1):
+            first = zhipu_service.chat_completion(self.messages, temperature=0.0)
+            second = zhipu_service.chat_completion(self.messages, temperature=0.0)
+            self.assertEqual(post.call_count, 1)
+            self.assertNotIn("cached", first)
+            self.assertTrue(second["cached"])
+            self.assertEqual(second["content"], "15天")
+            
+            zhipu_service.chat_completion(self.messages, temperature=0.7)
+            zhipu_service.chat_completion(self.messages, temperature=0.7)
+            self.assertEqual(post.call_count, 3)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+    
+    def test_record_then_replay_offline(self):
+        """测试 record 模式记录任意温度的响应，replay 模式不访问网络，未命中时返回失败"""
+        with patch('zhipu_service.llm_cache', self.cache), \
+             patch.object(zhipu_service.session, 'post', return_value=api_response("15天")) as post:
+            with patch.object(system_config, 'LLM_CACHE_MODE', "record"):
+                zhipu_service.chat_completion(self.messages, temperature=0.7)
+            self.assertEqual(post.call_count, 1)
+            
+            with patch.object(system_config, 'LLM_CACHE_MODE', "replay"):
+                replayed = zhipu_service.chat_completion(self.messages, temperature=0.7)
+                missed = zhipu_service.chat_completion([{"role": "user", "content": "新问题"}], temperature=0.7)
+            self.assertEqual(post.call_count, 1)
+            
+        self.assertEqual(replayed["content"], "15天")
+        self.assertFalse(missed["success"])
+    
+    def test_eviction_by_entries_and_size(self):
+        """测试超出条目数或总大小上限时淘汰最久未使用的条目"""
+        payloads = [{"model": "glm-4", "messages": [{"role": "user", "content": str(i)}]} for i in range(4)]
+        keys = [self.cache.make_key(payload) for payload in payloads]
+        with patch.multiple(system_config, LLM_CACHE_MAX_ENTRIES=3, LLM_CACHE_MAX_MB=1):
+            for key, payload in zip(keys[:3], payloads):
+                self.cache.put(key, payload, {"content": "答案"})
+            self.cache.get(keys[0])
+            self.cache.put(keys[3], payloads[3], {"content": "答案"})
+            
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.stats()["entries"], 3)
+        
+        with patch.object(system_config, 'LLM_CACHE_MAX_MB', 0):
+            self.cache.put(keys[1], payloads[1], {"content": "答案"})
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
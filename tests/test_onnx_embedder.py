@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import shutil
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from onnx_embedder import (
+    OnnxEmbedder, pool_embeddings, parity_check, check_parity, parity_passed, model_file, detect_pooling,
+    EXPORT_INFO_NAME
+)
+from config import system_config
+
+class TestOnnxEmbedder(unittest.TestCase):
+    """ONNX嵌入后端测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_onnx')
+        os.makedirs(self.test_dir, exist_ok=True)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_pooling(self):
+        """测试平均池化忽略填充位置，结果已归一化"""
+        hidden = np.array([[[3.0, 0.0], [0.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+        mask = np.array([[1, 1, 0]])
+        
+        mean = pool_embeddings(hidden, mask, "mean")
+        np.testing.assert_allclose(mean, [[0.6, 0.8]], rtol=1e-6)
+        np.testing.assert_allclose(pool_embeddings(hidden, mask, "cls"), [[1.0, 0.0]])
+        self.assertEqual(mean.dtype, np.float32)
+    
+    def test_detect_pooling(self):
+        """测试按模型的 1_Pooling/config.json 选择池化方式，未安装SentenceTransformers时使用平均池化"""
+        os.makedirs(os.path.join(self.test_dir, "1_Pooling"))
+        with open(os.path.join(self.test_dir, "1_Pooling", "config.json"), 'w', encoding='utf-8') as file:
+            json.dump({"pooling_mode_cls_token": True, "pooling_mode_mean_tokens": False}, file)
+            
+        with patch('importlib.util.find_spec', return_value=object()):
+            self.assertEqual(detect_pooling(self.test_dir), "cls")
+            self.assertEqual(detect_pooling(os.path.join(self.test_dir, "missing")), "mean")
+        with patch('importlib.util.find_spec', return_value=None):
+            self.assertEqual(detect_pooling(self.test_dir), "mean")
+        with patch.object(system_config, 'ONNX_POOLING', 'auto'), \
+             patch('onnx_embedder.detect_pooling', return_value="cls"):
+            self.assertEqual(OnnxEmbedder(model_path="model.onnx").pooling, "cls")
+    
+    def test_parity_loads_and_warms_up_before_timing(self):
+        """测试一致性校验先加载ONNX会话，两侧各预热一次后再计时"""
+        reference = MagicMock(side_effect=lambda texts: np.eye(len(texts), 8, dtype=np.float32))
+        with patch.object(system_config, 'ONNX_MODEL_DIR', self.test_dir), \
+             patch.object(OnnxEmbedder, 'load') as mock_load, \
+             patch.object(OnnxEmbedder, 'embed', side_effect=lambda texts: np.eye(len(texts), 8, dtype=np.float32)) as mock_embed:
+            result = check_parity(reference_embed=reference, texts=["a", "b", "c"])
+            
+        self.assertTrue(result["passed"])
+        mock_load.assert_called_once()
+        self.assertEqual([call.args[0] for call in mock_embed.call_args_list], [["a"], ["a", "b", "c"]])
+        self.assertEqual([call.args[0] for call in reference.call_args_list], [["a"], ["a", "b", "c"]])
+    
+    def test_parity_check(self):
+        """测试一致性校验按最小余弦相似度判断"""
+        reference = np.array([[1.0, 0.0], [0.0, 1.0]])
+        self.assertTrue(parity_check(reference, reference * 2, threshold=0.99)["passed"])
+        
+        result = parity_check(reference, np.array([[1.0, 0.0], [0.3, 1.0]]), threshold=0.99)
+        self.assertFalse(result["passed"])
+        self.assertAlmostEqual(result["min_cosine"], 1 / np.sqrt(1.09), places=5)
+    
+    def test_embed_with_session(self):
+        """测试分词结果按模型输入名传入，并对输出池化"""
+        embedder = OnnxEmbedder(model_path="model.onnx", pooling="mean")
+        embedder._tokenizer = MagicMock()
+        embedder._tokenizer.encode_batch.return_value = [
+            SimpleNamespace(ids=[101, 7, 102], attention_mask=[1, 1, 1], type_ids=[0, 0, 0]),
+            SimpleNamespace(ids=[101, 102, 0], attention_mask=[1, 1, 0], type_ids=[0, 0, 0])
+        ]
+        embedder._session = MagicMock()
+        embedder._session.run.return_value = [np.ones((2, 3, 4), dtype=np.float32)]
+        embedder._input_names = {"input_ids", "attention_mask"}
+        
+        embeddings = embedder.embed(["你好", ""])
+        
+        feed = embedder._session.run.call_args.args[1]
+        self.assertEqual(sorted(feed), ["attention_mask", "input_ids"])
+        self.assertEqual(embeddings.shape, (2, 4))
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), [1.0, 1.0], rtol=1e-6)
+    
+    def test_parity_result_gates_backend(self):
+        """测试一致性校验结果写入导出记录，未通过时ONNX后端回退到PyTorch"""
+        with patch.object(system_config, 'ONNX_MODEL_DIR', self.test_dir), \
+             patch.object(system_config, 'ONNX_QUANTIZE', True), \
+             patch.object(system_config, 'ONNX_PARITY_THRESHOLD', 0.99):
+            self.assertIsNone(parity_passed())
+            
+            reference = lambda texts: np.eye(len(texts), 8, dtype=np.float32)
+            noisy = lambda texts: np.eye(len(texts), 8, dtype=np.float32) + 0.5
+            result = check_parity(onnx_embed=noisy, reference_embed=reference, texts=["a", "b", "c"])
+            self.assertTrue(result["success"])
+            self.assertFalse(result["passed"])
+            self.assertFalse(parity_passed())
+            
+            with open(os.path.join(self.test_dir, EXPORT_INFO_NAME), encoding='utf-8') as file:
+                self.assertIn(os.path.basename(model_file()), json.load(file)["parity"])
+                
+            from zhipu_service import zhipu_service
+            open(model_file(), 'wb').close()
+            with patch('onnx_embedder.OnnxEmbedder.load') as mock_load:
+                self.assertFalse(zhipu_service._init_onnx_model())
+                mock_load.assert_not_called()
+                
+                check_parity(onnx_embed=reference, reference_embed=reference, texts=["a", "b"])
+                self.assertTrue(zhipu_service._init_onnx_model())
+                mock_load.assert_called_once()
+            zhipu_service.onnx_embedder = None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import pstats
+import shutil
+import unittest
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tracemalloc
+from profiler import profiled, run_profiled
+from config import system_config
+
+def busy_wait(seconds):
+    """占用CPU一段时间，供采样剖析捕获"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+class FakeSystem:
+    """带剖析装饰器的模拟系统"""
+    
+    @profiled("ingest", track_memory=True, path_label=True)
+    def add_document(self, file_path):
+        buffer = bytearray(8 * 1024 * 1024)
+        return {"success": True, "size": len(buffer)}
+    
+    @profiled("query")
+    def query(self, question):
+        busy_wait(0.1)
+        return {"success": True, "answer": question}
+    
+    @profiled("batch")
+    def batch(self, file_paths):
+        return [self.add_document(path) for path in file_paths]
+
+class TestProfiler(unittest.TestCase):
+    """性能剖析测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_profiler')
+        self.system = FakeSystem()
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def read_profiles(self):
+        """读取剖析目录中的全部元数据"""
+        metas = []
+        for name in sorted(os.listdir(self.test_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(self.test_dir, name), 'r', encoding='utf-8') as file:
+                    metas.append(json.load(file))
+        return metas
+    
+    def test_off_mode_writes_nothing(self):
+        """测试未启用剖析时直接调用，不写入任何文件"""
+        with patch.multiple(system_config, PROFILE_MODE="off", PROFILE_DIR=self.test_dir):
+            self.assertEqual(self.system.query("年假")["answer"], "年假")
+            self.assertEqual(run_profiled("query", "年假", lambda: 1), 1)
+        self.assertFalse(os.path.exists(self.test_dir))
+    
+    def test_cprofile_records_stats_and_peak_memory(self):
+        """测试cProfile模式写入pstats文件和元数据，入库记录内存峰值，嵌套调用只剖析最外层"""
+        with patch.multiple(system_config, PROFILE_MODE="cprofile", PROFILE_DIR=self.test_dir, ZHIPU_API_KEY="secret"):
+            self.system.add_document(os.path.join("docs", "员工手册.pdf"))
+            self.system.batch(["a.txt", "b.txt"])
+            
+        metas = self.read_profiles()
+        self.assertEqual(sorted(meta["kind"] for meta in metas), ["batch", "ingest"])
+        ingest = next(meta for meta in metas if meta["kind"] == "ingest")
+        self.assertEqual(ingest["label"], "员工手册.pdf")
+        self.assertTrue(ingest["success"])
+        self.assertGreaterEqual(ingest["peak_memory_bytes"], 8 * 1024 * 1024)
+        self.assertNotIn("ZHIPU_API_KEY", ingest["environment"]["config"])
+        self.assertFalse(tracemalloc.is_tracing())
+        
+        stats = pstats.Stats(os.path.join(self.test_dir, next(f for f in ingest["files"] if f.endswith(".prof"))))
+        self.assertTrue(any(func[2] == "add_document" for func in stats.stats))
+    
+    def test_sample_mode_writes_collapsed_stacks(self):
+        """测试采样模式写入折叠栈，栈从根到叶，包含被剖析的函数"""
+        with patch.multiple(system_config, PROFILE_MODE="sample", PROFILE_DIR=self.test_dir, PROFILE_SAMPLE_INTERVAL_MS=2):
+            self.system.query("报销流程是什么？")
+            
+        meta = self.read_profiles()[0]
+        self.assertEqual(meta["files"], [f for f in meta["files"] if f.endswith(".collapsed")])
+        self.assertIsNone(meta["peak_memory_bytes"])
+        self.assertGreater(meta["samples"], 5)
+        with open(os.path.join(self.test_dir, meta["files"][0]), 'r', encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn("FakeSystem.query", stack)
+        self.assertTrue(stack.split(";")[-1].startswith("busy_wait"))
+        self.assertEqual(sum(int(line.rsplit(" ", 1)[1]) for line in lines), meta["samples"])
+
+if __name__ == '__main__':
+    unittest.main()
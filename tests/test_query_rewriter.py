@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from query_rewriter import QueryRewriter
+from qa_engine import reciprocal_rank_fusion
+
+class TestQueryRewriter(unittest.TestCase):
+    """查询改写与结果融合测试类"""
+    
+    def test_heuristic_rewrites(self):
+        """测试本地规则改写：原问题在首位，去除疑问词并拆分并列子问题"""
+        rewriter = QueryRewriter(mode="heuristic", max_rewrites=3)
+        
+        self.assertEqual(rewriter.rewrite("什么是试用期？"), ["什么是试用期？", "试用期", "试用期的定义", "试用期是指"])
+        self.assertEqual(rewriter.rewrite("报销流程以及审批时限是什么"),
+                         ["报销流程以及审批时限是什么", "报销流程以及审批时限", "报销流程", "审批时限"])
+    
+    def test_disabled_returns_original(self):
+        """测试关闭改写时只返回原问题"""
+        self.assertEqual(QueryRewriter(mode="off").rewrite("年假怎么算？"), ["年假怎么算？"])
+    
+    def test_llm_rewrite_respects_budget_and_caches(self):
+        """测试大模型改写超出时间预算时回退到原问题，完成后结果进入缓存"""
+        rewriter = QueryRewriter(mode="llm", max_rewrites=2)
+        
+        def slow_completion(messages, **kwargs):
+            time.sleep(0.3)
+            return {"success": True, "content": "1. 年假天数计算方法\n2. 带薪休假规定\n年假天数计算方法"}
+            
+        with patch('zhipu_service.zhipu_service.chat_completion', side_effect=slow_completion) as mock_llm:
+            start = time.perf_counter()
+            self.assertEqual(rewriter.rewrite("年假怎么算？", budget_seconds=0.05), ["年假怎么算？"])
+            self.assertLess(time.perf_counter() - start, 0.25)
+            
+            rewriter._executor.shutdown(wait=True)
+            self.assertEqual(rewriter.rewrite("年假怎么算？", budget_seconds=0.05),
+                             ["年假怎么算？", "年假天数计算方法", "带薪休假规定"])
+            self.assertEqual(mock_llm.call_count, 1)
+    
+    def test_reciprocal_rank_fusion(self):
+        """测试融合结果按ID去重，多个查询都命中的块排在前面"""
+        def result(doc_id, similarity):
+            return {"id": doc_id, "content": doc_id, "metadata": {}, "similarity": similarity}
+            
+        fused = reciprocal_rank_fusion([
+            [result("a", 0.9), result("b", 0.8)],
+            [result("b", 0.85), result("c", 0.7)],
+            [result("c", 0.75), result("b", 0.6)]
+        ], top_k=2, k=60)
+        
+        self.assertEqual([item["id"] for item in fused], ["b", "c"])
+        self.assertEqual([item["rank"] for item in fused], [1, 2])
+        self.assertEqual(fused[0]["similarity"], 0.85)
+
+if __name__ == '__main__':
+    unittest.main()
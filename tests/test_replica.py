@@ -0,0 +1,119 @@
+import os
+import sys
+import shutil
+import unittest
+import numpy as np
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from chromadb.api.client import SharedSystemClient
+from document_catalog import DocumentCatalog
+from replica import ReplicaVectorDB, current_snapshot, READ_ONLY_ERROR
+from config import system_config
+
+def fake_embed(texts, **kwargs):
+    """按文本内容生成确定的三维向量"""
+    return [[float(text.count("年假")), float(text.count("报销")), 1.0] for text in texts]
+
+def make_document(source, contents):
+    """构造已分块的文档数据"""
+    stem = os.path.splitext(source)[0]
+    return {
+        "chunks": [{"id": f"{stem}_{i}", "content": content, "metadata": {"chunk_index": i}}
+                   for i, content in enumerate(contents)],
+        "metadata": {"source": source, "file_hash": stem}
+    }
+
+class TestReplica(unittest.TestCase):
+    """只读查询副本测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_replica')
+        self.patches = [
+            patch('vector_db.zhipu_service'),
+            patch.multiple(system_config, VECTOR_DB_DIR=os.path.join(self.test_dir, 'vector_db'),
+                           REPLICA_SNAPSHOT_DIR=os.path.join(self.test_dir, 'snapshots'),
+                           REPLICA_REFRESH_SECONDS=0, REPLICA_KEEP_SNAPSHOTS=1,
+                           TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=False)
+        ]
+        self.patches[0].start().embed.side_effect = fake_embed
+        self.patches[1].start()
+        
+        from rag_system import RAGSystem
+        self.writer = RAGSystem()
+        self.writer.catalog = DocumentCatalog(os.path.join(self.test_dir, 'documents.sqlite3'))
+        self.assertTrue(self.writer.vector_db.initialize())
+        self.writer._initialized = True
+        self.writer._ingest(make_document("policy.txt", ["年假十五天", "报销需要发票", "年假可以分开休，年假需提前申请"]))
+    
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        self.writer.catalog._conn.close()
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def test_replica_serves_published_snapshot_and_switches(self):
+        """测试副本检索结果与读写库一致、拒绝写入，并在新快照发布后切换"""
+        first = self.writer.publish_snapshot()
+        self.assertTrue(first["success"], first)
+        
+        replica = ReplicaVectorDB()
+        self.assertTrue(replica.initialize())
+        expected = self.writer.vector_db.search_with_scores("年假", top_k=3, cutoff="fixed", similarity_threshold=0.0)
+        actual = replica.search_with_scores("年假", top_k=3, cutoff="fixed", similarity_threshold=0.0)
+        self.assertEqual([r["id"] for r in actual["results"]], [r["id"] for r in expected["results"]])
+        np.testing.assert_allclose(actual["scores"], expected["scores"], atol=1e-5)
+        self.assertEqual(replica.get_chunks("policy.txt")[1]["content"], "报销需要发票")
+        self.assertEqual(replica.get_catalog().count(), 1)
+        self.assertEqual(replica.add_documents([{"id": "x", "content": "x"}])["error"], READ_ONLY_ERROR)
+        
+        self.writer._ingest(make_document("expense.txt", ["报销流程"]))
+        second = self.writer.publish_snapshot()
+        self.assertEqual(current_snapshot(system_config.DEFAULT_NAMESPACE), second["snapshot"])
+        # 只保留当前快照，已加载旧快照的副本仍可继续读取其内存映射
+        published = os.listdir(os.path.join(system_config.REPLICA_SNAPSHOT_DIR, system_config.DEFAULT_NAMESPACE))
+        self.assertEqual(sorted(published), sorted(["CURRENT", second["snapshot"]]))
+        self.assertEqual(replica.get_document_count(), 4)
+        self.assertEqual(replica.snapshot_generation(), 2)
+        self.assertEqual(replica.get_catalog().count(), 2)
+    
+    def test_blockwise_search_and_filter(self):
+        """测试分批精确检索合并的top-k与整体排序一致，并支持按来源过滤"""
+        self.writer._ingest(make_document("expense.txt", ["报销", "报销报销", "年假报销"]))
+        self.assertTrue(self.writer.publish_snapshot()["success"])
+        
+        replica = ReplicaVectorDB()
+        replica.initialize()
+        snapshot = replica._snapshot()
+        query = np.asarray(fake_embed(["年假年假报销"]), dtype=np.float32)
+        with patch('replica._SEARCH_BLOCK_ROWS', 2):
+            hits = snapshot.search(query, top_k=3)[0]
+            filtered = snapshot.search(query, top_k=5, rows=snapshot.filter_rows({"source": "expense.txt"}))[0]
+            
+        embeddings = np.asarray(snapshot.embeddings)
+        scores = embeddings @ query[0] / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query[0]))
+        self.assertEqual([row for row, _ in hits], np.argsort(-scores, kind='stable')[:3].tolist())
+        self.assertEqual(sorted(snapshot.ids[row] for row, _ in filtered), ["expense_0", "expense_1", "expense_2"])
+    
+    def test_rag_system_in_replica_mode(self):
+        """测试 replica 模式的系统使用快照中的文档目录，写入操作直接返回失败"""
+        from rag_system import RAGSystem
+        
+        self.writer.publish_snapshot()
+        with patch.object(system_config, 'VECTOR_DB_MODE', "replica"):
+            rag = RAGSystem()
+        rag.vector_db.initialize()
+        rag._initialized = True
+        
+        self.assertEqual([doc["source"] for doc in rag.get_document_sources()], ["policy.txt"])
+        self.assertEqual(rag.delete_document("policy.txt")["error"], READ_ONLY_ERROR)
+        self.assertEqual(rag.clear_documents()["error"], READ_ONLY_ERROR)
+        self.assertEqual(rag.get_revision(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sentence_splitter import split_sentences, SentenceTextSplitter, SemanticTextSplitter
+
+class TestSentenceSplitter(unittest.TestCase):
+    """句子边界分块器测试类"""
+    
+    def test_split_sentences(self):
+        """测试按中英文标点切分句子且拼接后与原文一致"""
+        text = "第一条：员工应遵守制度。违者处罚！真的吗？“是的。”Hello world. It works.\n新段落"
+        sentences = split_sentences(text)
+        
+        self.assertEqual("".join(sentences), text)
+        self.assertEqual(sentences[:4], ["第一条：员工应遵守制度。", "违者处罚！", "真的吗？", "“是的。”"])
+        self.assertEqual(sentences[4:], ["Hello world. ", "It works.\n", "新段落"])
+    
+    def test_chunks_end_on_sentence_boundaries(self):
+        """测试分块只在句子边界断开，重叠部分为完整句子"""
+        text = "".join(f"第{i}条规定内容。" for i in range(10))
+        splitter = SentenceTextSplitter(chunk_size=20, chunk_overlap=8)
+        chunks = splitter.split_text(text)
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 20)
+            self.assertTrue(chunk.endswith("。"))
+        self.assertTrue(chunks[1].startswith("第1条"))
+    
+    def test_semantic_breakpoints(self):
+        """测试在相邻句子相似度低的位置断开"""
+        def fake_embed(sentences):
+            return [[1.0, 0.0] if "条" in sentence else [0.0, 1.0] for sentence in sentences]
+            
+        splitter = SemanticTextSplitter(
+            chunk_size=100, chunk_overlap=0, breakpoint_percentile=50, embed_function=fake_embed
+        )
+        chunks = splitter.split_text("第一条甲。第二条乙。天气好。天气晴。第三条丙。")
+        
+        self.assertEqual(chunks, ["第一条甲。第二条乙。", "天气好。天气晴。", "第三条丙。"])
+
+if __name__ == '__main__':
+    unittest.main()
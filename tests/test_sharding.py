@@ -0,0 +1,139 @@
+import os
+import sys
+import shutil
+import unittest
+import numpy as np
+from unittest.mock import patch
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shard_worker
+from chromadb.api.client import SharedSystemClient
+from document_catalog import DocumentCatalog
+from sharding import ShardedVectorDB, shard_for
+from vector_db import VectorDBManager
+from config import system_config
+
+def fake_embed(texts, **kwargs):
+    """按文本内容生成确定的三维向量（不同文本的向量各不相同，避免并列影响排序比较）"""
+    return [[float(text.count("年假")), float(text.count("报销")), 1.0 + sum(map(ord, text)) % 97 / 50] for text in texts]
+
+def make_chunks(source, contents):
+    """构造某个来源的文档块"""
+    stem = os.path.splitext(source)[0]
+    return [{"id": f"{stem}_{i}", "content": content, "metadata": {"chunk_index": i}} for i, content in enumerate(contents)]
+
+DOCUMENTS = {
+    "policy.txt": ["年假十五天", "年假可以分开休，年假需提前申请", "病假需要证明"],
+    "expense.txt": ["报销需要发票", "报销报销", "差旅报销标准"],
+    "handbook.txt": ["年假和报销都在系统中申请", "入职须知"],
+    "faq.txt": ["年假年假年假", "报销多久到账"]
+}
+
+class TestSharding(unittest.TestCase):
+    """分片向量检索测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.test_dir = os.path.join(os.path.dirname(__file__), 'test_sharding')
+        self.databases = []
+        self.patches = [
+            patch('vector_db.zhipu_service'),
+            patch.multiple(system_config, VECTOR_DB_SHARDS=3, INDEX_WARMUP_ENABLED=False,
+                           TEXT_CACHE_ENABLED=False, DEDUP_ENABLED=False)
+        ]
+        self.patches[0].start().embed.side_effect = fake_embed
+        self.patches[1].start()
+    
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        for db in self.databases:
+            if isinstance(db, ShardedVectorDB):
+                db.shutdown()
+        SharedSystemClient.clear_system_cache()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+    
+    def make_db(self, cls, name):
+        """在独立目录中创建并初始化向量库"""
+        with patch.object(system_config, 'VECTOR_DB_DIR', os.path.join(self.test_dir, name)):
+            db = cls()
+            self.databases.append(db)
+            self.assertTrue(db.initialize())
+        return db
+    
+    def test_sharded_results_match_single_collection(self):
+        """测试分片检索归并后的结果与单集合一致，写入、删除和计数按来源路由"""
+        single = self.make_db(VectorDBManager, 'single')
+        sharded = self.make_db(ShardedVectorDB, 'sharded')
+        for db in (single, sharded):
+            for source, contents in DOCUMENTS.items():
+                self.assertTrue(db.add_documents(make_chunks(source, contents), metadata={"source": source})["success"])
+                
+        self.assertEqual(sharded.get_document_count(), 10)
+        shard_counts = sharded.get_status()["shard_counts"]
+        expected_counts = [0] * 3
+        for source, contents in DOCUMENTS.items():
+            expected_counts[shard_for(source, 3)] += len(contents)
+        self.assertEqual(shard_counts, expected_counts)
+        
+        for query in ("年假", "报销发票", "入职"):
+            expected = single.search_with_scores(query, top_k=4, cutoff="fixed", similarity_threshold=0.0)
+            actual = sharded.search_with_scores(query, top_k=4, cutoff="fixed", similarity_threshold=0.0)
+            np.testing.assert_allclose(actual["scores"], expected["scores"], atol=1e-5)
+            self.assertEqual(sorted(r["id"] for r in actual["results"]), sorted(r["id"] for r in expected["results"]))
+        filtered = sharded.search("年假", top_k=5, filter_dict={"source": "handbook.txt"},
+                                  cutoff="fixed", similarity_threshold=0.0)
+        self.assertEqual(sorted(r["id"] for r in filtered), ["handbook_0", "handbook_1"])
+        self.assertEqual([c["content"] for c in sharded.get_chunks("policy.txt")], DOCUMENTS["policy.txt"])
+        
+        self.assertTrue(sharded.delete_documents(["expense_0", "expense_2", "missing"])["success"])
+        self.assertEqual(sharded.get_document_count(), 8)
+        self.assertEqual(sorted(sharded.get_embeddings(["expense_1", "expense_2"])), ["expense_1"])
+        
+        # 中断的导入残留的临时集合不列为命名空间
+        sharded._run({0: (shard_worker.begin_replace, "team-a", "import", sharded._index_metadata())})
+        self.assertEqual(sharded.list_namespaces(), [system_config.DEFAULT_NAMESPACE])
+    
+    def make_system(self, name, mode):
+        """创建使用独立向量库和文档目录的系统"""
+        from rag_system import RAGSystem
+        
+        with patch.multiple(system_config, VECTOR_DB_MODE=mode, VECTOR_DB_DIR=os.path.join(self.test_dir, name)):
+            rag = RAGSystem()
+            self.databases.append(rag.vector_db)
+            self.assertTrue(rag.vector_db.initialize())
+        rag.catalog = DocumentCatalog(os.path.join(self.test_dir, f"{name}.sqlite3"))
+        rag._initialized = True
+        return rag
+    
+    def test_snapshot_import_reroutes_and_shard_count_is_checked(self):
+        """测试快照导入分片库时按来源重新路由，分片数与已有数据不一致时拒绝启动"""
+        source = self.make_system('single', "local")
+        for name, contents in DOCUMENTS.items():
+            source._ingest({"chunks": make_chunks(name, contents), "metadata": {"source": name, "file_hash": name}})
+        snapshot_dir = os.path.join(self.test_dir, 'snapshot')
+        self.assertTrue(source.export_index(snapshot_dir)["success"])
+        
+        rag = self.make_system('sharded', "sharded")
+        imported = rag.import_index(snapshot_dir)
+        self.assertTrue(imported["success"], imported)
+        self.assertEqual(rag.vector_db.get_document_count(), 10)
+        expected_counts = [0] * 3
+        for name, contents in DOCUMENTS.items():
+            expected_counts[shard_for(name, 3)] += len(contents)
+        self.assertEqual(rag.vector_db.get_status()["shard_counts"], expected_counts)
+        self.assertEqual(rag.catalog.count(), 4)
+        self.assertEqual(rag.vector_db.get_chunks("faq.txt")[1]["content"], "报销多久到账")
+        for catalog in (source.catalog, rag.catalog):
+            catalog._conn.close()
+            
+        with patch.multiple(system_config, VECTOR_DB_SHARDS=2, VECTOR_DB_DIR=os.path.join(self.test_dir, 'sharded')):
+            resized = ShardedVectorDB()
+            self.databases.append(resized)
+            self.assertFalse(resized.initialize())
+
+if __name__ == '__main__':
+    unittest.main()
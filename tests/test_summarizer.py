@@ -0,0 +1,109 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from summarizer import DocumentSummarizer, SummaryCache, group_texts, reduce_groups
+from config import system_config
+
+class TestDocumentSummarizer(unittest.TestCase):
+    """分层文档摘要测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.vector_db = MagicMock()
+        self.vector_db.get_chunks.return_value = [
+            {"content": f"第{i}段内容" + "字" * 40, "metadata": {"file_hash": "abc123", "chunk_index": i}}
+            for i in range(6)
+        ]
+        self.summarizer = DocumentSummarizer(self.vector_db, cache=SummaryCache(self.cache_dir))
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+    
+    def test_group_texts(self):
+        """测试按原顺序分组，超长文本独占一组"""
+        self.assertEqual(group_texts(["aa", "bb", "cc", "dddddd", "e"], 5), [["aa", "bb"], ["cc"], ["dddddd"], ["e"]])
+        self.assertEqual(group_texts([], 5), [])
+    
+    def test_reduce_groups(self):
+        """测试合并分组每组至少两条部分摘要"""
+        self.assertEqual(reduce_groups(["aaaaaa", "bb", "cc", "dddddd"], 5), [["aaaaaa", "bb", "cc", "dddddd"]])
+        self.assertEqual(reduce_groups(["aa", "bb", "cc", "dd"], 4), [["aa", "bb"], ["cc", "dd"]])
+        self.assertEqual(reduce_groups(["aaaaaa", "bbbbbb", "cccccc"], 5), [["aaaaaa", "bbbbbb", "cccccc"]])
+        self.assertEqual(reduce_groups(["aaaaaa", "bbbbbb", "cccccc", "dddddd"], 5), [["aaaaaa", "bbbbbb"], ["cccccc", "dddddd"]])
+    
+    def test_long_partials_still_converge(self):
+        """测试部分摘要比分组容量还长时每层仍减少摘要数，达到层数上限后截断做最后一次合并"""
+        self.vector_db.get_chunks.return_value = [
+            {"content": f"第{i}段" + "字" * 60, "metadata": {"file_hash": "long", "chunk_index": i}} for i in range(8)
+        ]
+        calls = []
+        
+        def verbose_completion(messages):
+            calls.append(messages[1]["content"])
+            return {"success": True, "content": "长" * 150}
+            
+        with patch('zhipu_service.zhipu_service.chat_completion', side_effect=verbose_completion), \
+             patch('summarizer.MAX_REDUCE_LEVELS', 2), \
+             patch.multiple(system_config, SUMMARY_GROUP_CHARS=100, SUMMARY_CACHE_ENABLED=False, MAX_CONCURRENT_REQUESTS=2):
+            result = self.summarizer.summarize("long.txt")
+            
+        self.assertTrue(result["success"])
+        self.assertEqual(result["levels"], 3)
+        # 8个map、4个两两合并、1个截断后的最终合并
+        self.assertEqual(len(calls), 13)
+        self.assertLess(calls[-1].count("长"), 100 + 1)
+    
+    def test_map_reduce_keeps_order_and_caches(self):
+        """测试全部块按顺序参与摘要、逐层合并，且相同内容第二次命中缓存"""
+        calls = []
+        
+        def fake_completion(messages):
+            calls.append(messages[1]["content"])
+            return {"success": True, "content": f"摘要{len(messages[1]['content'])}"}
+            
+        with patch('zhipu_service.zhipu_service.chat_completion', side_effect=fake_completion), \
+             patch.multiple(system_config, SUMMARY_GROUP_CHARS=100, SUMMARY_CACHE_ENABLED=True, MAX_CONCURRENT_REQUESTS=3):
+            result = self.summarizer.summarize("a.txt")
+            self.assertTrue(result["success"])
+            self.assertFalse(result["cached"])
+            self.assertEqual(result["chunks_count"], 6)
+            self.assertEqual(result["levels"], 2)
+            
+            # 3个分组的map调用各含原文顺序的两个块，最后一次为reduce
+            self.assertEqual(len(calls), 4)
+            map_calls = sorted(calls[:3], key=lambda content: content.index("段"))
+            self.assertTrue(all("第" in content for content in map_calls))
+            self.assertIn("第1部分摘要", calls[-1])
+            self.assertLess(calls[-1].index("第1部分摘要"), calls[-1].index("第3部分摘要"))
+            
+            cached = self.summarizer.summarize("a.txt")
+            self.assertTrue(cached["cached"])
+            self.assertEqual(cached["summary"], result["summary"])
+            self.assertEqual(len(calls), 4)
+    
+    def test_failure_returns_error(self):
+        """测试大模型请求失败时返回失败结果且不写入缓存"""
+        with patch('zhipu_service.zhipu_service.chat_completion', return_value={"success": False, "error": "超时"}), \
+             patch.multiple(system_config, SUMMARY_GROUP_CHARS=100, SUMMARY_CACHE_ENABLED=True):
+            result = self.summarizer.summarize("a.txt")
+            
+        self.assertFalse(result["success"])
+        self.assertIn("超时", result["message"])
+        self.assertIsNone(self.summarizer.cache.get("abc123"))
+    
+    def test_missing_source(self):
+        """测试来源不存在时返回失败结果"""
+        self.vector_db.get_chunks.return_value = []
+        self.assertFalse(self.summarizer.summarize("missing.txt")["success"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,15 @@
 import os
 import sys
+import subprocess
 import unittest
 from unittest.mock import patch, MagicMock
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from vector_db import VectorDBManager
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+from vector_db import VectorDBManager, adaptive_cutoff
 from config import system_config
 
 class TestVectorDBManager(unittest.TestCase):
@@ -29,6 +32,9 @@ class TestVectorDBManager(unittest.TestCase):
         # 恢复原始配置
         system_config.VECTOR_DB_DIR = self.original_vector_db_dir
         
+        # ChromaDB按路径缓存客户端，删除目录前清除缓存，避免后续测试复用已失效的连接
+        SharedSystemClient.clear_system_cache()
+        
         # 删除测试目录
         import shutil
         if os.path.exists(self.test_db_dir):
@@ -44,7 +50,7 @@ class TestVectorDBManager(unittest.TestCase):
     def test_add_documents(self, mock_zhipu_service):
         """测试添加文档"""
         # 模拟嵌入向量
-        mock_zhipu_service.get_embeddings.return_value = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
+        mock_zhipu_service.embed.return_value = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
         
         # 初始化向量数据库
         self.vector_db.initialize()
@@ -65,7 +71,7 @@ class TestVectorDBManager(unittest.TestCase):
     def test_search(self, mock_zhipu_service):
         """测试搜索"""
         # 模拟嵌入向量
-        mock_zhipu_service.get_embeddings.return_value = [[0.1, 0.2, 0.3]]
+        mock_zhipu_service.embed.return_value = [[0.1, 0.2, 0.3]]
         
         # 初始化向量数据库
         self.vector_db.initialize()
@@ -80,6 +86,174 @@ class TestVectorDBManager(unittest.TestCase):
         results = self.vector_db.search("人工智能")
         
         self.assertIsInstance(results, list)
+    
+    @patch('vector_db.zhipu_service')
+    def test_namespaces_are_isolated(self, mock_zhipu_service):
+        """测试不同命名空间的写入、检索和清空互不影响"""
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3]] * len(texts)
+        self.vector_db.initialize()
+        
+        self.vector_db.add_documents([{"id": "a1", "content": "财务制度", "metadata": {"source": "a.txt"}}], namespace="team-a")
+        self.vector_db.add_documents([{"id": "b1", "content": "人事制度", "metadata": {"source": "b.txt"}},
+                                      {"id": "b2", "content": "考勤制度", "metadata": {"source": "b.txt"}}], namespace="team-b")
+        
+        self.assertEqual(self.vector_db.get_document_count("team-a"), 1)
+        self.assertEqual(self.vector_db.get_document_count("team-b"), 2)
+        self.assertEqual(self.vector_db.get_document_count(), 0)
+        
+        with patch.object(system_config, 'SIMILARITY_THRESHOLD', 0.0):
+            results = self.vector_db.search("制度", top_k=5, namespace="team-a")
+        self.assertEqual([result["metadata"]["source"] for result in results], ["a.txt"])
+        
+        self.assertTrue(self.vector_db.clear_collection("team-a")["success"])
+        self.assertEqual(self.vector_db.get_document_count("team-a"), 0)
+        self.assertEqual(self.vector_db.get_document_count("team-b"), 2)
+        self.assertIn("team-b", self.vector_db.list_namespaces())
+    
+    @patch('vector_db.zhipu_service')
+    def test_leftover_temporary_collections_are_not_namespaces(self, mock_zhipu_service):
+        """测试中断的重建或导入残留的临时集合不列为命名空间，也不能作为命名空间使用"""
+        self.vector_db.initialize()
+        self.vector_db.get_collection("team-a")
+        self.vector_db.client.create_collection(name="team-a-import-tmp")
+        
+        self.assertEqual(self.vector_db.list_namespaces(), sorted([system_config.DEFAULT_NAMESPACE, "team-a"]))
+        with self.assertRaises(ValueError):
+            self.vector_db.validate_namespace("team-a-import-tmp")
+    
+    @patch('vector_db.zhipu_service')
+    def test_search_many_embeds_in_one_batch(self, mock_zhipu_service):
+        """测试多个查询只调用一次嵌入，并分别返回带ID的结果"""
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]][:len(texts)]
+        self.vector_db.initialize()
+        self.vector_db.add_documents([
+            {"id": "doc1", "content": "年假规定", "metadata": {"source": "a.txt"}},
+            {"id": "doc2", "content": "报销流程", "metadata": {"source": "b.txt"}}
+        ])
+        mock_zhipu_service.embed.reset_mock()
+        
+        results = self.vector_db.search_many(["年假", "报销"], top_k=1)
+        
+        mock_zhipu_service.embed.assert_called_once_with(["年假", "报销"], lane="query")
+        self.assertEqual([[result["id"] for result in batch] for batch in results], [["doc1"], ["doc2"]])
+        
+        # 重复的查询命中嵌入缓存，只嵌入新查询
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[0.0, 0.0, 1.0]] * len(texts)
+        embeddings = self.vector_db._embed_queries(["报销", "新问题", "年假"])
+        mock_zhipu_service.embed.assert_called_with(["新问题"], lane="query")
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(embeddings.tolist(), [[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [1.0, 0.0, 0.0]])
+    
+    @patch('vector_db.zhipu_service')
+    def test_rebuild_index_with_new_hnsw_params(self, mock_zhipu_service):
+        """测试修改HNSW参数后重建索引：数据和ID保留，新参数生效"""
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]][:len(texts)]
+        self.vector_db.initialize()
+        self.vector_db.add_documents([
+            {"id": "doc1", "content": "年假规定", "metadata": {"source": "a.txt"}},
+            {"id": "doc2", "content": "报销流程", "metadata": {"source": "b.txt"}}
+        ])
+        self.assertFalse(self.vector_db.index_params_outdated())
+        
+        with patch.object(system_config, 'HNSW_M', 32), patch.object(system_config, 'HNSW_SEARCH_EF', 64):
+            self.assertTrue(self.vector_db.index_params_outdated())
+            result = self.vector_db.rebuild_index()
+            self.assertTrue(result["success"])
+            self.assertEqual(result["count"], 2)
+            self.assertFalse(self.vector_db.index_params_outdated())
+            
+        self.assertEqual(self.vector_db.collection.metadata["hnsw:M"], 32)
+        self.assertEqual(self.vector_db.get_document_count(), 2)
+        self.assertEqual([r["id"] for r in self.vector_db.search("年假", top_k=1)], ["doc1"])
+        self.assertGreater(self.vector_db.warm_up(), 0)
+    
+    @patch('vector_db.zhipu_service')
+    def test_failed_rename_keeps_collection(self, mock_zhipu_service):
+        """测试整体替换时新集合改名失败，原集合恢复可用；上次中断留在备份名下的集合在下次替换时恢复"""
+        from chromadb.api.models.Collection import Collection
+        
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]][:len(texts)]
+        self.vector_db.initialize()
+        self.vector_db.add_documents([
+            {"id": "doc1", "content": "年假规定", "metadata": {"source": "a.txt"}},
+            {"id": "doc2", "content": "报销流程", "metadata": {"source": "b.txt"}}
+        ])
+        original_modify = Collection.modify
+        
+        def failing_modify(collection, name=None, metadata=None):
+            if collection.name.endswith("-rebuild-tmp") and name == system_config.DEFAULT_NAMESPACE:
+                raise RuntimeError("rename failed")
+            return original_modify(collection, name=name, metadata=metadata)
+            
+        with patch.object(Collection, 'modify', autospec=True, side_effect=failing_modify):
+            self.assertFalse(self.vector_db.rebuild_index()["success"])
+        self.assertEqual(self.vector_db.get_document_count(), 2)
+        self.assertEqual([r["id"] for r in self.vector_db.search("年假", top_k=1)], ["doc1"])
+        
+        # 模拟进程在两次改名之间退出：原集合只在备份名下，原名下是访问时新建的空集合
+        backup_name = f"{system_config.DEFAULT_NAMESPACE}-rebuild-old-tmp"
+        self.vector_db.collection.modify(name=backup_name)
+        self.vector_db._collections.clear()
+        self.vector_db._invalidate()
+        self.assertEqual(self.vector_db.get_document_count(), 0)
+        self.assertEqual(self.vector_db.rebuild_index()["count"], 2)
+        self.assertEqual(self.vector_db.get_document_count(), 2)
+        self.assertEqual(self.vector_db.list_namespaces(), [system_config.DEFAULT_NAMESPACE])
+    
+    def test_adaptive_cutoff(self):
+        """测试按分数分布截断：拐点、相对最高分、绝对下限和最少保留数"""
+        params = {"min_k": 1, "max_k": 8, "floor": 0.3, "relative": 0.8, "min_gap": 0.05}
+        self.assertEqual(adaptive_cutoff([0.82, 0.80, 0.79, 0.70, 0.68], **params), {"k": 3, "reason": "gap"})
+        self.assertEqual(adaptive_cutoff([0.60, 0.58, 0.50, 0.47, 0.45], **params), {"k": 2, "reason": "gap"})
+        self.assertEqual(adaptive_cutoff([0.70, 0.68, 0.66, 0.55], **params), {"k": 3, "reason": "relative"})
+        self.assertEqual(adaptive_cutoff([0.45, 0.44, 0.29], **params), {"k": 2, "reason": "floor"})
+        self.assertEqual(adaptive_cutoff([0.25, 0.2], **params), {"k": 0, "reason": "floor"})
+        self.assertEqual(adaptive_cutoff([0.9, 0.5, 0.48], **{**params, "min_k": 2}), {"k": 2, "reason": "relative"})
+        self.assertEqual(adaptive_cutoff([0.5] * 10, **params), {"k": 8, "reason": "max_k"})
+    
+    def test_cutoff_max_k_defaults_to_top_k(self):
+        """测试未设置 CUTOFF_MAX_K 时自适应截断的候选上限与 TOP_K 相同"""
+        env = {key: value for key, value in os.environ.items() if key != "CUTOFF_MAX_K"}
+        env["TOP_K"] = "5"
+        completed = subprocess.run(
+            [sys.executable, "-c", "from config import system_config; print(system_config.CUTOFF_MAX_K)"],
+            cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')), env=env,
+            capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(completed.stdout.strip(), "5", completed.stderr)
+    
+    @patch('vector_db.zhipu_service')
+    def test_search_with_scores_adaptive(self, mock_zhipu_service):
+        """测试自适应截断返回全部候选分数，且阈值0.7下无结果的查询仍能返回最相关的块"""
+        vectors = {"年假规定": [1.0, 0.0, 0.0], "年假天数": [0.9, 0.1, 0.0], "报销流程": [0.0, 1.0, 0.0],
+                   "年假": [0.6, 0.1, 0.8]}
+        mock_zhipu_service.embed.side_effect = lambda texts, **kwargs: [vectors[text] for text in texts]
+        self.vector_db.initialize()
+        self.vector_db.add_documents([
+            {"id": f"doc{i}", "content": text, "metadata": {"source": f"{i}.txt"}}
+            for i, text in enumerate(["年假规定", "年假天数", "报销流程"])
+        ])
+        
+        self.assertEqual(self.vector_db.search("年假", similarity_threshold=0.7, cutoff="fixed"), [])
+        
+        with patch.object(system_config, 'CUTOFF_SIMILARITY_FLOOR', 0.3), patch.object(system_config, 'CUTOFF_MAX_K', 8):
+            result = self.vector_db.search_with_scores("年假", cutoff="adaptive")
+        self.assertEqual(len(result["scores"]), 3)
+        self.assertEqual(result["cutoff"]["k"], 2)
+        self.assertEqual([item["id"] for item in result["results"]], ["doc1", "doc0"])
+        self.assertEqual(result["cutoff"]["reason"], "floor")
+    
+    def test_collection_handle_lru(self):
+        """测试打开的集合句柄数不超过上限，且拒绝非法命名空间"""
+        self.vector_db.initialize()
+        
+        with patch.object(system_config, 'MAX_OPEN_COLLECTIONS', 2):
+            for name in ["ns-1", "ns-2", "ns-3"]:
+                self.vector_db.get_collection(name)
+            self.assertEqual(list(self.vector_db._collections), ["ns-2", "ns-3"])
+            
+        with self.assertRaises(ValueError):
+            self.vector_db.get_collection("../etc")
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+from typing import List, Dict, Any, Optional
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+class ExtractedTextCache:
+    """文档提取文本缓存 - 以文件内容哈希和加载器版本为键，gzip压缩存储"""
+    
+    def __init__(self, cache_dir: str = None):
+        self.config = system_config
+        self.cache_dir = cache_dir or os.path.join(self.config.CACHE_DIR, "extracted_text")
+    
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """计算文件内容的SHA-256哈希"""
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
+    def _entry_path(self, file_hash: str, loader_key: str) -> str:
+        """缓存条目路径，按哈希前两位分目录避免单目录文件过多"""
+        return os.path.join(self.cache_dir, file_hash[:2], f"{file_hash}.{loader_key}.json.gz")
+    
+    def get(self, file_hash: str, loader_key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，未命中时返回None"""
+        entry_path = self._entry_path(file_hash, loader_key)
+        if not os.path.exists(entry_path):
+            return None
+            
+        try:
+            with gzip.open(entry_path, 'rt', encoding='utf-8') as file:
+                return json.load(file)
+        except Exception as e:
+            logger.warning(f"读取文本缓存失败，将重新解析: {e}")
+            return None
+    
+    def put(self, file_hash: str, loader_key: str, file_path: str, sections: List[Dict[str, str]]) -> None:
+        """写入缓存条目"""
+        entry = {
+            "file_hash": file_hash,
+            "loader_key": loader_key,
+            "file_path": file_path,
+            "source": os.path.basename(file_path),
+            "file_type": os.path.splitext(file_path)[1].lower(),
+            "size_bytes": os.path.getsize(file_path),
+            "sections": sections,
+            "created_at": time.time()
+        }
+        
+        entry_path = self._entry_path(file_hash, loader_key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            # 原子写入，避免并发读到半个文件
+            tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as file:
+                json.dump(entry, file, ensure_ascii=False)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            logger.warning(f"写入文本缓存失败: {e}")
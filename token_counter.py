@@ -0,0 +1,85 @@
+import os
+import re
+from collections import OrderedDict
+from typing import List, Optional
+from config import system_config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# 无法加载分词器时的估算规则：每个中日韩字符约1个token，其余按单词/符号计
+_ESTIMATE_PATTERN = re.compile(r'[㐀-鿿豈-﫿]|[A-Za-z]+|\d+|[^\sA-Za-z\d]')
+
+class TokenCounter:
+    """嵌入模型token计数器 - 使用BGE分词器，带LRU缓存和批量计数"""
+    
+    def __init__(self, model_path: str = None, cache_size: int = 100000):
+        self.config = system_config
+        self.model_path = model_path or self.config.EMBEDDING_MODEL_PATH
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._tokenizer = None
+        self._backend = None
+    
+    def _load_tokenizer(self) -> None:
+        """加载分词器：优先使用tokenizers快速分词，其次transformers，均失败时使用估算"""
+        if self._backend is not None:
+            return
+            
+        tokenizer_file = os.path.join(self.model_path, "tokenizer.json")
+        try:
+            from tokenizers import Tokenizer
+            self._tokenizer = Tokenizer.from_file(tokenizer_file)
+            self._backend = "tokenizers"
+            logger.info(f"token计数使用分词器: {tokenizer_file}")
+            return
+        except Exception:
+            pass
+            
+        try:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+            self._backend = "transformers"
+            logger.info(f"token计数使用分词器(Transformers): {self.model_path}")
+            return
+        except Exception as e:
+            logger.warning(f"加载分词器失败，token数将按字符估算: {e}")
+            
+        self._backend = "estimate"
+    
+    def _encode_batch(self, texts: List[str]) -> List[int]:
+        """批量计算token数（不含[CLS]/[SEP]等特殊token）"""
+        if self._backend == "tokenizers":
+            return [len(encoding.ids) for encoding in self._tokenizer.encode_batch(texts, add_special_tokens=False)]
+        if self._backend == "transformers":
+            return [len(ids) for ids in self._tokenizer(texts, add_special_tokens=False)["input_ids"]]
+        return [len(_ESTIMATE_PATTERN.findall(text)) for text in texts]
+    
+    def count(self, text: str) -> int:
+        """计算单段文本的token数"""
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return cached
+        return self.count_batch([text])[0]
+    
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """批量计算token数，仅对未缓存的文本调用分词器"""
+        self._load_tokenizer()
+        
+        missing = list(dict.fromkeys(text for text in texts if text not in self._cache))
+        if missing:
+            for text, count in zip(missing, self._encode_batch(missing)):
+                self._cache[text] = count
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                
+        return [self._cache[text] if text in self._cache else self._encode_batch([text])[0] for text in texts]
+    
+    @property
+    def backend(self) -> Optional[str]:
+        """当前使用的计数方式"""
+        return self._backend
+
+# 全局token计数器实例
+token_counter = TokenCounter()
@@ -1,26 +1,83 @@
 import os
+import re
+import time
 import uuid
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Union, Iterable
 from config import system_config
 from zhipu_service import zhipu_service
 from logger import get_logger
 
 logger = get_logger(__name__)
 
+# ChromaDB集合名称规则：3-63个字符，字母数字开头结尾，可包含 . _ -
+_NAMESPACE_PATTERN = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]$')
+
+# 整体替换（重建、导入）时临时集合名的后缀，保留给内部使用，不能作为命名空间
+TMP_COLLECTION_SUFFIX = "-tmp"
+
+def adaptive_cutoff(scores: Union[np.ndarray, List[float]], min_k: int = None, max_k: int = None, floor: float = None,
+                    relative: float = None, min_gap: float = None) -> Dict[str, Any]:
+    """按相似度分布决定保留的结果数量（scores 需降序排列）
+
+    依次应用绝对下限、相对最高分比例和最大落差拐点，结果不少于 min_k（在下限之上时）、不多于 max_k。
+    返回 {"k": 保留数量, "reason": 截断原因}，原因为 floor / relative / gap / max_k 之一。
+    """
+    config = system_config
+    min_k = config.CUTOFF_MIN_K if min_k is None else min_k
+    max_k = config.CUTOFF_MAX_K if max_k is None else max_k
+    floor = config.CUTOFF_SIMILARITY_FLOOR if floor is None else floor
+    relative = config.CUTOFF_RELATIVE if relative is None else relative
+    min_gap = config.CUTOFF_MIN_GAP if min_gap is None else min_gap
+    
+    scores = np.asarray(scores, dtype=np.float64)[:max_k]
+    above_floor = int(np.count_nonzero(scores >= floor))
+    if above_floor == 0:
+        return {"k": 0, "reason": "floor"}
+    
+    k = int(np.count_nonzero(scores[:above_floor] >= scores[0] * relative))
+    if k < above_floor:
+        reason = "relative"
+    elif above_floor < len(scores):
+        reason = "floor"
+    else:
+        reason = "max_k"
+    
+    # 拐点：保留范围内相邻分数的最大落差，之后的结果与前面明显不是同一档
+    min_k = max(min_k, 1)
+    if k > min_k:
+        gaps = -np.diff(scores[min_k - 1:k])
+        largest = int(np.argmax(gaps))
+        if gaps[largest] >= min_gap:
+            k, reason = min_k + largest, "gap"
+    
+    return {"k": max(k, min(min_k, above_floor)), "reason": reason}
+
 class VectorDBManager:
-    """向量数据库管理器"""
+    """向量数据库管理器 - 每个命名空间（租户/知识库）对应一个独立集合"""
     
     def __init__(self):
         self.config = system_config
         self.client = None
-        self.collection = None
         self._initialized = False
+        
+        # 已打开的集合句柄（LRU）和各命名空间的文档块数量缓存
+        self._collections = OrderedDict()
+        self._count_cache = {}
+        
+        # 查询嵌入LRU缓存：查询文本 -> float32向量
+        self._query_embeddings = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
     
     def initialize(self) -> bool:
         """初始化向量数据库"""
         try:
+            # ChromaDB导入较慢，只在初始化时加载
+            import chromadb
+            from chromadb.config import Settings
+            
             # 创建数据目录
             os.makedirs(self.config.VECTOR_DB_DIR, exist_ok=True)
             
@@ -29,15 +86,18 @@ class VectorDBManager:
                 path=self.config.VECTOR_DB_DIR,
                 settings=Settings(anonymized_telemetry=False)
             )
+            self._collections.clear()
+            self._count_cache.clear()
             
-            # 获取或创建集合
-            self.collection = self.client.get_or_create_collection(
-                name="documents",
-                metadata={"hnsw:space": "cosine"}  # 使用余弦相似度
-            )
+            # 获取或创建默认命名空间的集合
+            self.get_collection()
             
             self._initialized = True
             logger.info("向量数据库初始化完成")
+            
+            # 预热索引，使首个查询的延迟与稳定状态一致
+            if self.config.INDEX_WARMUP_ENABLED:
+                self.warm_up()
             return True
             
         except Exception as e:
@@ -45,11 +105,219 @@ class VectorDBManager:
             logger.error(error_msg)
             return False
     
-    def add_documents(self, documents: List[Dict[str, Any]], metadata: Dict[str, Any] = None) -> Dict[str, Any]:
-        """添加文档到向量数据库"""
+    @staticmethod
+    def validate_namespace(namespace: str) -> str:
+        """校验命名空间名称"""
+        if ".." in namespace or not _NAMESPACE_PATTERN.match(namespace):
+            raise ValueError(
+                f"无效的命名空间名称: {namespace}（需为3-63个字母、数字或 . _ -，且以字母或数字开头结尾）"
+            )
+        if namespace.endswith(TMP_COLLECTION_SUFFIX):
+            raise ValueError(f"无效的命名空间名称: {namespace}（{TMP_COLLECTION_SUFFIX} 结尾的名称保留给临时集合）")
+        return namespace
+    
+    @staticmethod
+    def is_temporary(name: str) -> bool:
+        """是否为整体替换时使用的临时集合（中断后可能残留，不列为命名空间）"""
+        return name.endswith(TMP_COLLECTION_SUFFIX)
+    
+    def get_collection(self, namespace: Optional[str] = None):
+        """获取命名空间对应的集合，不存在时创建；最多保持 MAX_OPEN_COLLECTIONS 个句柄"""
+        name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+        
+        collection = self._collections.get(name)
+        if collection is not None:
+            self._collections.move_to_end(name)
+            return collection
+            
+        # 已有集合保持创建时的索引参数，只有新集合使用当前配置
+        try:
+            collection = self.client.get_collection(name=name)
+        except ValueError:
+            collection = self.client.get_or_create_collection(name=name, metadata=self._index_metadata())
+        self._collections[name] = collection
+        while len(self._collections) > self.config.MAX_OPEN_COLLECTIONS:
+            self._collections.popitem(last=False)
+        return collection
+    
+    def _index_metadata(self) -> Dict[str, Any]:
+        """新建集合使用的HNSW索引参数"""
+        metadata = {
+            "hnsw:space": "cosine",  # 使用余弦相似度
+            "hnsw:construction_ef": self.config.HNSW_CONSTRUCTION_EF,
+            "hnsw:search_ef": self.config.HNSW_SEARCH_EF,
+            "hnsw:M": self.config.HNSW_M
+        }
+        if self.config.HNSW_NUM_THREADS > 0:
+            metadata["hnsw:num_threads"] = self.config.HNSW_NUM_THREADS
+        return metadata
+    
+    def _stored_index_metadata(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """集合创建时记录的元数据（HNSW参数）"""
+        return self.get_collection(namespace).metadata or {}
+    
+    def index_params_outdated(self, namespace: Optional[str] = None) -> bool:
+        """集合的索引参数是否与当前配置不同（需要 rebuild_index）"""
+        current = self._stored_index_metadata(namespace)
+        # 未记录的参数按ChromaDB默认值比较
+        defaults = {"hnsw:construction_ef": 100, "hnsw:search_ef": 10, "hnsw:M": 16}
+        return any(
+            current.get(key, defaults.get(key)) != value
+            for key, value in self._index_metadata().items()
+            if key != "hnsw:num_threads"
+        )
+    
+    def warm_up(self, namespace: Optional[str] = None) -> float:
+        """用集合中已有的一个向量执行一次检索，提前加载索引段；返回耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            collection = self.get_collection(namespace)
+            sample = collection.get(limit=1, include=["embeddings"])
+            if sample["ids"]:
+                collection.query(query_embeddings=sample["embeddings"], n_results=1)
+        except Exception as e:
+            logger.warning(f"索引预热失败: {e}")
+        elapsed = time.perf_counter() - start
+        logger.info(f"索引预热完成: {namespace or self.config.DEFAULT_NAMESPACE} ({elapsed * 1000:.0f}ms)")
+        return elapsed
+    
+    def rebuild_index(self, namespace: Optional[str] = None, batch_size: int = 1000) -> Dict[str, Any]:
+        """按当前HNSW配置重建集合索引：复制已有向量到新集合后替换，无需重新计算嵌入"""
         if not self._initialized:
             return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            name = self.get_collection(namespace).name
+            copied = self._replace_collection(name, self.iter_records(batch_size, namespace=name), "rebuild")
+            message = f"索引已按新参数重建，共 {copied} 个文档块"
+            logger.info(f"{name}: {message}")
+            return {"success": True, "message": message, "count": copied}
+            
+        except Exception as e:
+            error_msg = f"重建索引失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def bulk_load(self, batches: Iterable[Dict[str, Any]], namespace: Optional[str] = None) -> Dict[str, Any]:
+        """用已计算好的向量整体替换命名空间的集合（不调用嵌入模型）
+
+        batches 中每批为 {"ids", "embeddings", "documents", "metadatas"}，embeddings 可以是float32数组。
+        数据先写入临时集合，全部写入成功后才替换原集合；中途失败时原集合保持不变。
+        """
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            name = self.validate_namespace(namespace or self.config.DEFAULT_NAMESPACE)
+            loaded = self._replace_collection(name, batches, "import")
+            return {"success": True, "message": f"成功导入 {loaded} 个文档块", "count": loaded}
+        except Exception as e:
+            error_msg = f"批量导入失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def _replace_collection(self, name: str, batches: Iterable[Dict[str, Any]], purpose: str) -> int:
+        """把各批数据写入按当前HNSW配置新建的临时集合，完成后替换同名集合；返回写入的块数"""
+        tmp_name = f"{name[:50]}-{purpose}{TMP_COLLECTION_SUFFIX}"
+        backup_name = f"{name[:46]}-{purpose}-old{TMP_COLLECTION_SUFFIX}"
+        
+        # 清理上次中断留下的临时集合；原集合还在备份名下时先恢复
+        self._restore_backup(name, backup_name)
+        try:
+            self.client.delete_collection(name=tmp_name)
+        except ValueError:
+            pass
+        new_collection = self.client.create_collection(name=tmp_name, metadata=self._index_metadata())
         
+        written = 0
+        try:
+            for batch in batches:
+                if not len(batch["ids"]):
+                    continue
+                embeddings = batch["embeddings"]
+                new_collection.add(
+                    ids=list(batch["ids"]),
+                    embeddings=embeddings.tolist() if isinstance(embeddings, np.ndarray) else embeddings,
+                    documents=list(batch["documents"]),
+                    metadatas=list(batch["metadatas"])
+                )
+                written += len(batch["ids"])
+        except BaseException:
+            self.client.delete_collection(name=tmp_name)
+            raise
+            
+        # 写入完成后再替换原集合：原集合先改名备份，新集合改名成功后才删除备份，改名失败时恢复原集合
+        try:
+            old_collection = self.client.get_collection(name=name)
+        except ValueError:
+            old_collection = None
+        if old_collection is not None:
+            old_collection.modify(name=backup_name)
+        try:
+            new_collection.modify(name=name)
+        except BaseException:
+            if old_collection is not None:
+                try:
+                    old_collection.modify(name=name)
+                except Exception as e:
+                    logger.error(f"恢复集合 {name} 失败，原数据保留在 {backup_name} 中（下次整体替换时恢复）: {e}")
+            raise
+        self._collections.pop(name, None)
+        self._invalidate(name)
+        if old_collection is not None:
+            try:
+                self.client.delete_collection(name=backup_name)
+            except Exception as e:
+                logger.warning(f"删除旧集合 {backup_name} 失败（下次整体替换时清理）: {e}")
+        return written
+    
+    def _restore_backup(self, name: str, backup_name: str) -> None:
+        """处理上次整体替换留下的备份集合：原名下已有数据时备份已过期，直接删除；否则用备份恢复原集合"""
+        try:
+            backup = self.client.get_collection(name=backup_name)
+        except ValueError:
+            return
+        try:
+            current = self.client.get_collection(name=name)
+        except ValueError:
+            current = None
+        if current is not None and current.count() > 0:
+            self.client.delete_collection(name=backup_name)
+            return
+        if current is not None:
+            self.client.delete_collection(name=name)
+        backup.modify(name=name)
+        self._collections.pop(name, None)
+        self._invalidate(name)
+        logger.warning(f"已从 {backup_name} 恢复上次整体替换中断的集合 {name}")
+    
+    @property
+    def collection(self):
+        """默认命名空间的集合"""
+        return self.get_collection()
+    
+    def list_namespaces(self) -> List[str]:
+        """列出所有命名空间"""
+        if not self._initialized:
+            return []
+            
+        try:
+            return sorted(collection.name for collection in self.client.list_collections()
+                          if not self.is_temporary(collection.name))
+        except Exception as e:
+            logger.error(f"获取命名空间列表失败: {e}")
+            return []
+    
+    def _invalidate(self, namespace: Optional[str] = None) -> None:
+        """命名空间数据变化后使其缓存失效"""
+        self._count_cache.pop(namespace or self.config.DEFAULT_NAMESPACE, None)
+    
+    def add_documents(self, documents: List[Dict[str, Any]], metadata: Dict[str, Any] = None,
+                      upsert: bool = False, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """添加文档到向量数据库，upsert为True时覆盖同ID的文档块"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
         try:
             # 准备数据
             doc_contents = [doc["content"] for doc in documents]
@@ -60,17 +328,11 @@ class VectorDBManager:
             if metadata:
                 for doc_meta in doc_metadatas:
                     doc_meta.update(metadata)
-            
+                    
             # 生成嵌入向量
-            embeddings = zhipu_service.get_embeddings(doc_contents)
-            
-            # 添加到集合
-            self.collection.add(
-                embeddings=embeddings,
-                documents=doc_contents,
-                metadatas=doc_metadatas,
-                ids=doc_ids
-            )
+            embeddings = np.asarray(zhipu_service.embed(doc_contents, lane="bulk"), dtype=np.float32)
+            self._write(doc_ids, embeddings, doc_contents, doc_metadatas, upsert, namespace)
+            self._invalidate(namespace)
             
             return {
                 "success": True,
@@ -83,96 +345,279 @@ class VectorDBManager:
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
     
-    def search(self, query: str, top_k: int = None, filter_dict: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    def _write(self, ids: List[str], embeddings: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]],
+               upsert: bool = False, namespace: Optional[str] = None) -> None:
+        """写入已计算好向量的文档块"""
+        collection = self.get_collection(namespace)
+        # 添加到集合（ChromaDB 0.4 只接受Python列表，在写入时一次性转换）
+        write = collection.upsert if upsert else collection.add
+        write(
+            embeddings=embeddings.tolist(),
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+    
+    def search(self, query: str, top_k: int = None, filter_dict: Dict[str, Any] = None,
+               namespace: Optional[str] = None, similarity_threshold: float = None,
+               cutoff: str = None) -> List[Dict[str, Any]]:
         """搜索相似文档"""
+        return self.search_with_scores(query, top_k, filter_dict, namespace, similarity_threshold, cutoff)["results"]
+    
+    def search_many(self, queries: List[str], top_k: int = None, filter_dict: Dict[str, Any] = None,
+                    namespace: Optional[str] = None, similarity_threshold: float = None,
+                    cutoff: str = None) -> List[List[Dict[str, Any]]]:
+        """多个查询一次批量嵌入、一次批量检索，按查询顺序返回各自的结果列表"""
+        return [item["results"] for item in self.search_many_with_scores(
+            queries, top_k, filter_dict, namespace, similarity_threshold, cutoff)]
+    
+    def search_with_scores(self, query: str, top_k: int = None, filter_dict: Dict[str, Any] = None,
+                           namespace: Optional[str] = None, similarity_threshold: float = None,
+                           cutoff: str = None) -> Dict[str, Any]:
+        """搜索相似文档，同时返回全部候选的相似度和截断信息"""
+        return self.search_many_with_scores([query], top_k, filter_dict, namespace, similarity_threshold, cutoff)[0]
+    
+    def search_many_with_scores(self, queries: List[str], top_k: int = None, filter_dict: Dict[str, Any] = None,
+                                namespace: Optional[str] = None, similarity_threshold: float = None,
+                                cutoff: str = None) -> List[Dict[str, Any]]:
+        """批量检索并按截断模式筛选结果
+
+        fixed 模式取 top_k（默认 TOP_K）个候选并按 similarity_threshold（默认 SIMILARITY_THRESHOLD）过滤；
+        adaptive 模式取 top_k（默认 CUTOFF_MAX_K）个候选，similarity_threshold（默认 CUTOFF_SIMILARITY_FLOOR）
+        作为绝对下限，再按分数分布截断。每个查询返回 {"results", "scores", "cutoff"}。
+        """
+        adaptive = (cutoff or self.config.RETRIEVAL_CUTOFF).lower() == "adaptive"
+        empty = {"results": [], "scores": [], "cutoff": {"k": 0, "reason": "empty"}}
         if not self._initialized:
-            return []
-        
-        if top_k is None:
-            top_k = self.config.TOP_K
-        
-        try:
-            # 生成查询嵌入
-            query_embedding = zhipu_service.get_embeddings([query])
+            return [dict(empty) for _ in queries]
             
-            # 执行搜索
-            search_kwargs = {
-                "query_embeddings": query_embedding,
-                "n_results": top_k
-            }
-            
-            # 如果提供了过滤条件，添加到搜索参数中
-            if filter_dict:
-                search_kwargs["where"] = filter_dict
+        if top_k is None:
+            top_k = self.config.CUTOFF_MAX_K if adaptive else self.config.TOP_K
+        if similarity_threshold is None:
+            similarity_threshold = self.config.CUTOFF_SIMILARITY_FLOOR if adaptive else self.config.SIMILARITY_THRESHOLD
             
-            results = self.collection.query(**search_kwargs)
+        try:
+            # 批量生成查询嵌入（命中缓存的查询不再重复嵌入）
+            query_embeddings = self._embed_queries(queries)
+            results = self._query(query_embeddings, top_k, filter_dict, namespace)
             
             # 格式化结果
-            search_results = []
-            if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
-                    results['documents'][0],
-                    results['metadatas'][0],
-                    results['distances'][0]
-                )):
-                    similarity = 1 - distance  # 转换为相似度分数
-                    
+            all_results = []
+            for q in range(len(queries)):
+                has_results = bool(results['documents'] and results['documents'][q])
+                # 距离整体转换为相似度分数，结果按距离升序，截断只需计算保留数量
+                scores = 1.0 - np.asarray(results['distances'][q] if has_results else [], dtype=np.float64)
+                if adaptive:
+                    cutoff_info = adaptive_cutoff(scores, max_k=top_k, floor=similarity_threshold)
+                else:
                     # 应用相似度阈值过滤
-                    if similarity >= self.config.SIMILARITY_THRESHOLD:
-                        search_results.append({
-                            "content": doc,
-                            "metadata": metadata,
-                            "similarity": similarity,
-                            "rank": i + 1
-                        })
-            
-            return search_results
+                    cutoff_info = {"k": int(np.count_nonzero(scores >= similarity_threshold)), "reason": "threshold"}
+                    
+                # 只为保留的结果构造字典
+                search_results = [
+                    {
+                        "id": results['ids'][q][i],
+                        "content": results['documents'][q][i],
+                        "metadata": results['metadatas'][q][i],
+                        "similarity": float(scores[i]),
+                        "rank": i + 1
+                    }
+                    for i in range(cutoff_info["k"])
+                ]
+                logger.debug(f"检索截断: {len(scores)} 个候选保留 {cutoff_info['k']} 个 ({cutoff_info['reason']})")
+                all_results.append({"results": search_results, "scores": scores, "cutoff": cutoff_info})
+                
+            return all_results
             
         except Exception as e:
             logger.error(f"搜索失败: {e}")
-            return []
+            return [dict(empty) for _ in queries]
+    
+    def _query(self, query_embeddings: np.ndarray, top_k: int, filter_dict: Dict[str, Any] = None,
+               namespace: Optional[str] = None) -> Dict[str, List[List[Any]]]:
+        """按查询向量检索，返回ChromaDB query格式的结果（ids/documents/metadatas/distances，按距离升序）"""
+        # 执行搜索（ChromaDB在一次调用内并行检索所有查询向量）
+        search_kwargs = {
+            "query_embeddings": query_embeddings.tolist(),
+            "n_results": top_k
+        }
+        
+        # 如果提供了过滤条件，添加到搜索参数中
+        if filter_dict:
+            search_kwargs["where"] = filter_dict
+            
+        return self.get_collection(namespace).query(**search_kwargs)
+    
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """查询嵌入：命中LRU缓存的直接复用，其余一次批量嵌入，返回 (查询数, 维度) 的float32数组"""
+        cache_size = self.config.QUERY_EMBEDDING_CACHE_SIZE
+        if cache_size <= 0:
+            return np.asarray(zhipu_service.embed(queries, lane="query"), dtype=np.float32)
+            
+        with self._query_embeddings_lock:
+            vectors = {query: self._query_embeddings[query] for query in queries if query in self._query_embeddings}
+            
+        # 嵌入在锁外进行，避免阻塞其他线程的缓存命中
+        missing = [query for query in dict.fromkeys(queries) if query not in vectors]
+        if missing:
+            vectors.update(zip(missing, np.asarray(zhipu_service.embed(missing, lane="query"), dtype=np.float32)))
+            
+        with self._query_embeddings_lock:
+            for query, vector in vectors.items():
+                self._query_embeddings[query] = vector
+                self._query_embeddings.move_to_end(query)
+            while len(self._query_embeddings) > cache_size:
+                self._query_embeddings.popitem(last=False)
+                
+        return np.stack([vectors[query] for query in queries])
     
-    def get_document_count(self) -> int:
-        """获取文档数量"""
+    def get_document_count(self, namespace: Optional[str] = None) -> int:
+        """获取文档块数量（按命名空间缓存，写入或清空后失效）"""
         if not self._initialized:
             return 0
-        
+            
         try:
-            return self.collection.count()
+            name = namespace or self.config.DEFAULT_NAMESPACE
+            if name not in self._count_cache:
+                self._count_cache[name] = self.get_collection(name).count()
+            return self._count_cache[name]
         except Exception as e:
             logger.error(f"获取文档数量失败: {e}")
             return 0
     
-    def get_status(self) -> Dict[str, Any]:
+    def score_chunks(self, query: str, ids: List[str], namespace: Optional[str] = None) -> Dict[str, float]:
+        """计算查询与指定文档块的余弦相似度（复用已存储的向量，不重新嵌入文档块）"""
+        stored = self.get_embeddings(ids, namespace=namespace)
+        if not stored:
+            return {}
+            
+        query_embedding = self._embed_queries([query])[0]
+        embeddings = np.stack(list(stored.values()))
+        norms = np.linalg.norm(embeddings, axis=1) * max(float(np.linalg.norm(query_embedding)), 1e-12)
+        scores = embeddings @ query_embedding / np.maximum(norms, 1e-12)
+        return dict(zip(stored, scores.astype(float).tolist()))
+    
+    def get_embeddings(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """读取指定文档块已存储的向量（float32），不存在的ID不出现在结果中"""
+        if not self._initialized or not ids:
+            return {}
+            
+        batch = self.get_collection(namespace).get(ids=list(ids), include=["embeddings"])
+        return dict(zip(batch["ids"], np.asarray(batch["embeddings"], dtype=np.float32)))
+    
+    def get_chunks_by_ids(self, ids: List[str], namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按ID读取文档块的内容和元数据"""
+        if not self._initialized or not ids:
+            return []
+            
+        batch = self.get_collection(namespace).get(ids=list(ids), include=["documents", "metadatas"])
+        return [
+            {"id": chunk_id, "content": content, "metadata": metadata}
+            for chunk_id, content, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+        ]
+    
+    def copy_chunks(self, id_map: Dict[str, str], metadata_updates: Dict[str, Dict[str, Any]] = None,
+                    namespace: Optional[str] = None) -> Dict[str, Any]:
+        """以新ID复制文档块（复用已存储的向量，不重新嵌入），metadata_updates 按新ID合并到元数据"""
+        if not self._initialized:
+            return {"success": False, "error": "向量数据库未初始化"}
+            
+        try:
+            collection = self.get_collection(namespace)
+            batch = collection.get(ids=list(id_map), include=["documents", "metadatas", "embeddings"])
+            new_ids = [id_map[chunk_id] for chunk_id in batch["ids"]]
+            metadata_updates = metadata_updates or {}
+            collection.upsert(
+                ids=new_ids,
+                embeddings=batch["embeddings"],
+                documents=batch["documents"],
+                metadatas=[{**metadata, **metadata_updates.get(new_id, {})}
+                           for new_id, metadata in zip(new_ids, batch["metadatas"])]
+            )
+            self._invalidate(namespace)
+            return {"success": True, "count": len(new_ids)}
+        except Exception as e:
+            error_msg = f"复制文档块失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+    
+    def get_chunks(self, source: str, namespace: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按原文顺序获取某个来源的全部文档块"""
+        if not self._initialized:
+            return []
+            
+        batch = self.get_collection(namespace).get(where={"source": source}, include=["documents", "metadatas"])
+        chunks = [
+            {"id": chunk_id, "content": content, "metadata": metadata}
+            for chunk_id, content, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+        ]
+        return sorted(chunks, key=lambda chunk: chunk["metadata"].get("chunk_index", 0))
+    
+    def iter_records(self, batch_size: int = 1000, namespace: Optional[str] = None):
+        """分页遍历集合，每批返回 {"ids", "embeddings", "documents", "metadatas"}"""
+        if not self._initialized:
+            return
+            
+        collection = self.get_collection(namespace)
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            yield batch
+            offset += len(batch["ids"])
+    
+    def iter_chunks(self, batch_size: int = 1000, namespace: Optional[str] = None):
+        """分页遍历集合中所有文档块的 (ID, 元数据)"""
+        if not self._initialized:
+            return
+            
+        collection = self.get_collection(namespace)
+        offset = 0
+        while True:
+            batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            yield from zip(batch["ids"], batch["metadatas"])
+            offset += len(batch["ids"])
+    
+    def get_status(self, namespace: Optional[str] = None) -> Dict[str, Any]:
         """获取向量数据库状态"""
         if not self._initialized:
             return {"initialized": False}
-        
+            
         try:
+            collection = self.get_collection(namespace)
             return {
                 "initialized": True,
-                "document_count": self.get_document_count(),
-                "collection_name": self.collection.name,
-                "embedding_model": self.config.EMBEDDING_MODEL_NAME
+                "document_count": self.get_document_count(namespace),
+                "collection_name": collection.name,
+                "namespace": namespace or self.config.DEFAULT_NAMESPACE,
+                "embedding_model": self.config.EMBEDDING_MODEL_NAME,
+                "index_params": {
+                    key: value for key, value in (collection.metadata or {}).items() if key.startswith("hnsw:")
+                },
+                "index_params_outdated": self.index_params_outdated(namespace)
             }
         except Exception as e:
             logger.error(f"获取状态失败: {e}")
             return {"initialized": False, "error": str(e)}
     
-    def clear_collection(self) -> Dict[str, Any]:
-        """清空集合"""
+    def clear_collection(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """清空集合（只影响指定命名空间）"""
         if not self._initialized:
             return {"success": False, "error": "向量数据库未初始化"}
-        
+            
         try:
+            name = self.get_collection(namespace).name
+            
             # 删除集合
-            self.client.delete_collection(name=self.collection.name)
+            self.client.delete_collection(name=name)
+            self._collections.pop(name, None)
+            self._invalidate(name)
             
             # 重新创建集合
-            self.collection = self.client.get_or_create_collection(
-                name="documents",
-                metadata={"hnsw:space": "cosine"}
-            )
+            self.get_collection(name)
             
             return {
                 "success": True,
@@ -184,13 +629,14 @@ class VectorDBManager:
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
     
-    def delete_documents(self, ids: List[str]) -> Dict[str, Any]:
+    def delete_documents(self, ids: List[str], namespace: Optional[str] = None) -> Dict[str, Any]:
         """删除指定ID的文档"""
         if not self._initialized:
             return {"success": False, "error": "向量数据库未初始化"}
-        
+            
         try:
-            self.collection.delete(ids=ids)
+            self.get_collection(namespace).delete(ids=ids)
+            self._invalidate(namespace)
             return {
                 "success": True,
                 "message": f"成功删除 {len(ids)} 个文档"
@@ -198,4 +644,4 @@ class VectorDBManager:
         except Exception as e:
             error_msg = f"删除文档失败: {str(e)}"
             logger.error(error_msg)
-            return {"success": False, "error": error_msg}
\ No newline at end of file
+            return {"success": False, "error": error_msg}
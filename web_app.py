@@ -1,6 +1,8 @@
 import streamlit as st
 import os
+import shutil
 import tempfile
+from collections import OrderedDict
 from rag_system import rag_system
 from config import system_config
 
@@ -71,10 +73,83 @@ if not st.session_state.system_initialized:
 if st.session_state.system_initialized:
     rag_system = st.session_state.rag_system
 
+# 每个会话记忆的问答结果数量
+QUERY_MEMO_SIZE = 50
+
+def get_status_snapshot(namespace: str, force: bool = False) -> dict:
+    """系统状态和文档列表快照：只在该命名空间的文档发生变更（入库、删除、清空）后重新读取"""
+    snapshots = st.session_state.setdefault("status_snapshots", {})
+    revision = rag_system.get_revision(namespace)
+    snapshot = snapshots.get(namespace)
+    if force or snapshot is None or snapshot["revision"] != revision:
+        snapshot = {
+            "revision": revision,
+            "status": rag_system.get_system_status(namespace),
+            "documents": rag_system.get_document_sources(namespace)
+        }
+        snapshots[namespace] = snapshot
+    return snapshot
+
+def get_namespaces(force: bool = False) -> list:
+    """命名空间列表（按会话缓存，新建或手动刷新时重新读取）"""
+    if force or "namespaces" not in st.session_state:
+        st.session_state.namespaces = rag_system.list_namespaces()
+    return list(st.session_state.namespaces)
+
+def answer_question(question: str, namespace: str) -> dict:
+    """问答结果按会话记忆：同一命名空间的同一问题在文档未变更时直接复用，页面交互不会重复检索和调用大模型"""
+    memo = st.session_state.setdefault("query_memo", OrderedDict())
+    key = (namespace, question.strip())
+    revision = rag_system.get_revision(namespace)
+    entry = memo.get(key)
+    if entry is not None and entry["revision"] == revision:
+        memo.move_to_end(key)
+        return entry["answer"]
+    
+    answer_data = rag_system.query(question, namespace=namespace)
+    if answer_data.get("success"):
+        memo[key] = {"revision": revision, "answer": answer_data}
+        while len(memo) > QUERY_MEMO_SIZE:
+            memo.popitem(last=False)
+    return answer_data
+
+def answer_in_conversation(question: str, namespace: str) -> dict:
+    """多轮对话提问：每个命名空间一个会话；页面重绘时同一问题不会被当作新的一轮"""
+    conversations = st.session_state.setdefault("conversations", {})
+    conversation = conversations.get(namespace)
+    if conversation is None:
+        conversation = conversations[namespace] = rag_system.create_conversation(namespace)
+    if conversation.turns and conversation.turns[-1]["question"] == question and conversation.last_result:
+        return conversation.last_result
+    return rag_system.query(question, conversation=conversation)
+
 # 侧边栏
 with st.sidebar:
     st.markdown('<div class="main-header">🤖 RAG助手</div>', unsafe_allow_html=True)
     
+    # 命名空间选择（每个命名空间是独立的知识库）
+    st.markdown("### 🗂️ 命名空间")
+    if "namespace" not in st.session_state:
+        st.session_state.namespace = system_config.DEFAULT_NAMESPACE
+    namespaces = get_namespaces()
+    if st.session_state.namespace not in namespaces:
+        namespaces.append(st.session_state.namespace)
+    st.session_state.namespace = st.selectbox(
+        "当前命名空间",
+        namespaces,
+        index=namespaces.index(st.session_state.namespace)
+    )
+    new_namespace = st.text_input("新建命名空间", placeholder="例如：hr-policies")
+    if st.button("创建并切换") and new_namespace:
+        try:
+            rag_system.get_catalog(new_namespace)
+            st.session_state.namespace = new_namespace
+            get_namespaces(force=True)
+            st.rerun()
+        except ValueError as e:
+            st.error(str(e))
+    namespace = st.session_state.namespace
+    
     # 文档上传区域
     st.markdown("### 📄 文档管理")
     uploaded_file = st.file_uploader(
@@ -84,59 +159,76 @@ with st.sidebar:
     )
     
     if uploaded_file is not None:
-        # 保存上传的文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
-        
         st.info(f"文件 '{uploaded_file.name}' 已上传，请点击下方按钮确认添加到系统")
+        if rag_system.get_catalog(namespace).get_document(os.path.basename(uploaded_file.name)):
+            st.warning("当前命名空间已有同名文档，确认后将替换为新上传的版本")
         
         # 添加确认按钮
         if st.button(f"确认添加文档: {uploaded_file.name}", type="primary"):
             # 处理文档
             with st.spinner("正在处理文档..."):
-                result = rag_system.add_document(tmp_file_path)
-                
-                if result["success"]:
-                    st.success(result["message"])
-                    # 刷新系统状态
-                    st.rerun()
-                else:
-                    st.error(result["error"])
-            
-            # 清理临时文件
-            os.unlink(tmp_file_path)
+                # 只在确认时保存上传的文件（每次页面重跑都会执行上面的代码）
+                # 保留原文件名，文档来源按文件名登记，重复上传同名文件会替换旧版本
+                tmp_dir = tempfile.mkdtemp()
+                try:
+                    tmp_file_path = os.path.join(tmp_dir, os.path.basename(uploaded_file.name))
+                    with open(tmp_file_path, 'wb') as tmp_file:
+                        tmp_file.write(uploaded_file.getvalue())
+                    result = rag_system.replace_document(tmp_file_path, namespace=namespace)
+                finally:
+                    # 清理临时文件（st.rerun 会中断后续代码，必须在刷新前清理）
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    
+            if result["success"]:
+                st.success(result["message"])
+                # 刷新系统状态
+                st.rerun()
+            else:
+                st.error(result["error"])
     
     # 系统状态
     st.markdown("---")
     st.markdown("### ℹ️ 系统状态")
     if st.button("刷新系统状态"):
-        system_status = rag_system.get_system_status()
-        st.json(system_status)
+        get_namespaces(force=True)
+        st.json(get_status_snapshot(namespace, force=True)["status"])
     
     # 显示文档列表
-    system_status = rag_system.get_system_status()
+    snapshot = get_status_snapshot(namespace)
+    system_status = snapshot["status"]
     if system_status.get("document_count", 0) > 0:
         st.markdown(f"**已添加文档数量**: {system_status.get('document_count', 0)}")
+        st.markdown(f"**文档块数量**: {system_status.get('chunk_count', 0)}")
         
-        # 获取文档来源
-        try:
-            # 尝试获取向量数据库中的文档信息
-            vector_db_status = system_status.get("vector_db", {})
-            if vector_db_status.get("collection_exists", False):
-                st.success("✅ 向量数据库中有文档")
-            else:
-                st.warning("⚠️ 向量数据库中无文档")
-        except Exception as e:
-            st.error(f"获取文档信息失败: {e}")
+        # 文档列表
+        with st.expander("📚 文档列表"):
+            documents = snapshot["documents"]
+            for doc in documents:
+                st.markdown(f"- **{doc['source']}** ({doc['chunk_count']} 块, {doc['size_bytes'] / 1024:.1f} KB)")
+            
+            selected_source = st.selectbox("选择文档", [doc["source"] for doc in documents])
+            if st.button("生成所选文档摘要") and selected_source:
+                with st.spinner("正在生成摘要..."):
+                    result = rag_system.summarize_document(selected_source, namespace=namespace)
+                if result["success"]:
+                    st.markdown(result["summary"])
+                else:
+                    st.error(result["message"])
+            if st.button("删除所选文档") and selected_source:
+                result = rag_system.delete_document(selected_source, namespace=namespace)
+                if result["success"]:
+                    st.success(result["message"])
+                    st.rerun()
+                else:
+                    st.error(result["error"])
     else:
         st.warning("⚠️ 系统中暂无文档，请上传文档后点击确认添加")
     
     # 清空文档
     st.markdown("---")
-    if st.button("清空所有文档", type="secondary"):
+    if st.button("清空当前命名空间的文档", type="secondary"):
         if st.session_state.get('confirm_clear', False):
-            result = rag_system.clear_documents()
+            result = rag_system.clear_documents(namespace)
             if result["success"]:
                 st.success("所有文档已清空")
             else:
@@ -144,7 +236,7 @@ with st.sidebar:
             st.session_state.confirm_clear = False
         else:
             st.session_state.confirm_clear = True
-            st.warning("再次点击确认清空所有文档")
+            st.warning(f"再次点击确认清空命名空间 {namespace} 中的所有文档")
 
 # 主界面
 st.markdown('<div class="main-header">基于智普大模型的RAG智能文档问答助手</div>', unsafe_allow_html=True)
@@ -153,7 +245,7 @@ st.markdown('<div class="sub-header">基于检索增强生成技术的智能问
 # 只有在系统初始化后才显示系统概览
 if st.session_state.get("system_initialized", False):
     # 获取系统状态
-    system_status = rag_system.get_system_status()
+    system_status = get_status_snapshot(st.session_state.namespace)["status"]
 
     # 显示系统概览
     col1, col2, col3 = st.columns(3)
@@ -179,9 +271,23 @@ st.markdown("## 💬 智能问答")
 
 # 只有在系统初始化且有文档时才允许提问
 if st.session_state.get("system_initialized", False):
-    system_status = rag_system.get_system_status()
+    system_status = get_status_snapshot(st.session_state.namespace)["status"]
     
     if system_status.get("document_count", 0) > 0:
+        conversation_mode = st.checkbox("多轮对话（可追问，较早的对话会被压缩为摘要）", key="conversation_mode")
+        if conversation_mode:
+            conversation = st.session_state.get("conversations", {}).get(st.session_state.namespace)
+            if conversation and conversation.turn_count:
+                with st.expander(f"🗨️ 对话历史（共 {conversation.turn_count} 轮）"):
+                    if conversation.summary:
+                        st.markdown(f"**较早对话的摘要:** {conversation.summary}")
+                    for turn in conversation.turns:
+                        st.markdown(f"**🙋 {turn['question']}**")
+                        st.write(turn["answer"])
+                if st.button("结束当前对话"):
+                    conversation.reset()
+                    st.rerun()
+                    
         question = st.text_input(
             "请输入您的问题:",
             placeholder="例如：这个文档的主要内容是什么？",
@@ -190,7 +296,10 @@ if st.session_state.get("system_initialized", False):
 
         if question:
             with st.spinner("正在思考..."):
-                answer_data = rag_system.query(question)
+                if conversation_mode:
+                    answer_data = answer_in_conversation(question, st.session_state.namespace)
+                else:
+                    answer_data = answer_question(question, st.session_state.namespace)
             
             # 显示答案
             st.markdown("### 💡 答案")
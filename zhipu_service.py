@@ -1,9 +1,12 @@
 import os
-import requests
 import json
 import time
+import threading
+import numpy as np
 from typing import List, Dict, Any, Optional
 from config import system_config
+from embedding_pool import embedding_pool
+from llm_cache import llm_cache, MODE_REPLAY
 from logger import get_logger
 
 logger = get_logger(__name__)
@@ -13,19 +16,43 @@ class ZhipuAIService:
     
     def __init__(self):
         self.config = system_config
-        self.session = requests.Session()
-        self.session.headers.update({
-            "Authorization": f"Bearer {self.config.ZHIPU_API_KEY}",
-            "Content-Type": "application/json"
-        })
+        self._session = None
         
-        # 初始化本地BGE模型
+        # 本地BGE模型在首次计算嵌入时加载（启用嵌入进程池时由子进程加载），导入本模块不加载torch
         self.tokenizer = None
         self.model = None
-        self._init_local_model()
+        self.sentence_model = None
+        self.onnx_embedder = None
+        self._model_lock = threading.Lock()
     
-    def _init_local_model(self):
-        """初始化本地BGE模型"""
+    @property
+    def session(self):
+        """HTTP会话（首次调用智普AI接口时创建）"""
+        if self._session is None:
+            import requests
+            
+            session = requests.Session()
+            session.headers.update({
+                "Authorization": f"Bearer {self.config.ZHIPU_API_KEY}",
+                "Content-Type": "application/json"
+            })
+            self._session = session
+        return self._session
+    
+    def _ensure_local_model(self) -> bool:
+        """本地嵌入模型未加载时加载（多个线程同时首次嵌入时只加载一次）"""
+        with self._model_lock:
+            if self.onnx_embedder is None and self.sentence_model is None and self.model is None:
+                self._init_local_model()
+            return self.onnx_embedder is not None or self.sentence_model is not None or self.model is not None
+    
+    def _init_local_model(self, backend: Optional[str] = None):
+        """初始化本地BGE模型；backend 为 onnx 时优先使用通过一致性校验的ONNX模型"""
+        backend = (backend or self.config.EMBEDDING_BACKEND).lower()
+        self.onnx_embedder = None
+        if backend == "onnx" and self._init_onnx_model():
+            return
+            
         try:
             # 首先尝试使用SentenceTransformers
             try:
@@ -52,19 +79,59 @@ class ZhipuAIService:
             self.model = None
             self.sentence_model = None
     
+    def _init_onnx_model(self) -> bool:
+        """加载ONNX Runtime后端，模型缺失或一致性校验未通过时返回False（回退到PyTorch）"""
+        try:
+            from onnx_embedder import OnnxEmbedder, model_file, parity_passed
+            
+            path = model_file()
+            if not os.path.exists(path):
+                logger.warning(f"ONNX模型不存在: {path}，请先执行 python onnx_embedder.py export；回退到PyTorch")
+                return False
+            passed = parity_passed()
+            if passed is False:
+                logger.warning("ONNX模型未通过与PyTorch嵌入的一致性校验，回退到PyTorch")
+                return False
+            if passed is None:
+                logger.warning("ONNX模型尚未做一致性校验（python onnx_embedder.py check）")
+                
+            embedder = OnnxEmbedder(model_path=path)
+            embedder.load()
+            self.onnx_embedder = embedder
+            return True
+        except Exception as e:
+            logger.error(f"加载ONNX嵌入模型失败，回退到PyTorch: {e}")
+            return False
+    
     def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
-        """聊天补全接口"""
+        """聊天补全接口；按 LLM_CACHE_MODE 查询和记录响应缓存，命中时结果含 cached=True"""
+        import requests
+        
         url = f"{self.config.ZHIPU_BASE_URL}/chat/completions"
         
         payload = {
             "model": kwargs.get("model", self.config.LLM_MODEL),
             "messages": messages,
-            "temperature": kwargs.get("temperature", 0.7),
+            "temperature": kwargs.get("temperature", self.config.LLM_TEMPERATURE),
             "max_tokens": kwargs.get("max_tokens", 2000),
             "top_p": kwargs.get("top_p", 0.9),
             "stream": False
         }
         
+        cache_key = None
+        if llm_cache.should_read(payload):
+            cache_key = llm_cache.make_key(payload)
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return {"success": True, **cached, "cached": True}
+            if llm_cache.mode == MODE_REPLAY:
+                logger.error("回放模式下大模型响应缓存未命中")
+                return {
+                    "success": False,
+                    "error": "回放模式下缓存未命中",
+                    "content": "抱歉，AI服务暂时不可用"
+                }
+                
         try:
             response = self.session.post(
                 url, 
@@ -74,12 +141,15 @@ class ZhipuAIService:
             response.raise_for_status()
             
             result = response.json()
-            return {
+            completion = {
                 "success": True,
                 "content": result["choices"][0]["message"]["content"],
                 "usage": result.get("usage", {}),
                 "model": result["model"]
             }
+            if llm_cache.should_write(payload):
+                llm_cache.put(cache_key or llm_cache.make_key(payload), payload, completion)
+            return completion
             
         except requests.exceptions.RequestException as e:
             logger.error(f"智普AI请求失败: {e}")
@@ -90,17 +160,39 @@ class ZhipuAIService:
             }
     
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """获取文本嵌入向量 - 使用本地BGE模型"""
+        """获取文本嵌入向量（Python列表形式，兼容旧接口；内部请使用 embed）"""
+        return self.embed(texts).tolist()
+    
+    def has_local_model(self) -> bool:
+        """本地嵌入模型是否可用（未加载时尝试加载）"""
+        return self._ensure_local_model()
+    
+    def embed(self, texts: List[str], lane: Optional[str] = None) -> np.ndarray:
+        """获取文本嵌入向量 - 使用本地BGE模型，返回形状为 (文本数, 维度) 的连续float32数组
+
+        lane 为 "query" 或 "bulk" 且启用了嵌入进程池时，交给对应通道的子进程计算。
+        """
+        if lane is not None and embedding_pool.enabled:
+            try:
+                return embedding_pool.embed(texts, lane)
+            except Exception as e:
+                logger.error(f"嵌入进程池计算失败，改为在本进程计算: {e}")
+                
         # 如果本地模型未初始化，尝试初始化
-        if not hasattr(self, 'sentence_model') or self.sentence_model is None:
-            if self.tokenizer is None or self.model is None:
-                self._init_local_model()
-        
+        self._ensure_local_model()
+                
+        # 启用ONNX后端时优先使用
+        if self.onnx_embedder is not None:
+            try:
+                return self.onnx_embedder.embed(texts)
+            except Exception as e:
+                logger.error(f"ONNX嵌入向量获取失败: {e}")
+                
         # 优先使用SentenceTransformers
         if hasattr(self, 'sentence_model') and self.sentence_model is not None:
             try:
-                embeddings = self.sentence_model.encode(texts, normalize_embeddings=True)
-                return embeddings.tolist()
+                embeddings = self.sentence_model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+                return np.ascontiguousarray(embeddings, dtype=np.float32)
             except Exception as e:
                 logger.error(f"SentenceTransformers嵌入向量获取失败: {e}")
         
@@ -111,7 +203,7 @@ class ZhipuAIService:
                 import torch.nn.functional as F
                 
                 # 编码文本
-                encoded_input = self.tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors='pt')
+                encoded_input = self.tokenizer(texts, padding=True, truncation=True, max_length=self.config.EMBEDDING_MAX_TOKENS, return_tensors='pt')
                 
                 # 生成嵌入向量
                 with torch.no_grad():
@@ -134,15 +226,15 @@ class ZhipuAIService:
                     # BGE模型推荐的归一化方式
                     sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
                     embeddings = sentence_embeddings.cpu().numpy()
-                
-                return embeddings.tolist()
+                    
+                return np.ascontiguousarray(embeddings, dtype=np.float32)
                 
             except Exception as e:
                 logger.error(f"Transformers嵌入向量获取失败: {e}")
         
         # 如果本地模型都失败，使用智普AI API
         logger.warning("本地BGE模型不可用，使用智普AI API")
-        return self._get_zhipu_embeddings(texts)
+        return np.asarray(self._get_zhipu_embeddings(texts), dtype=np.float32)
     
     def _get_zhipu_embeddings(self, texts: List[str]) -> List[List[float]]:
         """获取智普AI嵌入向量（备用方案）"""